@@ -0,0 +1,244 @@
+"""Transport adapters for the requests session of gazu.
+
+The qtazu adapters compose: the limiting and recording adapters wrap the
+adapter that was mounted before them and pass the requests on to it, so
+installing one keeps the others, e.g. a timeout or a replayed archive.
+
+"""
+import time
+import logging
+
+import requests.adapters
+import requests.exceptions
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    # Python 2
+    from urlparse import urlparse
+
+log = logging.getLogger(__name__)
+
+# The url prefixes the requests session mounts adapters for
+PREFIXES = ("http://", "https://")
+
+
+class TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTP adapter that applies a default timeout to all requests"""
+
+    def __init__(self, timeout=None, *args, **kwargs):
+        self.timeout = timeout
+        super(TimeoutHTTPAdapter, self).__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super(TimeoutHTTPAdapter, self).send(request, **kwargs)
+
+
+class WrappingAdapter(requests.adapters.BaseAdapter):
+    """Base of the adapters that pass requests on to a wrapped adapter
+
+    Args:
+        adapter (requests.adapters.BaseAdapter, optional): The adapter to
+            send the requests with, defaults to a `TimeoutHTTPAdapter`.
+
+    """
+
+    def __init__(self, adapter=None):
+        super(WrappingAdapter, self).__init__()
+        if adapter is None:
+            adapter = TimeoutHTTPAdapter()
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        return self.adapter.send(request, **kwargs)
+
+    def close(self):
+        self.adapter.close()
+
+
+def get_innermost(adapter):
+    """Return the adapter that actually sends the requests of *adapter*"""
+    while isinstance(adapter, WrappingAdapter):
+        adapter = adapter.adapter
+    return adapter
+
+
+def find_adapter(adapter, cls):
+    """Return the first adapter of type *cls* *adapter* sends through"""
+    while adapter is not None:
+        if isinstance(adapter, cls):
+            return adapter
+        adapter = getattr(adapter, "adapter", None)
+    return None
+
+
+def replace_adapter(session, prefix, old, new):
+    """Replace *old* by *new* in the adapters mounted for *prefix*
+
+    Returns:
+        bool: Whether *old* was found.
+
+    """
+    current = session.get_adapter(prefix)
+    if current is old:
+        session.mount(prefix, new)
+        return True
+
+    while isinstance(current, WrappingAdapter):
+        if current.adapter is old:
+            current.adapter = new
+            return True
+        current = current.adapter
+    return False
+
+
+class LimitedHTTPAdapter(WrappingAdapter):
+    """HTTP adapter that limits requests from background threads.
+
+    Requests from the GUI thread are sent directly so the interface never
+    waits on the limiter. Idempotent requests are retried with jittered
+    backoff on connection errors and overloaded responses.
+
+    See `qtazu.limiter.install`.
+
+    Args:
+        limiter (qtazu.limiter.AdaptiveLimiter): The limiter to apply.
+        retries (int): Times to retry idempotent requests.
+        adapter (requests.adapters.BaseAdapter, optional): The adapter to
+            send the requests with.
+
+    """
+
+    idempotent = frozenset(["GET", "HEAD", "OPTIONS"])
+
+    def __init__(self, limiter, retries=3, adapter=None):
+        super(LimitedHTTPAdapter, self).__init__(adapter)
+        self.limiter = limiter
+        self.retries = retries
+
+    def send(self, request, **kwargs):
+        from .limiter import in_gui_thread, RETRY
+
+        if in_gui_thread():
+            return super(LimitedHTTPAdapter, self).send(request, **kwargs)
+
+        host = urlparse(request.url).netloc
+        retries = self.retries if request.method in self.idempotent else 0
+
+        attempt = 0
+        while True:
+            self.limiter.acquire(host)
+            start = time.time()
+            response = None
+            try:
+                response = super(LimitedHTTPAdapter, self).send(request,
+                                                                **kwargs)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout):
+                if attempt >= retries:
+                    raise
+                delay = self.limiter.get_retry_delay(attempt)
+                log.debug("Retrying %s in %.2f seconds", request.url, delay)
+            finally:
+                # Always free the slot, only a response tells the status
+                if response is None:
+                    self.limiter.release(host, latency=time.time() - start)
+                else:
+                    self.limiter.release(
+                        host,
+                        latency=time.time() - start,
+                        status=response.status_code,
+                        retry_after=_get_retry_after(response)
+                    )
+
+            if response is not None:
+                if response.status_code not in RETRY or attempt >= retries:
+                    return response
+
+                response.close()
+                delay = self.limiter.get_retry_delay(
+                    attempt, _get_retry_after(response)
+                )
+                log.debug("Retrying %s after status %s in %.2f seconds",
+                          request.url, response.status_code, delay)
+
+            time.sleep(delay)
+            attempt += 1
+
+
+def _get_retry_after(response):
+    """Return the seconds of the Retry-After header, if any"""
+    value = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        # Missing or a HTTP date, which Zou does not send
+        return None
+
+
+class RecordingHTTPAdapter(WrappingAdapter):
+    """HTTP adapter that records all requests and responses to an archive.
+
+    See `qtazu.recording.record`.
+
+    Args:
+        archive (qtazu.recording.Archive): The archive to record to.
+        adapter (requests.adapters.BaseAdapter, optional): The adapter to
+            send the requests with.
+
+    """
+
+    def __init__(self, archive, adapter=None):
+        super(RecordingHTTPAdapter, self).__init__(adapter)
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        start = time.time()
+        response = super(RecordingHTTPAdapter, self).send(request, **kwargs)
+
+        # Read the (streamed) content so it can be recorded, it is
+        # still available to the caller afterwards
+        content = response.content
+        self.archive.add(request, response, content, time.time() - start)
+        return response
+
+
+class ReplayHTTPAdapter(requests.adapters.BaseAdapter):
+    """HTTP adapter that serves the responses of an archive.
+
+    Identical requests are answered in the order they were recorded, when
+    they are all served the last one is repeated. Requests that were not
+    recorded fail with a `ConnectionError` like an unreachable server.
+
+    See `qtazu.recording.replay`.
+
+    Args:
+        archive (qtazu.recording.Archive): The recorded archive.
+        latency (float): Factor of the recorded latency to wait before
+            responding, 1.0 for the original and 0.0 for no latency.
+
+    """
+
+    def __init__(self, archive, latency=1.0):
+        super(ReplayHTTPAdapter, self).__init__()
+        self.archive = archive
+        self.latency = latency
+
+    def send(self, request, **kwargs):
+        entry = self.archive.get(request)
+        if entry is None:
+            raise requests.exceptions.ConnectionError(
+                "No recorded response for %s %s" % (request.method,
+                                                    request.url),
+                request=request
+            )
+
+        if self.latency:
+            time.sleep(entry["latency"] * self.latency)
+
+        return self.archive.build_response(request, entry)
+
+    def close(self):
+        pass
@@ -0,0 +1,104 @@
+"""Submit the same comment to many tasks at once."""
+import time
+import logging
+import threading
+
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+from .lazy import lazy_import
+
+gazu = lazy_import("gazu")
+
+log = logging.getLogger(__name__)
+
+
+def submit_comments(tasks, task_status, comment="", attachment=None,
+                    max_workers=8, callback=None):
+    """Submit one comment and status change to multiple tasks concurrently.
+
+    The comments (and their previews) are submitted by at most
+    `max_workers` threads at the same time. The same preview file is
+    uploaded for each of the comments. This blocks until all tasks are
+    done, so run it in a `Worker` from within a user interface.
+
+    Args:
+        tasks (list): The task dicts or task IDs.
+        task_status (str or dict): The task status dict or ID.
+        comment (str): Comment text.
+        attachment (str, optional): Path to upload as preview for
+            every comment.
+        max_workers (int): Maximum amount of concurrent submissions.
+        callback (callable, optional): Called with each result as soon
+            as its task is done. Note that it's called from the
+            submitting thread.
+
+    Returns:
+        list: For each task in order a dict with the "task", the created
+            "comment" and "preview" and the "error" if it failed.
+
+    Raises:
+        ValueError: When `max_workers` is less than 1.
+
+    """
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1: %r" % max_workers)
+
+    todo = queue.Queue()
+    for index, task in enumerate(tasks):
+        todo.put((index, task))
+
+    results = [None] * len(tasks)
+
+    def _work():
+        while True:
+            try:
+                index, task = todo.get_nowait()
+            except queue.Empty:
+                return
+
+            result = {
+                "task": task,
+                "comment": None,
+                "preview": None,
+                "error": None
+            }
+            try:
+                result["comment"] = gazu.task.add_comment(task,
+                                                          task_status,
+                                                          comment=comment)
+                if attachment:
+                    result["preview"] = gazu.task.add_preview(
+                        task,
+                        result["comment"],
+                        attachment
+                    )
+            except Exception as exc:
+                log.error("Failed to submit comment to task %s: %s",
+                          task, exc)
+                result["error"] = exc
+
+            results[index] = result
+            if callback is not None:
+                try:
+                    callback(result)
+                except Exception:
+                    log.exception("Batch comment callback failed")
+
+    start = time.time()
+    threads = [threading.Thread(target=_work)
+               for _ in range(min(max_workers, len(tasks)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    failed = sum(1 for result in results
+                 if result is None or result["error"])
+    log.info("Submitted comment to %d tasks (%d failed) in %.2f seconds",
+             len(tasks), failed, time.time() - start)
+
+    return results
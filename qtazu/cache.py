@@ -0,0 +1,205 @@
+"""Caches of CG-Wire data shared by the qtazu widgets and models.
+
+All caches are safe to use from `Worker` threads.
+
+"""
+import time
+import weakref
+import threading
+
+from Qt import QtCore
+
+from . import singleflight
+
+
+class Cache(object):
+    """Thread-safe key value cache with optional time-to-live.
+
+    Supports the basic dict operations so it can be used in place of a
+    dictionary, e.g. `key in cache`, `cache[key]` and `cache[key] = value`.
+
+    Args:
+        ttl (float, optional): Seconds after which values expire.
+
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._data = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+
+            value, timestamp = self._data[key]
+            if self.ttl is not None and time.time() - timestamp > self.ttl:
+                del self._data[key]
+                return default
+
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time())
+
+    def pop(self, key, default=None):
+        with self._lock:
+            value = self._data.pop(key, None)
+        return default if value is None else value[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def get_or_fetch(self, key, fetch, *args, **kwargs):
+        """Return cached value for *key* or the result of `fetch()`.
+
+        The fetched result is stored in the cache. Concurrent calls for the
+        same key share a single fetch, see `qtazu.singleflight`.
+
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+
+            def _fetch():
+                result = fetch(*args, **kwargs)
+                self.set(key, result)
+                return result
+
+            value = singleflight.do(("cache", id(self), key), _fetch)
+        return value
+
+    def __contains__(self, key):
+        sentinel = object()
+        return self.get(key, sentinel) is not sentinel
+
+    def __getitem__(self, key):
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+# Entity data (e.g. from `qtazu.utils.get_cgwire_data`) by (type, id)
+entities = Cache(ttl=300)
+
+# Downloaded image bytes (QByteArray) by relative picture url
+images = Cache()
+
+# Lists of reference data that rarely changes by name, e.g. "persons",
+# "task_statuses" and "task_types", see `qtazu.warmup`
+references = Cache()
+
+
+class _Notifier(QtCore.QObject):
+    """Signals changes of the cached data to the live models"""
+
+    # Name of the references, the changed records and the removed ids
+    references_changed = QtCore.Signal(str, list, list)
+
+    # Type of the entities, the changed records and the removed ids
+    entities_changed = QtCore.Signal(str, list, list)
+
+
+notifier = _Notifier()
+
+# Live models per entity type, see `watch()`
+_watchers = dict()
+_watchers_lock = threading.Lock()
+
+
+def update_references(name, changed, removed=()):
+    """Apply changed records to the cached references and live models.
+
+    This can be called from any thread, the live models connected to
+    `notifier.references_changed` are updated in the main thread.
+
+    Args:
+        name (str): The name of the references, e.g. "persons".
+        changed (list): New or updated records.
+        removed (list): Ids of removed records.
+
+    """
+    changed = list(changed)
+    removed = list(removed)
+
+    records = references.get(name)
+    if records is not None:
+        updated = dict((record["id"], record) for record in changed)
+        records = [updated.pop(record["id"], record) for record in records
+                   if record["id"] not in removed]
+        records.extend(record for record in changed
+                       if record["id"] in updated)
+        references[name] = records
+
+    notifier.references_changed.emit(name, changed, removed)
+
+
+def watch(entity_type, model):
+    """Register *model* as showing entities of *entity_type*
+
+    Changes of entities nobody watches are only invalidated in the cache,
+    see `is_watched()`. The model is held by a weak reference.
+
+    """
+    with _watchers_lock:
+        _watchers.setdefault(entity_type, weakref.WeakSet()).add(model)
+
+
+def is_watched(entity_type):
+    """Return whether a live model shows entities of *entity_type*"""
+    with _watchers_lock:
+        return bool(_watchers.get(entity_type))
+
+
+def update_entities(entity_type, changed, removed=()):
+    """Apply changed entities to the cache and live models.
+
+    This can be called from any thread, the live models connected to
+    `notifier.entities_changed` are updated in the main thread.
+
+    Args:
+        entity_type (str): The type of the entities, e.g. "Task".
+        changed (list): Updated records as returned by the data routes.
+        removed (list): Ids of removed records.
+
+    """
+    changed = list(changed)
+    removed = list(removed)
+
+    # The cached entities can hold more data than the records, e.g. the
+    # full task of `gazu.task.get_task`, so they are fetched again
+    for entity_id in removed + [record["id"] for record in changed]:
+        entities.pop((entity_type, entity_id))
+
+    notifier.entities_changed.emit(entity_type, changed, removed)
+
+
+def clear_session_data():
+    """Clear the cached data of the logged in user, e.g. on logging in or out
+
+    The references and entities are fetched again on next use, so the data
+    of a previous user or host is never shown. The downloaded images are
+    kept as their urls are unique.
+
+    """
+    references.clear()
+    entities.clear()
@@ -0,0 +1,267 @@
+"""Invalidate the qtazu caches on changes pushed by the Zou event stream.
+
+Without listening the caches either go stale or need to be refetched
+blindly. The `EventListener` connects to the event stream of the gazu host
+and invalidates only the cached data an event refers to. Changed reference
+data (persons, task statuses and task types) and changed entities shown by
+a live `qtazu.models.entities.EntityModel` are fetched and applied to the
+live models right away:
+
+    from qtazu.events import EventListener
+
+    listener = EventListener()
+    listener.event_received.connect(on_event)
+    listener.start()
+
+The listener is optional and requires the event stream dependencies of
+gazu to be installed.
+
+"""
+import logging
+
+from Qt import QtCore
+
+from .utils import Worker
+from . import cache
+from .lazy import lazy_import
+
+gazu = lazy_import("gazu")
+
+log = logging.getLogger(__name__)
+
+
+def _avatar_url(person_id):
+    return "pictures/thumbnails/persons/{0}.png".format(person_id)
+
+
+def _preview_urls(preview_file_id):
+    from .widgets.thumbnail import VARIANTS
+    return ["pictures/{0}/preview-files/{1}.png".format(variant,
+                                                        preview_file_id)
+            for variant, _ in VARIANTS]
+
+
+def _on_person_changed(data):
+    person_id = data["person_id"]
+    cache.entities.pop(("Person", person_id))
+    cache.images.pop(_avatar_url(person_id))
+    if "persons" in cache.references:
+        person = gazu.person.get_person(person_id)
+        cache.update_references("persons", [person])
+
+
+def _on_person_deleted(data):
+    person_id = data["person_id"]
+    cache.entities.pop(("Person", person_id))
+    cache.images.pop(_avatar_url(person_id))
+    cache.update_references("persons", [], [person_id])
+
+
+def _on_task_status_changed(data):
+    if "task_statuses" in cache.references:
+        status = gazu.client.fetch_one("task-status", data["task_status_id"])
+        cache.update_references("task_statuses", [status])
+
+
+def _on_task_status_deleted(data):
+    cache.update_references("task_statuses", [], [data["task_status_id"]])
+
+
+def _on_task_type_changed(data):
+    cache.entities.pop(("TaskType", data["task_type_id"]))
+    if "task_types" in cache.references:
+        task_type = gazu.task.get_task_type(data["task_type_id"])
+        cache.update_references("task_types", [task_type])
+
+
+def _on_task_type_deleted(data):
+    cache.entities.pop(("TaskType", data["task_type_id"]))
+    cache.update_references("task_types", [], [data["task_type_id"]])
+
+
+def _update_task(task_id):
+    """Fetch the task for the live models, only invalidate it otherwise"""
+    if cache.is_watched("Task"):
+        task = gazu.client.fetch_one("tasks", task_id)
+        cache.update_entities("Task", [task])
+    else:
+        cache.entities.pop(("Task", task_id))
+
+
+def _on_task_changed(data):
+    _update_task(data["task_id"])
+    cache.references.pop("user_tasks")
+
+
+def _on_task_deleted(data):
+    cache.update_entities("Task", [], [data["task_id"]])
+    cache.references.pop("user_tasks")
+
+
+def _on_comment_changed(data):
+    # A comment can change the status of its task
+    if data.get("task_id"):
+        _update_task(data["task_id"])
+    cache.references.pop("user_tasks")
+
+
+def _on_preview_file_changed(data):
+    preview_file_id = data["preview_file_id"]
+    cache.entities.pop(("PreviewFile", preview_file_id))
+    for url in _preview_urls(preview_file_id):
+        cache.images.pop(url)
+
+
+def _on_entity_changed(entity_type, path=None):
+    key = "{0}_id".format(entity_type.lower())
+
+    def _update(data):
+        entity_id = data[key]
+        if path and cache.is_watched(entity_type):
+            entity = gazu.client.fetch_one(path, entity_id)
+            cache.update_entities(entity_type, [entity])
+        else:
+            cache.entities.pop((entity_type, entity_id))
+
+    return _update
+
+
+def _on_entity_deleted(entity_type):
+    key = "{0}_id".format(entity_type.lower())
+
+    def _remove(data):
+        cache.update_entities(entity_type, [], [data[key]])
+
+    return _remove
+
+
+# The functions that apply each event to the caches
+EVENTS = {
+    "person:new": _on_person_changed,
+    "person:update": _on_person_changed,
+    "person:delete": _on_person_deleted,
+    "task-status:new": _on_task_status_changed,
+    "task-status:update": _on_task_status_changed,
+    "task-status:delete": _on_task_status_deleted,
+    "task-type:new": _on_task_type_changed,
+    "task-type:update": _on_task_type_changed,
+    "task-type:delete": _on_task_type_deleted,
+    "task:new": _on_task_changed,
+    "task:update": _on_task_changed,
+    "task:delete": _on_task_deleted,
+    "comment:new": _on_comment_changed,
+    "comment:update": _on_comment_changed,
+    "comment:delete": _on_comment_changed,
+    "preview-file:new": _on_preview_file_changed,
+    "preview-file:update": _on_preview_file_changed,
+    "asset:update": _on_entity_changed("Asset", "assets"),
+    "asset:delete": _on_entity_deleted("Asset"),
+    "shot:update": _on_entity_changed("Shot", "shots"),
+    "shot:delete": _on_entity_deleted("Shot"),
+    "project:update": _on_entity_changed("Project"),
+}
+
+
+def handle_event(name, data):
+    """Apply the event to the qtazu caches and live models.
+
+    Args:
+        name (str): The event name, e.g. "person:update".
+        data (dict): The event data with the ids of the changed records.
+
+    Returns:
+        bool: Whether the event is handled by qtazu.
+
+    """
+    handler = EVENTS.get(name)
+    if handler is None:
+        return False
+
+    try:
+        handler(data)
+    except Exception as exc:
+        log.warning("Failed to handle event %s: %s", name, exc)
+    return True
+
+
+class EventListener(QtCore.QObject):
+    """Listen to the event stream of the gazu host in a Worker thread.
+
+    Each event in `EVENTS` is applied to the caches as it arrives, after
+    which `event_received` is emitted in the main thread.
+
+    Args:
+        host (str, optional): The event stream host, e.g.
+            "https://zou.example.com". When set it is set as gazu's event
+            host, which otherwise derives it from its api host.
+
+    """
+
+    event_received = QtCore.Signal(str, dict)
+    stopped = QtCore.Signal(str)
+
+    def __init__(self, host=None, parent=None):
+        super(EventListener, self).__init__(parent)
+
+        self.host = host
+
+        self._client = None
+        self._worker = None
+
+    def is_running(self):
+        return self._worker is not None
+
+    def start(self):
+        """Connect to the event stream in a Worker thread"""
+        if self._worker:
+            return
+
+        self._worker = Worker(self._listen, parent=self)
+        self._worker.finished.connect(self._workerFinished)
+        self._worker.start()
+
+    def stop(self):
+        """Disconnect from the event stream"""
+        client = self._client
+        if client is not None:
+            client.disconnect()
+
+    def _listen(self):
+        """Run the event client until it is disconnected, runs in a Worker"""
+        try:
+            if self.host:
+                gazu.set_event_host(self.host)
+            self._client = gazu.events.init()
+            for name in EVENTS:
+                gazu.events.add_listener(self._client,
+                                         name,
+                                         self._make_handler(name))
+        except Exception:
+            log.exception("Unable to connect to the event stream of %s, "
+                          "the qtazu caches are not kept up to date",
+                          gazu.get_event_host())
+            self._client = None
+            raise
+
+        try:
+            gazu.events.run_client(self._client)
+        finally:
+            self._client = None
+
+    def _make_handler(self, name):
+        def _handler(data):
+            handle_event(name, data)
+            self.event_received.emit(name, data)
+        return _handler
+
+    def _workerFinished(self):
+        """Handle worker finished event."""
+
+        worker = self._worker
+        self._worker = None
+
+        message = ""
+        if worker.error:
+            message = str(worker.error[1])
+            log.error("Event stream stopped: %s", message)
+        self.stopped.emit(message)
@@ -0,0 +1,146 @@
+"""Check the import time of the qtazu widget modules against a budget.
+
+Each module is imported in a fresh interpreter with `-X importtime`
+(Python 3.7+) after preloading Qt, like a host application would have
+done already. The time is the module's cumulative import time, which
+includes all modules it imported for the first time:
+
+    python -m qtazu.importtime --budget 50
+
+It exits with 1 when any module exceeds the budget (in milliseconds).
+
+"""
+import re
+import sys
+import argparse
+import subprocess
+
+# The modules to check by default
+MODULES = [
+    "qtazu.widgets.comment",
+    "qtazu.widgets.login",
+    "qtazu.widgets.screenmarquee",
+    "qtazu.widgets.taskbreadcrumb",
+    "qtazu.widgets.thumbnail",
+]
+
+# Modules already imported by the host before loading qtazu
+PRELOAD = ["Qt", "Qt.QtCore", "Qt.QtGui", "Qt.QtWidgets"]
+
+# Milliseconds an import may take by default
+BUDGET = 50
+
+# E.g. "import time:       345 |       1234 |   qtazu.widgets.comment"
+_LINE = re.compile(r"import time:\s*(\d+)\s*\|\s*(\d+)\s*\|\s*(\S+)")
+
+
+def parse_importtime(output):
+    """Return the cumulative import time in microseconds per module.
+
+    Args:
+        output (str): The `-X importtime` output printed to stderr.
+
+    Returns:
+        list: (module, microseconds) in the order the imports finished.
+
+    """
+    times = []
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match:
+            times.append((match.group(3), int(match.group(2))))
+    return times
+
+
+def measure(module, preload=None, python=None):
+    """Return the cumulative import time of module in milliseconds.
+
+    Args:
+        module (str): The module to import.
+        preload (list, optional): Modules to import before measuring,
+            defaults to `PRELOAD`.
+        python (str, optional): The interpreter, defaults to the current.
+
+    Returns:
+        dict: The "module" time and the "imports" of all imported modules.
+
+    """
+    preload = PRELOAD if preload is None else preload
+    code = "".join("import %s;" % name for name in preload)
+    code += "import %s" % module
+
+    process = subprocess.Popen([python or sys.executable,
+                                "-X", "importtime",
+                                "-c", code],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    _, output = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError("Failed to import %s:\n%s" % (module, output))
+
+    times = parse_importtime(output)
+    names = [name for name, _ in times]
+    if module not in names:
+        raise RuntimeError("No import time measured for %s, "
+                           "Python 3.7+ is required" % module)
+
+    # Only include the imports after the preloaded modules
+    start = max([names.index(name) + 1 for name in preload
+                 if name in names] or [0])
+    imports = dict((name, value / 1000.0) for name, value in times[start:])
+    return {"module": imports[module], "imports": imports}
+
+
+def check(modules=None, budget=BUDGET, preload=None, python=None):
+    """Return the modules exceeding the budget with their time
+
+    Args:
+        modules (list, optional): The modules to check, defaults to
+            `MODULES`.
+        budget (float): Milliseconds an import may take.
+        preload (list, optional): Modules to import before measuring.
+        python (str, optional): The interpreter, defaults to the current.
+
+    Returns:
+        dict: Milliseconds per module over the budget.
+
+    """
+    exceeded = {}
+    for module in modules or MODULES:
+        result = measure(module, preload=preload, python=python)
+        if result["module"] > budget:
+            exceeded[module] = result["module"]
+    return exceeded
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("modules", nargs="*", default=MODULES,
+                        help="The modules to check")
+    parser.add_argument("--budget", type=float, default=BUDGET,
+                        help="Milliseconds an import may take")
+    parser.add_argument("--top", type=int, default=5,
+                        help="Show the slowest imports of each module")
+    args = parser.parse_args(args)
+
+    failed = False
+    for module in args.modules:
+        result = measure(module)
+        over = result["module"] > args.budget
+        failed = failed or over
+
+        print("%s %s: %.1f ms" % ("FAIL" if over else "ok  ",
+                                  module,
+                                  result["module"]))
+        slowest = sorted(result["imports"].items(),
+                         key=lambda item: item[1],
+                         reverse=True)
+        for name, value in slowest[1:args.top + 1]:
+            print("       %s: %.1f ms" % (name, value))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""Defer importing heavy dependencies until they are first used.
+
+Importing gazu (and with it requests) takes a noticeable amount of time,
+which adds up in hosts that load many tools on startup. Modules refer to
+them through a `LazyModule` instead, which imports the module on first
+attribute access:
+
+    from .lazy import lazy_import
+
+    gazu = lazy_import("gazu")
+
+    def get_persons():
+        return gazu.person.all_persons()  # gazu is imported here
+
+Note that module level code must not access the lazy module's attributes,
+otherwise it is imported right away anyway.
+
+"""
+import sys
+import importlib
+import threading
+
+
+class LazyModule(object):
+    """Placeholder for a module that is imported on first attribute access
+
+    Args:
+        name (str): The full name of the module.
+
+    """
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = module
+        return module
+
+    def is_loaded(self):
+        """Return whether the module has been imported"""
+        return self.__dict__["_name"] in sys.modules
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "lazy"
+        return "<LazyModule '%s' (%s)>" % (self.__dict__["_name"], state)
+
+
+def lazy_import(name):
+    """Return the module when already imported, a `LazyModule` otherwise"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
@@ -0,0 +1,297 @@
+"""Shared concurrency and rate limiting of the qtazu background requests.
+
+When many artists open qtazu based tools at once their thumbnail and avatar
+downloads can overload the Zou server. The `AdaptiveLimiter` caps the
+requests in flight globally and per host, limits their rate with a token
+bucket and adapts the per host cap AIMD-style: it slowly grows while
+responses are fast and halves on slow, 429 or 5xx responses.
+
+Install it on the gazu session to apply it to all requests made from
+background threads, requests from the GUI thread are never delayed:
+
+    from qtazu import limiter
+
+    limiter.install()
+
+"""
+import time
+import random
+import logging
+import threading
+
+from Qt import QtCore
+
+from .lazy import lazy_import
+
+gazu = lazy_import("gazu")
+
+log = logging.getLogger(__name__)
+
+# Status codes that signal the server is overloaded
+OVERLOADED = frozenset([429, 500, 502, 503, 504])
+
+# Status codes after which the request is retried
+RETRY = frozenset([429, 502, 503, 504])
+
+# The limiter shared by all requests, see `get_limiter()`
+_LIMITER = None
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket to limit the rate of requests.
+
+    Args:
+        rate (float): Tokens added per second.
+        burst (int, optional): Maximum tokens, defaults to *rate*.
+
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.time()
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+    def try_acquire(self):
+        """Take a token, return the seconds to wait when none is available"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Take a token, waiting for one when needed
+
+        Returns:
+            float: The seconds waited.
+
+        """
+        waited = 0.0
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+
+class _Host(object):
+    """The limiting state of a host"""
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.latency = None
+        self.requests = 0
+        self.overloaded = 0
+
+
+class AdaptiveLimiter(object):
+    """Limit the concurrency and rate of requests, adapting to the server.
+
+    The per host cap starts at `per_host`. It grows by about one request
+    per round trip while responses are faster than `latency_target` and
+    is multiplied by `decrease` on slow or overloaded responses, at most
+    once per round trip so a burst of failures does not collapse it.
+
+    Args:
+        max_concurrency (int): Maximum requests in flight over all hosts.
+        per_host (int): Maximum requests in flight per host.
+        min_per_host (int): The per host cap never goes below this.
+        rate (float): Maximum requests started per second.
+        burst (int, optional): Requests that may start at once.
+        latency_target (float): Seconds above which a response is slow.
+        decrease (float): Factor to decrease the per host cap with.
+        backoff (float): Seconds of the first retry delay.
+        max_backoff (float): Maximum seconds of a retry delay.
+
+    """
+
+    def __init__(self,
+                 max_concurrency=16,
+                 per_host=6,
+                 min_per_host=1,
+                 rate=20.0,
+                 burst=None,
+                 latency_target=2.0,
+                 decrease=0.5,
+                 backoff=0.5,
+                 max_backoff=30.0):
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.min_per_host = min_per_host
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._bucket = TokenBucket(rate, burst)
+        self._hosts = dict()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def _get_host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = _Host(self.per_host)
+            self._hosts[host] = state
+        return state
+
+    def acquire(self, host):
+        """Wait for a free slot for a request to *host*
+
+        Returns:
+            float: The seconds waited.
+
+        """
+        start = time.time()
+        with self._condition:
+            state = self._get_host(host)
+            while True:
+                delay = state.blocked_until - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                if self._in_flight < self.max_concurrency and \
+                        state.in_flight < int(state.limit):
+                    break
+                self._condition.wait()
+
+            self._in_flight += 1
+            state.in_flight += 1
+            state.requests += 1
+
+        self._bucket.acquire()
+        return time.time() - start
+
+    def release(self, host, latency=None, status=None, retry_after=None):
+        """Release the slot and adapt the cap to the response.
+
+        Args:
+            host (str): The host of the request.
+            latency (float, optional): Seconds until the response.
+            status (int, optional): The response status code, None when the
+                request failed without a response.
+            retry_after (float, optional): Seconds the server asked to wait.
+
+        """
+        with self._condition:
+            state = self._get_host(host)
+            self._in_flight -= 1
+            state.in_flight -= 1
+
+            now = time.time()
+            if latency is not None:
+                if state.latency is None:
+                    state.latency = latency
+                else:
+                    state.latency = 0.8 * state.latency + 0.2 * latency
+
+            overloaded = status is None or status in OVERLOADED
+            slow = latency is not None and latency > self.latency_target
+            if overloaded or slow:
+                state.overloaded += 1
+
+                # Decrease at most once per round trip
+                if now - state.last_decrease > (state.latency or 1.0):
+                    state.limit = max(float(self.min_per_host),
+                                      state.limit * self.decrease)
+                    state.last_decrease = now
+                    log.debug("Decreased limit of %s to %.1f",
+                              host, state.limit)
+            else:
+                state.limit = min(float(self.per_host),
+                                  state.limit + 1.0 / state.limit)
+
+            if retry_after:
+                state.blocked_until = max(state.blocked_until,
+                                          now + retry_after)
+
+            self._condition.notify_all()
+
+    def get_retry_delay(self, attempt, retry_after=None):
+        """Return the jittered seconds to wait before retry *attempt*"""
+        if retry_after:
+            return retry_after
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(delay / 2.0, delay)
+
+    def limit(self, host):
+        """Return the current cap of requests in flight to *host*"""
+        with self._condition:
+            return int(self._get_host(host).limit)
+
+    def stats(self):
+        """Return the cap, requests in flight and counters per host"""
+        with self._condition:
+            return dict(
+                (host, {
+                    "limit": int(state.limit),
+                    "in_flight": state.in_flight,
+                    "latency": state.latency,
+                    "requests": state.requests,
+                    "overloaded": state.overloaded
+                }) for host, state in self._hosts.items()
+            )
+
+
+def in_gui_thread():
+    """Return whether this is the thread of the Qt application"""
+    app = QtCore.QCoreApplication.instance()
+    return app is not None and QtCore.QThread.currentThread() == app.thread()
+
+
+def get_limiter():
+    """Return the AdaptiveLimiter shared in this session"""
+    global _LIMITER
+    if _LIMITER is None:
+        _LIMITER = AdaptiveLimiter()
+    return _LIMITER
+
+
+def install(session=None, limiter=None, retries=3):
+    """Limit the background requests of the (gazu) requests session.
+
+    The limiter wraps the mounted adapters, so any default timeout set with
+    `qtazu.utils.set_request_timeout` or a recording is kept. Installing it
+    again only replaces the limiter and retries.
+
+    Args:
+        session (requests.Session, optional): Defaults to gazu's session.
+        limiter (AdaptiveLimiter, optional): Defaults to `get_limiter()`.
+        retries (int): Times to retry idempotent requests on overload.
+
+    Returns:
+        AdaptiveLimiter: The installed limiter.
+
+    """
+    from .adapters import PREFIXES, LimitedHTTPAdapter, find_adapter
+
+    if session is None:
+        session = gazu.client.requests_session
+    limiter = limiter or get_limiter()
+
+    for prefix in PREFIXES:
+        current = session.get_adapter(prefix)
+        installed = find_adapter(current, LimitedHTTPAdapter)
+        if installed is not None:
+            installed.limiter = limiter
+            installed.retries = retries
+            continue
+
+        session.mount(prefix, LimitedHTTPAdapter(limiter=limiter,
+                                                 retries=retries,
+                                                 adapter=current))
+    return limiter
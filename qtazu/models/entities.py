@@ -0,0 +1,467 @@
+import logging
+
+from Qt import QtCore, QtGui
+
+from ..utils import Worker
+from .. import cache
+from ..lazy import lazy_import
+from ..widgets.thumbnail import (
+    download_thumbnail,
+    get_device_pixel_ratio,
+    get_fallback_urls,
+    get_variant_url
+)
+
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    # Python 2
+    from urllib import urlencode
+
+gazu = lazy_import("gazu")
+
+log = logging.getLogger(__name__)
+
+
+def fetch_page(path, page, limit, filters=None):
+    """Return one page of the entities of a Zou data route.
+
+    Args:
+        path (str): The data route, e.g. "tasks".
+        page (int): The page, starting at 1.
+        limit (int): The number of entities per page.
+        filters (dict, optional): Server-side filters, e.g.
+            {"project_id": "..."}.
+
+    Returns:
+        tuple: (entities, has_more). Routes that do not paginate return
+            all entities and None for has_more.
+
+    """
+    params = dict(filters or {})
+    params["page"] = page
+    params["limit"] = limit
+
+    result = gazu.client.fetch_all("{0}?{1}".format(path, urlencode(params)))
+    if isinstance(result, list):
+        # The route does not support pagination
+        return result, None
+
+    nb_pages = result.get("nb_pages")
+    if nb_pages is not None:
+        has_more = page < nb_pages
+    else:
+        has_more = len(result["data"]) >= limit
+    return result["data"], has_more
+
+
+class EntityModel(QtCore.QAbstractListModel):
+    """List model of CG-Wire entities fetched page by page when scrolled to
+
+    Subclasses set the Zou data route in `path`, the entity type in
+    `entity_type` and implement `get_thumbnail_url()` and `format_name()`.
+
+    Views fetch the next page in a Worker thread through `canFetchMore()` and
+    `fetchMore()` once the last row is scrolled into view. Routes that do not
+    paginate are fetched at once and their rows are still added page by
+    page. A page that failed to fetch is fetched again after a backoff.
+    Thumbnails are only downloaded for rows the view displays, in the
+    smallest picture variant covering the icon size.
+
+    Rows of entities changed in `qtazu.cache.update_entities()`, e.g. by
+    the `qtazu.events.EventListener`, are updated in place.
+
+    Args:
+        filters (dict, optional): Server-side filters, e.g.
+            {"project_id": "..."}.
+        page_size (int): The number of entities to fetch per page.
+        icon_size (int): The width of the thumbnail icons.
+
+    """
+
+    path = None
+    entity_type = None
+
+    EntityRole = QtCore.Qt.UserRole + 1
+
+    loading_changed = QtCore.Signal(bool)
+
+    def __init__(self, filters=None, page_size=100, icon_size=30,
+                 parent=None):
+        super(EntityModel, self).__init__(parent)
+
+        self.page_size = page_size
+        self.icon_size = icon_size
+
+        pixmap = QtGui.QPixmap(QtCore.QSize(icon_size, icon_size))
+        pixmap.fill(QtGui.QColor(0, 0, 0, 0))
+        self._empty_icon = QtGui.QIcon(pixmap)
+
+        self._filters = dict(filters or {})
+        self._entities = []
+        self._icons = dict()  # icon per thumbnail variant url
+        self._rows = dict()  # rows per thumbnail variant url
+        self._ratio = get_device_pixel_ratio(
+            QtCore.QCoreApplication.instance()
+        )
+        self._page = 0
+        self._has_more = True
+        self._buffer = []  # fetched entities not added yet
+        self._worker = None
+        self._failures = 0  # Failed attempts to fetch the next page
+
+        self._retry_timer = QtCore.QTimer(self)
+        self._retry_timer.setSingleShot(True)
+        self._retry_timer.timeout.connect(self.fetchMore)
+
+        self._pending_thumbnails = dict()  # fallback urls per url
+        self._thumbnail_worker = None
+        self._thumbnail_timer = QtCore.QTimer(self)
+        self._thumbnail_timer.setSingleShot(True)
+        self._thumbnail_timer.timeout.connect(self._download_thumbnails)
+
+        if self.entity_type:
+            cache.watch(self.entity_type, self)
+            cache.notifier.entities_changed.connect(self._on_entities_changed)
+
+    def get_thumbnail_url(self, entity):
+        """Return the relative thumbnail url of *entity*, None if none"""
+        return None
+
+    def get_icon_url(self, entity):
+        """Return the url of the thumbnail variant to show as icon
+
+        See `qtazu.widgets.thumbnail.get_variant_url`.
+
+        """
+        url = self.get_thumbnail_url(entity)
+        if url:
+            return get_variant_url(url,
+                                   self.icon_size,
+                                   self.icon_size,
+                                   ratio=self._ratio)
+
+    def format_name(self, entity):
+        return entity.get("name", "")
+
+    def get_filters(self):
+        return dict(self._filters)
+
+    def set_filters(self, **filters):
+        """Set the server-side filters and fetch the entities again"""
+        self._filters = filters
+        self.refresh()
+
+    def refresh(self):
+        """Clear the entities, the view fetches the first page again"""
+        self._reset()
+
+    def set_entities(self, entities):
+        """Show all *entities* at once instead of fetching them by page"""
+        self._reset(entities)
+
+    def _reset(self, entities=None):
+        self.beginResetModel()
+        self._entities = list(entities or [])
+        self._page = 0
+        self._has_more = entities is None
+        self._buffer = []
+        self._worker = None
+        self._failures = 0
+        self._retry_timer.stop()
+        self._update_rows()
+        self.endResetModel()
+
+    def is_loading(self):
+        return self._worker is not None
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return False
+        return bool(self._buffer) or self._has_more
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return
+
+        if self._buffer:
+            self._add_entities(self._buffer[:self.page_size])
+            self._buffer = self._buffer[self.page_size:]
+            return
+
+        if self._worker or not self._has_more or \
+                self._retry_timer.isActive():
+            return
+
+        self._page += 1
+        self._worker = Worker(fetch_page,
+                              args=[self.path,
+                                    self._page,
+                                    self.page_size,
+                                    self._filters],
+                              parent=self)
+        self._worker.finished.connect(self._workerFinished)
+        self._worker.start()
+        self.loading_changed.emit(True)
+
+    def _workerFinished(self):
+        """Handle worker finished event."""
+
+        worker = self.sender()
+        if worker is not self._worker:
+            # Ignore pages from before `refresh()`
+            return
+        self._worker = None
+        self.loading_changed.emit(False)
+
+        if worker.error:
+            # Fetch the page again after a backoff
+            self._page -= 1
+            self._failures += 1
+            delay = min(2 ** (self._failures - 1), 30)
+            log.error("Failed to fetch %s, retrying in %d seconds: %s",
+                      self.path, delay, worker.error[1])
+            self._retry_timer.start(delay * 1000)
+            return
+
+        self._failures = 0
+
+        entities, has_more = worker.result
+        if has_more is None:
+            # All entities are fetched, add them page by page
+            self._has_more = False
+            self._buffer = entities[self.page_size:]
+            entities = entities[:self.page_size]
+        else:
+            self._has_more = has_more
+
+        self._add_entities(entities)
+
+    def _add_entities(self, entities):
+        if not entities:
+            return
+
+        first = len(self._entities)
+        last = first + len(entities) - 1
+        self.beginInsertRows(QtCore.QModelIndex(), first, last)
+        self._entities.extend(entities)
+        for row, entity in enumerate(entities, first):
+            url = self.get_icon_url(entity)
+            if url:
+                self._rows.setdefault(url, []).append(row)
+        self.endInsertRows()
+
+    def _update_rows(self):
+        """Collect the rows per thumbnail url again"""
+        self._rows = dict()
+        for row, entity in enumerate(self._entities):
+            url = self.get_icon_url(entity)
+            if url:
+                self._rows.setdefault(url, []).append(row)
+
+    def _on_entities_changed(self, entity_type, changed, removed):
+        if entity_type == self.entity_type:
+            self.update_entities(changed, removed)
+
+    def update_entities(self, changed, removed=(), insert=False):
+        """Update the rows of *changed* entities and remove *removed*
+
+        Changed entities that are not loaded yet are ignored unless
+        *insert* is set, by default new entities are only added by fetching
+        their page.
+
+        Args:
+            changed (list): Updated entities.
+            removed (list): Ids of the removed entities.
+            insert (bool): Add the new entities of *changed*.
+
+        """
+        removed = set(removed)
+        loaded = set(entity["id"] for entity in self._entities + self._buffer)
+        new = [entity for entity in changed if entity["id"] not in loaded]
+        changed = dict((entity["id"], entity) for entity in changed)
+
+        self._buffer = [changed.get(entity["id"], entity)
+                        for entity in self._buffer
+                        if entity["id"] not in removed]
+
+        for row in reversed(range(len(self._entities))):
+            if self._entities[row]["id"] in removed:
+                self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+                self._entities.pop(row)
+                self.endRemoveRows()
+
+        for row, entity in enumerate(self._entities):
+            if entity["id"] in changed:
+                self._entities[row] = changed[entity["id"]]
+                index = self.index(row)
+                self.dataChanged.emit(index, index, [])
+
+        self._update_rows()
+
+        if insert:
+            self._add_entities(new)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._entities)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return
+
+        entity = self._entities[index.row()]
+
+        if role == QtCore.Qt.DisplayRole or role == QtCore.Qt.EditRole:
+            return self.format_name(entity)
+
+        if role == QtCore.Qt.DecorationRole:
+            return self._get_icon(entity)
+
+        if role == self.EntityRole:
+            return entity
+
+    def _get_icon(self, entity):
+        """Return the thumbnail icon, schedule its download if needed"""
+        url = self.get_icon_url(entity)
+        if not url:
+            return self._empty_icon
+
+        icon = self._icons.get(url)
+        if icon is not None:
+            return icon
+
+        if url in cache.images:
+            icon = self._make_icon(cache.images[url])
+            self._icons[url] = icon
+            return icon
+
+        # Collect the thumbnails the view asks for and download them
+        # together once the view is done painting
+        fallbacks = get_fallback_urls(url, self.get_thumbnail_url(entity))
+        self._pending_thumbnails[url] = fallbacks
+        if not self._thumbnail_worker:
+            self._thumbnail_timer.start(0)
+        return self._empty_icon
+
+    def _make_icon(self, data):
+        pixmap = QtGui.QPixmap()
+        pixmap.loadFromData(data)
+        if pixmap.isNull():
+            return self._empty_icon
+
+        mode = QtCore.Qt.SmoothTransformation
+        pixmap = pixmap.scaledToWidth(int(self.icon_size * self._ratio),
+                                      mode=mode)
+        if hasattr(pixmap, "setDevicePixelRatio"):
+            pixmap.setDevicePixelRatio(self._ratio)
+        return QtGui.QIcon(pixmap)
+
+    def _download_thumbnails(self):
+        if self._thumbnail_worker or not self._pending_thumbnails:
+            return
+
+        urls = dict(self._pending_thumbnails)
+        self._pending_thumbnails.clear()
+
+        self._thumbnail_worker = Worker(_download_thumbnails,
+                                        args=[urls],
+                                        parent=self)
+        self._thumbnail_worker.finished.connect(self._on_thumbnails)
+        self._thumbnail_worker.start(QtCore.QThread.LowPriority)
+
+    def _on_thumbnails(self):
+        worker = self._thumbnail_worker
+        self._thumbnail_worker = None
+
+        if worker.error:
+            log.warning("Failed to download thumbnails: %s", worker.error[1])
+        else:
+            # Don't retry thumbnails that failed to download
+            for url in worker.args[0]:
+                self._icons.setdefault(url, self._empty_icon)
+
+            for url, data in worker.result.items():
+                self._icons[url] = self._make_icon(data)
+
+                # Update the rows showing the thumbnail
+                for row in self._rows.get(url, []):
+                    index = self.index(row)
+                    self.dataChanged.emit(index, index,
+                                          [QtCore.Qt.DecorationRole])
+
+        # Download the thumbnails requested meanwhile
+        if self._pending_thumbnails:
+            self._thumbnail_timer.start(0)
+
+
+def _download_thumbnails(urls):
+    """Return the image data per url into `qtazu.cache.images`
+
+    Args:
+        urls (dict): The urls to download with the urls to fall back to
+            when missing, see `qtazu.widgets.thumbnail.get_fallback_urls`.
+
+    """
+    result = {}
+    for url, fallbacks in urls.items():
+        for candidate in [url] + list(fallbacks):
+            data = cache.images.get(candidate)
+            if data is None:
+                data = download_thumbnail(candidate)
+                if data is None:
+                    continue
+                cache.images[candidate] = data
+            result[url] = data
+            break
+    return result
+
+
+class TaskModel(EntityModel):
+    """Tasks showing their task type and the avatar of the first assignee
+
+    For example all tasks of a project:
+
+        model = TaskModel(filters={"project_id": project["id"]})
+
+    """
+
+    path = "tasks"
+    entity_type = "Task"
+
+    def get_thumbnail_url(self, entity):
+        assignees = entity.get("assignees")
+        if assignees:
+            return "pictures/thumbnails/persons/{0}.png".format(assignees[0])
+
+    def format_name(self, entity):
+        if entity.get("name") and entity["name"] != "main":
+            return entity["name"]
+
+        # Use the task type name from the reference data when available
+        task_types = cache.references.get("task_types") or []
+        for task_type in task_types:
+            if task_type["id"] == entity.get("task_type_id"):
+                return task_type["name"]
+        return entity.get("name", "")
+
+
+class AssetModel(EntityModel):
+    """Assets showing their preview thumbnail"""
+
+    path = "assets"
+    entity_type = "Asset"
+
+    def get_thumbnail_url(self, entity):
+        if entity.get("preview_file_id"):
+            return "pictures/thumbnails/preview-files/{0}.png".format(
+                entity["preview_file_id"]
+            )
+
+
+class ShotModel(AssetModel):
+    """Shots showing their preview thumbnail"""
+
+    path = "shots"
+    entity_type = "Shot"
@@ -1,161 +1,99 @@
 import logging
 
-from Qt import QtWidgets, QtCore, QtGui
-import gazu
+from .. import cache
+from ..lazy import lazy_import
+from .entities import EntityModel
 
-from ..utils import Worker
+gazu = lazy_import("gazu")
 
 log = logging.getLogger(__name__)
 
 
-class PersonModel(QtCore.QAbstractListModel):
+class PersonModel(EntityModel):
     """List model displaying CG-Wire Persons with Thumbnail
 
-    The thumbnails are loaded from the server in an async fashion to avoid
-    lockups of the user interface during this load.
+    All persons are loaded at once from the references in `qtazu.cache`.
+    The thumbnails are loaded from the server in an async fashion, only for
+    the persons the view displays, to avoid lockups of the user interface
+    during this load.
 
     """
-    def __init__(self):
-        super(PersonModel, self).__init__()
 
-        pixmap = QtGui.QPixmap(QtCore.QSize(30, 30))
-        pixmap.fill(QtGui.QColor(0, 0, 0, 0))
-        self._empty_icon = QtGui.QIcon(pixmap)
-        self._list = []
-        self._persons = []
-        self._worker = None
-        self.refresh()
+    path = "persons"
+    entity_type = "Person"
 
-    def refresh(self):
+    def __init__(self, parent=None):
+        super(PersonModel, self).__init__(parent=parent)
 
-        persons = gazu.person.all_persons()
+        self.refresh(cached=True)
 
-        # Initialize icons to an empty icon but allow the threaded worker
-        # to update it later so these thumbnails are collected
-        # without hanging the local UI.
-        for entry in persons:
-            entry["_icon"] = self._empty_icon
+        cache.notifier.references_changed.connect(
+            self._on_references_changed
+        )
 
-        # Store by id and keep the list in an order by ids only
-        self._list = [person["id"] for person in persons]  # the ordered list
-        self._persons = {person["id"]: person for person in persons}
+    def refresh(self, cached=False):
+        """Refresh the persons
 
-        # Set up Worker to collect the avatars for those that have an avatar
-        ids_with_avatar = [person["id"] for person in persons
-                           if person["has_avatar"]]
-        self.download_icons(ids_with_avatar)
-
-    def rowCount(self, parent=QtCore.QModelIndex()):
-        return len(self._list)
-
-    def _format_person_name(self, person):
-        return u"{0[first_name]} {0[last_name]}".format(person)
-
-    def data(self, index, role):
-        if index.isValid():
-            person_id = self._list[index.row()]
-            person = self._persons[person_id]
-
-            if role == QtCore.Qt.DisplayRole:
-                return self._format_person_name(person)
-
-            if role == QtCore.Qt.DecorationRole:
-                return person["_icon"]
-
-            if role == QtCore.Qt.EditRole:
-                return self._format_person_name(person)
-
-    def download_icons(self, ids):
-        """Load thumbnail from *reference* and display it."""
-
-        if self._worker and self._worker.isRunning():
-            while self._worker:
-                app = QtWidgets.QApplication.instance()
-                app.processEvents()
-
-        # We don't set "self" as the parent for the Worker
-        # as somehow that ends up crashing now and then...
-        self._worker = Worker(self._download_icons, [ids])
-        self._worker.start()
-        self._worker.finished.connect(self._workerFinished)
-
-    def _workerFinished(self):
-        """Handler worker finished event."""
-
-        top = self.index(0)
-        bottom = self.index(self.rowCount())
-
-        self._pixmaps = []
-        self._icons = []
-
-        if self._worker:
-            result = self._worker.result
-            if result:
-                for id, bytes in result.items():
-
-                    # Generate pixmap from bytes
-                    pixmap = QtGui.QPixmap()
-                    pixmap.loadFromData(bytes)
-                    self._pixmaps.append(pixmap)
+        Args:
+            cached (bool): Use the persons from `qtazu.cache` if they were
+                fetched before, e.g. by `qtazu.warmup`.
 
-                    if pixmap.isNull():
-                        # Downloaded bytes are invalid
-                        log.warning("Invalid bytes..")
-                        continue
+        """
 
-                    mode = QtCore.Qt.SmoothTransformation
-                    pixmap = pixmap.scaledToWidth(30, mode=mode)
+        if cached:
+            persons = cache.references.get_or_fetch("persons",
+                                                    gazu.person.all_persons)
+        else:
+            persons = gazu.person.all_persons()
+            cache.references["persons"] = persons
 
-                    # Generate icon from pixmap
-                    icon = QtGui.QIcon(pixmap)
-                    self._icons.append(icon)
+        self.set_entities(persons)
 
-                    # Store the icon on the person
-                    self._persons[id]["_icon"] = icon
+    def get_thumbnail_url(self, entity):
+        if entity.get("has_avatar"):
+            return "pictures/thumbnails/persons/{0}.png".format(entity["id"])
 
-                log.debug("Finished setting icons..")
+    def format_name(self, entity):
+        return self._format_person_name(entity)
 
-        self.dataChanged.emit(top, bottom, [QtCore.Qt.DecorationRole])
+    def _format_person_name(self, person):
+        return u"{0[first_name]} {0[last_name]}".format(person)
 
-        log.debug("Finished emitting data changed")
-        self._worker = None
+    def _on_references_changed(self, name, changed, removed):
+        if name == "persons":
+            self.apply_changes(changed, removed)
 
-    def _download_icons(self, ids):
-        """Return thumbnail for person file from *url*.
+    def apply_changes(self, changed, removed=()):
+        """Update changed persons, add new persons and remove *removed*
 
         Args:
-            url (str): The relative url in the form of
-                'pictures/thumbnails/{type}/{id}.png'
+            changed (list): New or updated persons.
+            removed (list): Ids of the removed persons.
 
         """
+        existing = dict((person["id"], person) for person in self._entities)
+        for person in changed:
+            previous = existing.get(person["id"])
+            if previous is not None and \
+                    person.get("updated_at") == previous.get("updated_at"):
+                continue
 
-        # Create our session
-        import requests
-        session = requests.Session()
-        header = gazu.client.make_auth_header()
+            # The avatar might have been changed as well
+            url = self.get_icon_url(person)
+            if url:
+                cache.images.pop(url)
+                self._icons.pop(url, None)
 
-        data = {}
-        for person_id in ids:
+        self.update_entities(changed, removed, insert=True)
 
-            url = "pictures/thumbnails/persons/{0}.png".format(person_id)
-            full_url = gazu.client.get_full_url(url)
-
-            with session.get(
-                full_url,
-                headers=header,
-                stream=True
-            ) as response:
-
-                if response.status_code != 200:
-                    # Request failed
-                    log.error("Failed request: %s" % full_url)
-                    continue
-
-                bytes = QtCore.QByteArray()
-                for chunk in response.iter_content(8192):
-                    bytes.append(chunk)
-
-                if not bytes.isNull():
-                    data[person_id] = bytes
-
-        return data
+    def download_icons(self, ids):
+        """Download the avatars of the persons with *ids* in the background"""
+        ids = set(ids)
+        for person in self._entities:
+            url = self.get_icon_url(person)
+            if url and person["id"] in ids:
+                self._icons.pop(url, None)
+                self._pending_thumbnails[url] = []
+
+        if not self._thumbnail_worker:
+            self._thumbnail_timer.start(0)
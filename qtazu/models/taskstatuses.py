@@ -0,0 +1,189 @@
+import logging
+
+from Qt import QtCore, QtGui
+
+from ..utils import Worker
+from .. import cache
+from ..lazy import lazy_import
+
+gazu = lazy_import("gazu")
+
+log = logging.getLogger(__name__)
+
+# The model shared by all widgets in this session, see `get_shared_model()`
+_SHARED_MODEL = None
+
+
+class TaskStatusModel(QtCore.QAbstractListModel):
+    """List model of CG-Wire Task Statuses colored like in Kitsu
+
+    The statuses are only fetched from the server once they are first
+    required through `ensure_loaded()` or in the background with `fetch()`.
+    Use `invalidate()` to have them fetched again on next use or `refresh()`
+    to fetch them directly.
+
+    """
+
+    StatusRole = QtCore.Qt.UserRole + 1
+
+    loaded = QtCore.Signal()
+
+    def __init__(self, parent=None):
+        super(TaskStatusModel, self).__init__(parent)
+
+        self._statuses = []
+        self._colors = []
+        self._loaded = False
+        self._worker = None
+
+        cache.notifier.references_changed.connect(
+            self._on_references_changed
+        )
+
+    def is_loaded(self):
+        return self._loaded
+
+    def ensure_loaded(self):
+        """Fetch the statuses if they were not fetched before"""
+        if not self._loaded:
+            self.refresh()
+
+    def fetch(self):
+        """Fetch the statuses in a background thread if not loaded yet
+
+        The `loaded` signal is emitted once the statuses are available.
+
+        """
+        if self._loaded or self._worker:
+            return
+
+        self._worker = Worker(cache.references.get_or_fetch,
+                              args=["task_statuses",
+                                    gazu.task.all_task_statuses],
+                              parent=self)
+        self._worker.finished.connect(self._workerFinished)
+        self._worker.start()
+
+    def _workerFinished(self):
+        """Handle worker finished event."""
+
+        worker = self._worker
+        self._worker = None
+
+        if worker.error:
+            log.error("Failed to fetch task statuses: %s", worker.error[1])
+            return
+
+        if not self._loaded:
+            self.set_statuses(worker.result)
+
+    def invalidate(self):
+        """Mark the statuses as outdated so next use fetches them again"""
+        cache.references.pop("task_statuses")
+        self._loaded = False
+
+    def refresh(self):
+        """Fetch all task statuses from the server"""
+        statuses = gazu.task.all_task_statuses()
+        cache.references["task_statuses"] = statuses
+        self.set_statuses(statuses)
+
+    def set_statuses(self, statuses):
+        """Reset the model to the given task statuses"""
+
+        colors = [self._get_color(state) for state in statuses]
+
+        self.beginResetModel()
+        self._statuses = list(statuses)
+        self._colors = colors
+        self._loaded = True
+        self.endResetModel()
+
+        self.loaded.emit()
+
+    @staticmethod
+    def _get_color(state):
+        # The "Todo" status is not user-defined and always returns the
+        # bright online White Theme color which is near pure white.
+        # So for that status we force the dark theme's grey.
+        if state["name"] == "Todo":
+            return QtGui.QColor("#5F626A")
+        return QtGui.QColor(state["color"])
+
+    def _on_references_changed(self, name, changed, removed):
+        if name == "task_statuses" and self._loaded:
+            self.apply_changes(changed, removed)
+
+    def apply_changes(self, changed, removed=()):
+        """Update changed statuses, add new statuses and remove *removed*
+
+        Args:
+            changed (list): New or updated task statuses.
+            removed (list): Ids of the removed task statuses.
+
+        """
+        for status_id in removed:
+            row = self.find_status(status_id)
+            if row < 0:
+                continue
+            self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+            self._statuses.pop(row)
+            self._colors.pop(row)
+            self.endRemoveRows()
+
+        for state in changed:
+            row = self.find_status(state["id"])
+            if row >= 0:
+                self._statuses[row] = state
+                self._colors[row] = self._get_color(state)
+                index = self.index(row)
+                self.dataChanged.emit(index, index, [])
+            else:
+                row = len(self._statuses)
+                self.beginInsertRows(QtCore.QModelIndex(), row, row)
+                self._statuses.append(state)
+                self._colors.append(self._get_color(state))
+                self.endInsertRows()
+
+    def find_status(self, status_id):
+        """Return row of the status with *status_id*, -1 if not found"""
+        for row, state in enumerate(self._statuses):
+            if state["id"] == status_id:
+                return row
+        return -1
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._statuses)
+
+    def data(self, index, role):
+        if not index.isValid():
+            return
+
+        row = index.row()
+        if role == QtCore.Qt.DisplayRole or role == QtCore.Qt.EditRole:
+            return self._statuses[row]["name"]
+
+        if role == self.StatusRole:
+            return self._statuses[row]
+
+        if role == QtCore.Qt.BackgroundRole:
+            return self._colors[row]
+
+        if role == QtCore.Qt.ForegroundRole:
+            # Force white text
+            return QtGui.QColor("white")
+
+
+def get_shared_model():
+    """Return the TaskStatusModel shared by all widgets in this session.
+
+    The statuses are not fetched until the model's `ensure_loaded()` is
+    called by the first widget that needs them.
+
+    """
+    global _SHARED_MODEL
+    if _SHARED_MODEL is None:
+        _SHARED_MODEL = TaskStatusModel()
+    return _SHARED_MODEL
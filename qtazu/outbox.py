@@ -0,0 +1,348 @@
+"""Persistent outbox to submit comments to CG-Wire in the background.
+
+Comments added to the `Outbox` are written to a journal on disk first and
+are sent by a background thread afterwards. This way submitting a comment
+returns directly and no comment is lost when the server is slow or not
+reachable; it just stays queued, even over restarts of the application.
+
+"""
+import os
+import json
+import time
+import uuid
+import random
+import shutil
+import logging
+import threading
+
+from Qt import QtCore
+
+from .lazy import lazy_import
+
+gazu = lazy_import("gazu")
+requests = lazy_import("requests")
+
+log = logging.getLogger(__name__)
+
+ROOT = os.path.join(os.path.expanduser("~"), ".qtazu", "outbox")
+
+# Names of the gazu exceptions on which retrying will not help, these
+# items are moved aside
+PERMANENT_ERRORS = (
+    "ParameterException",
+    "RouteNotFoundException",
+    "NotAllowedException",
+    "MethodNotAllowedException",
+    "TooBigFileException",
+)
+
+
+class Outbox(QtCore.QObject):
+    """Journaled queue of comments that are sent in a background thread.
+
+    Every item is stored as a JSON file in `root`. The flusher thread sends
+    the items oldest first and keeps their order per task: when an item
+    fails, later items for the same task wait until it succeeded whereas
+    items for other tasks continue to be sent. Failed items are retried
+    with exponential backoff. Items that can never succeed, e.g. because
+    the server refuses them, are moved to the `failed` sub folder.
+
+    Attachments are copied to the `attachments` sub folder when queued so
+    temporary files, e.g. screenshots, survive until the item is sent.
+
+    The state is one of "idle", "sending" or "waiting" (backing off until
+    a retry) and is reported through `state_changed`.
+
+    Example:
+        outbox = Outbox()
+        outbox.item_sent.connect(on_sent)
+        outbox.start()
+
+        outbox.add_comment(task, task_status, "Looks great!", "preview.png")
+
+    """
+
+    state_changed = QtCore.Signal(str)
+    item_sent = QtCore.Signal(dict)
+    item_failed = QtCore.Signal(dict, str)  # Failed attempt, will retry
+    item_dropped = QtCore.Signal(dict, str)  # Failed, moved to `failed`
+
+    def __init__(self, root=None, min_backoff=2.0, max_backoff=300.0,
+                 parent=None):
+        super(Outbox, self).__init__(parent)
+
+        self.root = root or ROOT
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._state = "idle"
+        self._flusher = None
+
+        for path in (self.root,
+                     os.path.join(self.root, "failed"),
+                     os.path.join(self.root, "attachments")):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def state(self):
+        return self._state
+
+    def add_comment(self, task, task_status, comment="", attachment=None):
+        """Queue a comment with an optional preview attachment.
+
+        This only writes the comment to the journal, with a copy of the
+        attachment, and returns directly.
+
+        Args:
+            task (str or dict): The task dict or the task ID.
+            task_status (str or dict): The task status dict or ID.
+            comment (str): Comment text.
+            attachment (str, optional): Path to upload as preview.
+
+        Returns:
+            dict: The queued item.
+
+        Raises:
+            ValueError: When no task status is given, which the server
+                would refuse.
+            IOError: When the attachment can't be copied.
+
+        """
+        if not task_status:
+            raise ValueError("A task status is required to queue a comment")
+
+        item_id = uuid.uuid4().hex
+        if attachment:
+            attachment = self._copy_attachment(item_id, attachment)
+
+        item = {
+            "id": item_id,
+            "created": time.time(),
+            "host": gazu.client.get_host(),
+            "task_id": _get_id(task),
+            "task_status_id": _get_id(task_status),
+            "comment": comment,
+            "attachment": attachment,
+            "comment_id": None,
+            "attempts": 0,
+            "next_attempt": 0,
+            "error": None
+        }
+        self._write(item)
+        log.info("Queued comment for task %s", item["task_id"])
+
+        self._wake.set()
+        return item
+
+    def _copy_attachment(self, item_id, path):
+        """Return the copy of the attachment at *path* for item *item_id*"""
+        ext = os.path.splitext(path)[1]
+        destination = os.path.join(self.root, "attachments", item_id + ext)
+        shutil.copyfile(path, destination)
+        return destination
+
+    def pending(self):
+        """Return all queued items, oldest first"""
+
+        items = []
+        with self._lock:
+            fnames = sorted(fname for fname in os.listdir(self.root)
+                            if fname.endswith(".json"))
+            for fname in fnames:
+                path = os.path.join(self.root, fname)
+                try:
+                    with open(path, "r") as f:
+                        items.append(json.load(f))
+                except (IOError, OSError, ValueError) as exc:
+                    log.warning("Skipping invalid outbox item %s: %s",
+                                path, exc)
+        return items
+
+    def failed(self):
+        """Return all items that were given up on, oldest first"""
+        folder = os.path.join(self.root, "failed")
+        items = []
+        for fname in sorted(os.listdir(folder)):
+            with open(os.path.join(folder, fname), "r") as f:
+                items.append(json.load(f))
+        return items
+
+    def start(self):
+        """Start sending the queued items in a background thread"""
+        if self._flusher and self._flusher.isRunning():
+            return
+
+        self._flusher = _Flusher(self)
+        self._flusher.start()
+
+    def stop(self):
+        """Stop the background thread after the item it is sending"""
+        if not self._flusher:
+            return
+
+        self._flusher.stopped = True
+        self._wake.set()
+        self._flusher.wait()
+        self._flusher = None
+
+    def flush(self):
+        """Send all items that are due now, blocking the calling thread.
+
+        Returns:
+            float or None: Seconds until the next retry is due.
+
+        """
+        now = time.time()
+        host = gazu.client.get_host()
+        blocked_tasks = set()
+        next_attempt = None
+
+        for item in self.pending():
+            if item["host"] != host:
+                # Keep items for other hosts until we're connected to them
+                continue
+
+            task_id = item["task_id"]
+            if task_id in blocked_tasks:
+                # Keep order per task
+                continue
+
+            if item["next_attempt"] > now:
+                blocked_tasks.add(task_id)
+                next_attempt = min(next_attempt or item["next_attempt"],
+                                   item["next_attempt"])
+                continue
+
+            self._set_state("sending")
+            try:
+                self._send(item)
+            except Exception as exc:
+                if _is_permanent(exc):
+                    log.error("Giving up on outbox item %s: %s",
+                              item["id"], exc)
+                    item["error"] = str(exc)
+                    self._move_to_failed(item)
+                    self.item_dropped.emit(item, item["error"])
+                    continue
+
+                item["attempts"] += 1
+                item["error"] = str(exc)
+                backoff = min(self.min_backoff * 2 ** (item["attempts"] - 1),
+                              self.max_backoff)
+                backoff *= random.uniform(0.5, 1.0)
+                item["next_attempt"] = time.time() + backoff
+                self._write(item)
+
+                log.warning("Failed to send outbox item %s, retrying in "
+                            "%.1f seconds: %s", item["id"], backoff, exc)
+                self.item_failed.emit(item, item["error"])
+
+                blocked_tasks.add(task_id)
+                next_attempt = min(next_attempt or item["next_attempt"],
+                                   item["next_attempt"])
+            else:
+                self._remove(item)
+                self.item_sent.emit(item)
+
+        self._set_state("waiting" if next_attempt else "idle")
+        if next_attempt:
+            return max(0.0, next_attempt - time.time())
+
+    def _send(self, item):
+        """Submit the item's comment and preview to CG-Wire"""
+
+        task = {"id": item["task_id"]}
+        if not item["comment_id"]:
+            comment = gazu.task.add_comment(
+                task,
+                {"id": item["task_status_id"]},
+                comment=item["comment"]
+            )
+            log.info("Submitted comment: %s", comment)
+
+            # Store the comment so a failing preview upload does not
+            # result in the comment being submitted again on retry.
+            item["comment_id"] = comment["id"]
+            self._write(item)
+
+        if item["attachment"]:
+            preview = gazu.task.add_preview(task,
+                                            {"id": item["comment_id"]},
+                                            item["attachment"])
+            log.info("Submitted preview: %s", preview)
+
+    def _set_state(self, state):
+        if state != self._state:
+            self._state = state
+            self.state_changed.emit(state)
+
+    def _path(self, item, folder=None):
+        fname = "{0:.6f}_{1}.json".format(item["created"], item["id"])
+        return os.path.join(folder or self.root, fname)
+
+    def _write(self, item):
+        """Atomically write the item to the journal"""
+        path = self._path(item)
+        with self._lock:
+            with open(path + ".tmp", "w") as f:
+                json.dump(item, f)
+            if os.path.exists(path):
+                # Windows does not allow to rename over an existing file
+                os.remove(path)
+            os.rename(path + ".tmp", path)
+
+    def _remove(self, item):
+        with self._lock:
+            os.remove(self._path(item))
+
+            attachment = item["attachment"]
+            folder = os.path.join(self.root, "attachments")
+            if attachment and os.path.dirname(attachment) == folder and \
+                    os.path.exists(attachment):
+                os.remove(attachment)
+
+    def _move_to_failed(self, item):
+        self._write(item)
+        with self._lock:
+            os.rename(self._path(item),
+                      self._path(item, os.path.join(self.root, "failed")))
+
+
+class _Flusher(QtCore.QThread):
+    """Thread sending the outbox items until stopped"""
+
+    def __init__(self, outbox):
+        super(_Flusher, self).__init__()
+        self.outbox = outbox
+        self.stopped = False
+
+    def run(self):
+        while not self.stopped:
+            self.outbox._wake.clear()
+            try:
+                timeout = self.outbox.flush()
+            except Exception:
+                log.exception("Unexpected error flushing outbox")
+                timeout = self.outbox.max_backoff
+
+            # Sleep until new items are added or the next retry is due.
+            # Wake up regularly to pick up a change of host or log in.
+            self.outbox._wake.wait(min(timeout or 30.0, 30.0))
+
+
+def _is_permanent(exc):
+    """Return whether retrying after exception *exc* will not help"""
+    if isinstance(exc, requests.exceptions.RequestException):
+        # Connection errors and time-outs (these are also IOErrors)
+        return False
+    errors = tuple(getattr(gazu.exception, name)
+                   for name in PERMANENT_ERRORS)
+    return isinstance(exc, errors + (IOError, OSError))
+
+
+def _get_id(entity):
+    if isinstance(entity, dict):
+        return entity["id"]
+    return entity
@@ -0,0 +1,276 @@
+"""Record the requests to CG-Wire and replay them without a server.
+
+Recording stores every request and response made through the gazu session
+in a compressed archive. Replaying serves the responses from the archive
+with the original latency or none at all, which allows to develop tools
+offline and to run reproducible benchmarks of the widgets:
+
+    from qtazu import recording
+
+    recording.record("session.jsonl.gz")
+    ...  # Log in and use the widgets
+    recording.stop()
+
+    recording.replay("session.jsonl.gz", latency=0.0)
+
+Note that the archive contains the responses as is, including the access
+tokens returned when logging in, so store it like you would store tokens.
+
+"""
+import io
+import gzip
+import json
+import base64
+import hashlib
+import logging
+import threading
+
+from .lazy import lazy_import
+
+gazu = lazy_import("gazu")
+requests = lazy_import("requests")
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    # Python 2
+    from urlparse import urlparse
+
+log = logging.getLogger(__name__)
+
+# The (prefix, installed adapter, replaced adapter) per session
+_INSTALLED = {}
+
+
+def get_key(method, url, body=None, content_type=None):
+    """Return the key to look up a request in the archive with.
+
+    The key is independent of the host so an archive can be replayed
+    against another host. The body is only included as a hash, with the
+    random boundary of multipart bodies (e.g. uploads) replaced by a fixed
+    one so the same upload gets the same key.
+
+    """
+    parsed = urlparse(url)
+    path = parsed.path
+    if parsed.query:
+        path += "?" + parsed.query
+
+    if body:
+        if not isinstance(body, bytes):
+            body = body.encode("utf-8")
+        boundary = _get_boundary(content_type)
+        if boundary:
+            body = body.replace(boundary, b"boundary")
+        digest = hashlib.sha1(body).hexdigest()
+    else:
+        digest = ""
+    return "{0} {1} {2}".format(method, path, digest)
+
+
+def _get_boundary(content_type):
+    """Return the multipart boundary of *content_type* as bytes, if any"""
+    if not content_type or not content_type.startswith("multipart/"):
+        return None
+
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "boundary" and value:
+            return value.strip('"').encode("ascii")
+    return None
+
+
+def _get_request_key(request):
+    return get_key(request.method,
+                   request.url,
+                   request.body,
+                   request.headers.get("Content-Type"))
+
+
+class Archive(object):
+    """Gzip compressed JSON lines of recorded responses.
+
+    Args:
+        path (str): The archive file.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self._entries = {}
+        self._served = {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load the recorded entries, returns the number of entries"""
+        count = 0
+        entries = {}
+        with gzip.open(self.path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line.decode("utf-8"))
+                entries.setdefault(entry["key"], []).append(entry)
+                count += 1
+
+        with self._lock:
+            self._entries = entries
+            self._served = {}
+        return count
+
+    def open(self):
+        """Open the archive to append recorded entries to"""
+        self._file = gzip.open(self.path, "ab")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def add(self, request, response, content, latency):
+        """Record the *response* to *request*"""
+        entry = {
+            "key": _get_request_key(request),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": dict(response.headers),
+            "content": base64.b64encode(content or b"").decode("ascii"),
+            "latency": latency
+        }
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            self._file.flush()
+
+    def get(self, request):
+        """Return the next recorded entry for *request*, None if missing"""
+        key = _get_request_key(request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            index = self._served.get(key, 0)
+            self._served[key] = index + 1
+            return entries[min(index, len(entries) - 1)]
+
+    @staticmethod
+    def build_response(request, entry):
+        """Return a `requests.Response` for the recorded *entry*"""
+        content = base64.b64decode(entry["content"].encode("ascii"))
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = requests.structures.CaseInsensitiveDict(
+            entry["headers"]
+        )
+        response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers
+        )
+        response.url = request.url
+        response.request = request
+
+        # Mark the content as read so streaming serves it from memory
+        response.raw = io.BytesIO(content)
+        response._content = content
+        response._content_consumed = True
+        return response
+
+
+def _install(session, make_adapter):
+    """Replace the adapters that send the requests of *session*
+
+    Args:
+        make_adapter (function): Return the adapter to install given the
+            adapter it replaces.
+
+    """
+    from .adapters import PREFIXES, get_innermost, replace_adapter
+
+    stop(session)
+
+    installed = []
+    for prefix in PREFIXES:
+        previous = get_innermost(session.get_adapter(prefix))
+        adapter = make_adapter(previous)
+        replace_adapter(session, prefix, previous, adapter)
+        installed.append((prefix, adapter, previous))
+    _INSTALLED[session] = installed
+
+
+def record(path, session=None):
+    """Record all requests of the (gazu) session to the archive at *path*
+
+    The recording wraps the adapters that send the requests, so the limiter
+    of `qtazu.limiter.install` and the default timeout of
+    `qtazu.utils.set_request_timeout` are kept.
+
+    Returns:
+        Archive: The archive recorded to.
+
+    """
+    from .adapters import RecordingHTTPAdapter
+
+    if session is None:
+        session = gazu.client.requests_session
+
+    archive = Archive(path)
+    archive.open()
+    _install(session,
+             lambda adapter: RecordingHTTPAdapter(archive, adapter=adapter))
+    log.info("Recording requests to %s", path)
+    return archive
+
+
+def replay(path, session=None, latency=1.0):
+    """Serve all requests of the (gazu) session from the archive at *path*
+
+    The replay replaces the adapters that send the requests, adapters
+    wrapping them like the limiter of `qtazu.limiter.install` are kept.
+
+    Args:
+        path (str): The recorded archive.
+        session (requests.Session, optional): Defaults to gazu's session.
+        latency (float): Factor of the recorded latency to wait before
+            responding, 1.0 for the original and 0.0 for no latency.
+
+    Returns:
+        Archive: The archive replayed from.
+
+    """
+    from .adapters import ReplayHTTPAdapter
+
+    if session is None:
+        session = gazu.client.requests_session
+
+    archive = Archive(path)
+    count = archive.load()
+    _install(session,
+             lambda adapter: ReplayHTTPAdapter(archive, latency=latency))
+    log.info("Replaying %d requests from %s", count, path)
+    return archive
+
+
+def stop(session=None):
+    """Stop recording or replaying and restore the previous adapters"""
+    if session is None:
+        session = gazu.client.requests_session
+
+    installed = _INSTALLED.pop(session, None)
+    if installed is None:
+        return
+
+    from .adapters import WrappingAdapter, replace_adapter
+
+    for prefix, adapter, previous in installed:
+        adapter.archive.close()
+        if isinstance(adapter, WrappingAdapter):
+            # Keep the adapter it wraps now, e.g. with a new timeout
+            previous = adapter.adapter
+        replace_adapter(session, prefix, adapter, previous)
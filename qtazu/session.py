@@ -0,0 +1,183 @@
+"""Cached login and connectivity state of the gazu session.
+
+Checking whether we're logged in requires a request to the server. The
+`SessionState` caches the result for a short time and refreshes it in the
+background, so widgets can check it as often as they like:
+
+    from qtazu.session import get_session
+
+    session = get_session()
+    session.logged_in_changed.connect(on_logged_in_changed)
+    if session.is_logged_in():
+        ...
+
+"""
+import time
+import logging
+
+from Qt import QtCore
+
+from .lazy import lazy_import
+from .utils import Worker
+
+gazu = lazy_import("gazu")
+requests = lazy_import("requests")
+
+log = logging.getLogger(__name__)
+
+# The state shared in this session, see `get_session()`
+_SESSION = None
+
+
+def _check_session():
+    """Return (connected, user) for the gazu session, runs in a Worker"""
+    try:
+        return True, gazu.client.get_current_user()
+    except gazu.exception.NotAuthenticatedException:
+        return True, None
+    except requests.exceptions.RequestException as exc:
+        log.debug("Unable to connect to CG-Wire: %s", exc)
+        return False, None
+
+
+class SessionState(QtCore.QObject):
+    """Cached current user and connectivity of the gazu session.
+
+    The getters return the cached state without any network I/O. When the
+    state is older than `ttl` seconds a refresh is started in the background
+    and the signals are emitted once the state changed. Until the state is
+    known, e.g. before the first refresh finished, `is_logged_in()` and
+    `is_connected()` return None.
+
+    Setting the state, e.g. on logging in or out, discards the result of
+    the refresh in flight so it can not undo the newer state.
+
+    Args:
+        ttl (float): Seconds the state is considered up to date.
+
+    """
+
+    logged_in_changed = QtCore.Signal(bool)
+    connected_changed = QtCore.Signal(bool)
+    user_changed = QtCore.Signal(object)
+
+    def __init__(self, ttl=30, parent=None):
+        super(SessionState, self).__init__(parent)
+
+        self.ttl = ttl
+
+        self._user = None
+        self._connected = None  # None until known
+        self._known = False  # Whether the state was ever set
+        self._updated = None  # Time of last update, None if outdated
+        self._generation = 0  # Increased on each new state
+        self._worker = None
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self.refresh)
+
+    def is_logged_in(self):
+        """Return whether we're logged in, as last known, None if unknown"""
+        self._refresh_if_stale()
+        if not self._known:
+            return None
+        return self._user is not None
+
+    def is_connected(self):
+        """Return whether the server was reachable, None if unknown"""
+        self._refresh_if_stale()
+        return self._connected
+
+    def is_known(self):
+        return self._known
+
+    def get_user(self):
+        """Return the current user, as last known"""
+        self._refresh_if_stale()
+        return self._user
+
+    def is_stale(self):
+        return self._updated is None or time.time() - self._updated > self.ttl
+
+    def _refresh_if_stale(self):
+        if self.is_stale():
+            self.refresh()
+
+    def start(self, interval=None):
+        """Keep refreshing the state every *interval* seconds (default ttl)"""
+        self._timer.start(int((interval or self.ttl) * 1000))
+        self.refresh()
+
+    def stop(self):
+        self._timer.stop()
+
+    def refresh(self):
+        """Refresh the state in a Worker thread"""
+        if self._worker:
+            return
+
+        self._worker = Worker(_check_session, parent=self)
+        self._worker.generation = self._generation
+        self._worker.finished.connect(self._workerFinished)
+        self._worker.start()
+
+    def refresh_blocking(self):
+        """Refresh the state in the calling thread, e.g. on startup"""
+        self.set_state(*_check_session())
+
+    def invalidate(self):
+        """Mark the state as outdated so next use refreshes it"""
+        self._updated = None
+
+    def _workerFinished(self):
+        """Handle worker finished event."""
+
+        worker = self._worker
+        self._worker = None
+
+        if worker.generation != self._generation:
+            # The state was set meanwhile, e.g. by logging out
+            log.debug("Ignoring outdated session check")
+            return
+
+        if worker.error:
+            log.error("Failed to check session: %s", worker.error[1])
+            return
+
+        self.set_state(*worker.result)
+
+    def set_state(self, connected, user):
+        """Set the state, e.g. after logging in or out
+
+        Args:
+            connected (bool or None): Whether the server is reachable,
+                None to leave it unchanged.
+            user (dict or None): The current user, None if logged out.
+
+        """
+        self._updated = time.time()
+        self._generation += 1
+
+        was_known = self._known
+        was_logged_in = self._user is not None
+        previous_user = self._user
+
+        self._known = True
+        self._user = user
+        if connected is not None and connected != self._connected:
+            self._connected = connected
+            self.connected_changed.emit(connected)
+
+        if (user or {}).get("id") != (previous_user or {}).get("id"):
+            self.user_changed.emit(user)
+
+        if (user is not None) != was_logged_in or not was_known:
+            self.logged_in_changed.emit(user is not None)
+
+
+def get_session():
+    """Return the SessionState shared in this session"""
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = SessionState()
+    return _SESSION
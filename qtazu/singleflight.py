@@ -0,0 +1,99 @@
+"""Coalesce identical concurrent requests into a single request.
+
+Widgets on one panel often ask for the same data at the same time, e.g. the
+same task for the `TaskBreadcrumb` and `get_web_url` or the same thumbnail
+for two `ThumbnailBase` instances. When a call for a key is already in
+flight the other callers wait for it and share its result (or error)
+instead of sending their own request:
+
+    from qtazu import singleflight
+
+    task = singleflight.do(("Task", task_id), gazu.task.get_task, task_id)
+
+    print(singleflight.stats())  # {"requests": 1, "shared": 1}
+
+Callers share the same result object, so they must not modify it.
+
+"""
+import sys
+import threading
+
+
+class _Call(object):
+    """A call in flight"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Run only one call per key at a time and share its result.
+
+    This is thread-safe, the calls are expected to run in `Worker` threads.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = dict()
+        self._stats = {"requests": 0, "shared": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Return the result of `fn()` or of the call in flight for *key*.
+
+        Args:
+            key (hashable): Identifies identical calls, e.g. the url.
+            fn (function): The function to call when none is in flight.
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["requests"] += 1
+            else:
+                self._stats["shared"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error[1]
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception:
+            call.error = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+        return call.result
+
+    def in_flight(self):
+        """Return the keys of the calls in flight"""
+        with self._lock:
+            return list(self._calls.keys())
+
+    def stats(self):
+        """Return the number of "requests" sent and "shared" results"""
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {"requests": 0, "shared": 0}
+
+
+# The group shared by the qtazu widgets and models
+group = SingleFlight()
+
+do = group.do
+stats = group.stats
+reset_stats = group.reset_stats
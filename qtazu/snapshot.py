@@ -0,0 +1,221 @@
+"""Persistent local snapshot of the reference data per CG-Wire host.
+
+The reference data (persons, task statuses and task types) rarely changes,
+yet every session would fetch it in full before the widgets can show it.
+The snapshot stores it on disk so the next session starts with the data
+from last time, after which it is revalidated in the background:
+
+    from qtazu.snapshot import load_snapshot
+
+    load_snapshot()
+
+Only the records that changed since the snapshot are applied to
+`qtazu.cache.references` and the live models, see
+`qtazu.cache.update_references`.
+
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+
+from Qt import QtCore
+
+from .utils import Worker
+from . import cache
+from .lazy import lazy_import
+
+gazu = lazy_import("gazu")
+
+log = logging.getLogger(__name__)
+
+FOLDER = os.path.join(os.path.expanduser("~"), ".qtazu", "snapshots")
+
+# The functions to fetch the references in the snapshot with
+REFERENCES = {
+    "persons": lambda: gazu.person.all_persons(),
+    "task_statuses": lambda: gazu.task.all_task_statuses(),
+    "task_types": lambda: gazu.task.all_task_types(),
+}
+
+# Keep loaded snapshots alive until they are revalidated
+_RUNNING = []
+
+
+def get_path(host=None, folder=FOLDER):
+    """Return the snapshot file for host, defaults to the gazu host"""
+    host = host or gazu.client.get_host()
+    name = hashlib.sha1(host.encode("utf-8")).hexdigest()
+    return os.path.join(folder, name + ".json")
+
+
+def diff_records(old, new):
+    """Return the (changed, removed) records between two lists of records.
+
+    Args:
+        old (list): The previous records.
+        new (list): The current records.
+
+    Returns:
+        tuple: The new or updated records and the ids of removed records.
+
+    """
+    previous = dict((record["id"], record) for record in old)
+    current = set(record["id"] for record in new)
+
+    changed = [record for record in new
+               if previous.get(record["id"]) != record]
+    removed = [record_id for record_id in previous
+               if record_id not in current]
+    return changed, removed
+
+
+def _revalidate(references):
+    """Fetch the references and apply their changes, runs in a Worker"""
+    stats = {}
+    for name, fetch in REFERENCES.items():
+        records = fetch()
+
+        previous = cache.references.get(name)
+        if previous is None:
+            previous = references.get(name, [])
+            cache.references[name] = previous
+
+        changed, removed = diff_records(previous, records)
+        if changed or removed:
+            cache.update_references(name, changed, removed)
+
+        references[name] = records
+        stats[name] = {"changed": len(changed), "removed": len(removed)}
+    return stats
+
+
+class SnapshotStore(QtCore.QObject):
+    """Load, revalidate and save the snapshot of a host's reference data.
+
+    Args:
+        host (str, optional): The CG-Wire host, defaults to the gazu host.
+        folder (str, optional): The folder to store the snapshots in.
+
+    """
+
+    revalidated = QtCore.Signal(dict)
+    failed = QtCore.Signal(str)
+
+    def __init__(self, host=None, folder=FOLDER, parent=None):
+        super(SnapshotStore, self).__init__(parent)
+
+        self.host = host or gazu.client.get_host()
+        self.path = get_path(self.host, folder=folder)
+
+        self._references = {}
+        self._synced_at = None
+        self._worker = None
+
+    def synced_at(self):
+        """Return the time the snapshot was last revalidated, if ever"""
+        return self._synced_at
+
+    def load(self):
+        """Load the snapshot into `qtazu.cache.references`
+
+        References that are cached already are left untouched.
+
+        Returns:
+            bool: Whether a snapshot was loaded.
+
+        """
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError) as exc:
+            log.warning("Unable to read snapshot %s: %s", self.path, exc)
+            return False
+
+        if data.get("host") != self.host:
+            return False
+
+        self._synced_at = data.get("synced_at")
+        self._references = data.get("references", {})
+        for name, records in self._references.items():
+            if name in REFERENCES and name not in cache.references:
+                cache.references[name] = records
+        return True
+
+    def save(self):
+        """Write the snapshot to disk"""
+        folder = os.path.dirname(self.path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        data = {
+            "host": self.host,
+            "synced_at": self._synced_at,
+            "references": self._references
+        }
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(data, f)
+        if os.path.exists(self.path):
+            # Windows does not allow to rename over an existing file
+            os.remove(self.path)
+        os.rename(self.path + ".tmp", self.path)
+
+    def is_revalidating(self):
+        return self._worker is not None
+
+    def revalidate(self):
+        """Fetch the references in a Worker thread and apply the changes"""
+        if self._worker:
+            return
+
+        self._worker = Worker(_revalidate,
+                              args=[dict(self._references)],
+                              parent=self)
+        self._worker.finished.connect(self._workerFinished)
+        self._worker.start(QtCore.QThread.LowPriority)
+
+    def _workerFinished(self):
+        """Handle worker finished event."""
+
+        worker = self._worker
+        self._worker = None
+
+        if worker.error:
+            message = str(worker.error[1])
+            log.warning("Failed to revalidate snapshot: %s", message)
+            self.failed.emit(message)
+            return
+
+        self._references = worker.args[0]
+        self._synced_at = time.time()
+        try:
+            self.save()
+        except (IOError, OSError) as exc:
+            log.warning("Unable to write snapshot %s: %s", self.path, exc)
+
+        log.debug("Revalidated snapshot: %s", worker.result)
+        self.revalidated.emit(worker.result)
+
+
+def load_snapshot(host=None):
+    """Load the snapshot of host and revalidate it in the background.
+
+    Args:
+        host (str, optional): The CG-Wire host, defaults to the gazu host.
+
+    Returns:
+        SnapshotStore: The store being revalidated.
+
+    """
+    store = SnapshotStore(host)
+    store.load()
+
+    _RUNNING.append(store)
+    store.revalidated.connect(lambda stats: _RUNNING.remove(store))
+    store.failed.connect(lambda message: _RUNNING.remove(store))
+    store.revalidate()
+    return store
@@ -0,0 +1,243 @@
+"""Persistent CG-Wire access tokens and their background refresh.
+
+Storing the tokens is opt-in. When stored a tool can restore the session on
+startup without showing the `Login` dialog:
+
+    from qtazu import tokens
+
+    if not tokens.restore_session("https://zou-server-url/api"):
+        Login(remember=True).exec_()
+
+    refresher = tokens.TokenRefresher(store=True)
+    refresher.start()
+
+The tokens are stored per host in a JSON file only readable by the user.
+
+"""
+import os
+import json
+import time
+import base64
+import logging
+
+from Qt import QtCore
+
+from .utils import Worker
+from . import cache
+from .lazy import lazy_import
+
+gazu = lazy_import("gazu")
+
+log = logging.getLogger(__name__)
+
+PATH = os.path.join(os.path.expanduser("~"), ".qtazu", "tokens.json")
+
+# Maximum seconds to schedule a refresh for at once, the interval of a
+# QTimer is an int of milliseconds so longer delays are rescheduled
+MAX_DELAY = 24 * 60 * 60
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError) as exc:
+        log.warning("Unable to read tokens from %s: %s", path, exc)
+        return {}
+
+
+def _write(data, path):
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    # Only allow the user to read the tokens
+    fd = os.open(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    if os.path.exists(path):
+        # Windows does not allow to rename over an existing file
+        os.remove(path)
+    os.rename(path + ".tmp", path)
+
+
+def save_tokens(host=None, tokens=None, path=PATH):
+    """Store the tokens for host, defaults to the current gazu session"""
+    host = host or gazu.client.get_host()
+    tokens = tokens or gazu.client.tokens
+
+    data = _read(path)
+    data[host] = {
+        "access_token": tokens.get("access_token", ""),
+        "refresh_token": tokens.get("refresh_token", "")
+    }
+    _write(data, path)
+
+
+def load_tokens(host=None, path=PATH):
+    """Return the stored tokens for host, None if not stored"""
+    host = host or gazu.client.get_host()
+    return _read(path).get(host)
+
+
+def clear_tokens(host=None, path=PATH):
+    """Remove the stored tokens for host, e.g. on log out"""
+    host = host or gazu.client.get_host()
+    data = _read(path)
+    if data.pop(host, None) is not None:
+        _write(data, path)
+
+
+def get_token_expiry(token):
+    """Return the expiry timestamp of the JSON Web Token, None if unknown"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        data = json.loads(base64.urlsafe_b64decode(payload.encode("ascii"))
+                          .decode("utf-8"))
+        return data.get("exp")
+    except (IndexError, ValueError, TypeError, AttributeError):
+        return None
+
+
+def is_expired(token, margin=0):
+    """Return whether the token is expired or expires within margin seconds"""
+    expiry = get_token_expiry(token)
+    if expiry is None:
+        return not token
+    return expiry - margin <= time.time()
+
+
+def refresh_access_token():
+    """Request a new access token using the refresh token.
+
+    Returns:
+        dict: The gazu client tokens with the new access token.
+
+    """
+    tokens = dict(gazu.client.tokens)
+    response = gazu.client.requests_session.get(
+        gazu.client.get_full_url("auth/refresh-token"),
+        headers={"Authorization": "Bearer %s" % tokens["refresh_token"]}
+    )
+    gazu.client.check_status(response, "auth/refresh-token")
+
+    tokens["access_token"] = response.json()["access_token"]
+    gazu.client.set_tokens(tokens)
+    return tokens
+
+
+def restore_session(host, path=PATH):
+    """Log in to host using the stored tokens.
+
+    When the access token has expired it is refreshed first, which is the
+    only request this makes. It does not verify the tokens otherwise.
+    When the refresh fails the previous host and tokens of gazu are kept.
+
+    Returns:
+        bool: Whether usable tokens were restored.
+
+    """
+    tokens = load_tokens(host, path=path)
+    if not tokens or is_expired(tokens["refresh_token"]):
+        return False
+
+    previous_host = gazu.client.get_host()
+    previous_tokens = gazu.client.tokens
+
+    gazu.client.set_host(host)
+    gazu.client.set_tokens(dict(tokens))
+
+    if is_expired(tokens["access_token"], margin=60):
+        try:
+            save_tokens(host, refresh_access_token(), path=path)
+        except Exception as exc:
+            log.warning("Unable to refresh stored tokens: %s", exc)
+            gazu.client.set_host(previous_host)
+            gazu.client.set_tokens(previous_tokens)
+            return False
+
+    cache.clear_session_data()
+    return True
+
+
+class TokenRefresher(QtCore.QObject):
+    """Refresh the gazu access token in the background before it expires.
+
+    This way requests never fail on an expired access token first.
+
+    Args:
+        margin (int): Seconds before expiry to refresh the access token.
+        store (bool): Whether to store the refreshed tokens on disk.
+        path (str): The file to store the tokens in.
+
+    """
+
+    refreshed = QtCore.Signal(dict)
+    failed = QtCore.Signal(str)
+
+    def __init__(self, margin=120, store=False, path=PATH, parent=None):
+        super(TokenRefresher, self).__init__(parent)
+
+        self.margin = margin
+        self.store = store
+        self.path = path
+
+        self._worker = None
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._on_timeout)
+
+    def start(self):
+        """Schedule the refresh for the current access token"""
+        expiry = get_token_expiry(gazu.client.tokens.get("access_token"))
+        if expiry is None:
+            log.debug("No access token expiry to schedule a refresh for")
+            return
+
+        delay = max(0.0, expiry - self.margin - time.time())
+        self._timer.start(int(min(delay, MAX_DELAY) * 1000))
+
+    def stop(self):
+        self._timer.stop()
+
+    def _on_timeout(self):
+        """Refresh the access token, unless the delay was too long to wait"""
+        expiry = get_token_expiry(gazu.client.tokens.get("access_token"))
+        if expiry is not None and expiry - self.margin > time.time():
+            self.start()
+            return
+        self.refresh()
+
+    def refresh(self):
+        """Refresh the access token in a Worker thread now"""
+        if self._worker:
+            return
+
+        self._worker = Worker(refresh_access_token, parent=self)
+        self._worker.finished.connect(self._workerFinished)
+        self._worker.start()
+
+    def _workerFinished(self):
+        """Handle worker finished event."""
+
+        worker = self._worker
+        self._worker = None
+
+        if worker.error:
+            message = str(worker.error[1])
+            log.warning("Failed to refresh access token: %s", message)
+            self.failed.emit(message)
+
+            # Try again soon, unless the refresh token expired as well
+            if not is_expired(gazu.client.tokens.get("refresh_token")):
+                self._timer.start(30 * 1000)
+            return
+
+        tokens = worker.result
+        if self.store:
+            save_tokens(tokens=tokens, path=self.path)
+        self.refreshed.emit(tokens)
+        self.start()
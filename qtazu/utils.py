@@ -1,18 +1,35 @@
+import os
 import sys
+import math
+import atexit
+import shutil
 import logging
-import requests.exceptions
+import tempfile
+import threading
 
-import gazu
-from Qt import QtCore
+from Qt import QtCore, QtGui
+
+from .lazy import lazy_import
+from . import cache
+from . import singleflight
+
+gazu = lazy_import("gazu")
+requests = lazy_import("requests")
 
 log = logging.getLogger(__name__)
 
+# The temporary directory of this process, see `get_temp_dir()`
+_TEMP_DIR = None
+_TEMP_DIR_LOCK = threading.Lock()
+
 
-def get_cgwire_data(data):
+def get_cgwire_data(data, cached=False):
     """Return data from CG-Wire using `type` and `id`.
 
     Args:
         data (dict): Dictionary containing "type" and "id" of the query.
+        cached (bool): Whether to return the result from `qtazu.cache`
+            if it was fetched before and store it there if not.
 
     Returns:
          dict: The result from Gazu.
@@ -29,7 +46,12 @@ def get_cgwire_data(data):
 
     # Request the result by id
     fn = getattr(module, "get_{0}".format(fn_name))
-    return fn(data["id"])
+    key = (data["type"], data["id"])
+    if cached:
+        return cache.entities.get_or_fetch(key,
+                                           singleflight.do,
+                                           key, fn, data["id"])
+    return singleflight.do(key, fn, data["id"])
 
 
 def get_web_url(entity=None):
@@ -64,7 +86,7 @@ def get_web_url(entity=None):
         return url
 
     # Ensure we get the "full" entity with parent data
-    entity = get_cgwire_data(entity)
+    entity = get_cgwire_data(entity, cached=True)
 
     if entity["type"] == "Task":
         # /productions/{project-id}/{for_entity}/tasks/{task_id}
@@ -76,17 +98,23 @@ def get_web_url(entity=None):
         )
     elif entity["type"] == "Asset" or entity["type"] == "Shot":
         # For assets and shots it must be prefixed with project
-        return url + _format_url(entity["project"]) + _format_url(entity)
+        project = entity.get("project") or {"type": "Project",
+                                            "id": entity["project_id"]}
+        return url + _format_url(project) + _format_url(entity)
 
     return url + _format_url(entity)
 
 
-def is_valid_api_url(url):
+def is_valid_api_url(url, timeout=None):
     """Return whether the API url is valid for zou/gazu
 
     This checks the JSON response from the `host/api` url
     to see whether it contains the api == Zou value.
 
+    Args:
+        url (str): The url to check.
+        timeout (float or tuple, optional): The requests timeout.
+
     Returns:
         bool: Whether the url is the /api url for CG-Wire's zou.
 
@@ -94,7 +122,11 @@ def is_valid_api_url(url):
     # Just use the gazu client's request session
     session = gazu.client.requests_session
 
-    result = session.get(url)
+    try:
+        result = session.get(url, timeout=timeout)
+    except (requests.exceptions.RequestException, ValueError):
+        # Unable to connect or not a valid url at all
+        return False
     if result.status_code != 200:
         # The status is not as expected from a valid CG-Wire zou
         # api url. So we consider this to be an invalid response.
@@ -113,8 +145,56 @@ def is_valid_api_url(url):
     return False
 
 
-def is_logged_in():
-    """Return whether you are currently logged in with Gazu"""
+def set_request_timeout(connect=None, read=None, session=None):
+    """Set the default timeout for all requests made by gazu.
+
+    Gazu itself doesn't set any timeout, so without it a request to an
+    unreachable host hangs until the operating system's TCP timeout.
+
+    The timeout is set on the adapter that sends the requests, any adapter
+    wrapping it (e.g. of `qtazu.limiter.install`) is kept. Adapters that
+    do not connect to a server, e.g. `qtazu.recording.replay`, are left
+    alone.
+
+    Args:
+        connect (float, optional): Seconds to wait for a connection.
+        read (float, optional): Seconds to wait for the server to send
+            data once connected.
+        session (requests.Session, optional): Defaults to gazu's session.
+
+    """
+    import requests.adapters
+    from .adapters import (
+        PREFIXES,
+        TimeoutHTTPAdapter,
+        get_innermost,
+        replace_adapter
+    )
+
+    if session is None:
+        session = gazu.client.requests_session
+
+    for prefix in PREFIXES:
+        current = get_innermost(session.get_adapter(prefix))
+        if isinstance(current, TimeoutHTTPAdapter):
+            current.timeout = (connect, read)
+        elif isinstance(current, requests.adapters.HTTPAdapter):
+            adapter = TimeoutHTTPAdapter(timeout=(connect, read))
+            replace_adapter(session, prefix, current, adapter)
+
+
+def is_logged_in(cached=False):
+    """Return whether you are currently logged in with Gazu
+
+    Args:
+        cached (bool): Return the state cached by `qtazu.session` instead,
+            which does not block on a request to the server. This is None
+            while the state is not known yet.
+
+    """
+    if cached:
+        from .session import get_session
+        return get_session().is_logged_in()
 
     try:
         user = gazu.client.get_current_user()
@@ -130,12 +210,110 @@ def is_logged_in():
 
 
 def log_out():
-    """Log out from Gazu by clearing its access tokens."""
-    tokens = {
+    """Log out from Gazu by clearing its access tokens.
+
+    This also removes the tokens stored for the host, if any, and clears
+    the cached data of the user.
+
+    """
+    from . import tokens
+    from .session import get_session
+    tokens.clear_tokens()
+    cache.clear_session_data()
+    get_session().set_state(None, None)
+
+    gazu.client.tokens = {
         "access_token": "",
         "refresh_token": ""
     }
-    gazu.client.tokens = tokens
+
+
+def get_temp_dir():
+    """Return a temporary directory that is removed when Python exits"""
+    global _TEMP_DIR
+    with _TEMP_DIR_LOCK:
+        if _TEMP_DIR is None:
+            _TEMP_DIR = tempfile.mkdtemp(prefix="qtazu_")
+            atexit.register(shutil.rmtree, _TEMP_DIR, True)
+        return _TEMP_DIR
+
+
+def downscale_image(path, max_size=None, max_bytes=None):
+    """Write a resampled copy of the image at *path* within the given limits.
+
+    The image is decoded at the reduced size directly through
+    `QImageReader.setScaledSize` so large images never get fully decoded.
+    This only uses `QImage` and is thus safe to run in a `Worker` thread.
+
+    When the file is not a (still) image that can be read, is already within
+    the limits or the resampled result would not be smaller the original
+    path is returned as is. The copy is written to `get_temp_dir()`, remove
+    it once it is uploaded.
+
+    Args:
+        path (str): The image file to downscale.
+        max_size (int, optional): Maximum width or height in pixels.
+        max_bytes (int, optional): Maximum file size in bytes.
+
+    Returns:
+        tuple: (path, bytes_saved) for the file that should be uploaded.
+
+    """
+
+    reader = QtGui.QImageReader(path)
+    if not reader.canRead() or reader.imageCount() > 1:
+        # Not an image or an animated image we can't resample
+        return path, 0
+
+    original_bytes = os.path.getsize(path)
+    size = reader.size()
+    if not size.isValid():
+        # Format doesn't provide the size without decoding it
+        size = reader.read().size()
+        if not size.isValid():
+            return path, 0
+
+    scale = 1.0
+    if max_size and max(size.width(), size.height()) > max_size:
+        scale = max_size / float(max(size.width(), size.height()))
+
+    if scale == 1.0 and (not max_bytes or original_bytes <= max_bytes):
+        # Already within limits
+        return path, 0
+
+    suffix = os.path.splitext(path)[-1] or ".png"
+    output = tempfile.NamedTemporaryFile(prefix="preview_",
+                                         suffix=suffix,
+                                         dir=get_temp_dir(),
+                                         delete=False).name
+
+    # Shrink until the file fits in `max_bytes`, but give up after a few
+    # attempts as some images (e.g. noise) hardly compress any further.
+    output_bytes = original_bytes
+    for _ in range(5):
+        reader = QtGui.QImageReader(path)
+        reader.setScaledSize(QtCore.QSize(
+            max(1, int(size.width() * scale)),
+            max(1, int(size.height() * scale))
+        ))
+        image = reader.read()
+        if image.isNull() or not image.save(output):
+            log.warning("Unable to downscale image: %s", path)
+            output_bytes = original_bytes
+            break
+
+        output_bytes = os.path.getsize(output)
+        if not max_bytes or output_bytes <= max_bytes:
+            break
+
+        # The file size roughly scales with the pixel count
+        scale *= math.sqrt(max_bytes / float(output_bytes)) * 0.95
+
+    if output_bytes >= original_bytes:
+        os.remove(output)
+        return path, 0
+
+    return output, original_bytes - output_bytes
 
 
 class Worker(QtCore.QThread):
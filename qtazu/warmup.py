@@ -0,0 +1,174 @@
+"""Prefetch reference data into the qtazu caches after logging in.
+
+Without warming up, the first time each widget opens it has to wait for
+its data to be fetched. The `WarmUp` fetches the data of its plan
+concurrently in low priority background threads right after logging in:
+
+    from qtazu.warmup import warm_up
+
+    login = Login()
+    login.logged_in.connect(lambda success: success and warm_up())
+
+Or simply use `Login(warm_up=True)`.
+
+"""
+import time
+import logging
+
+from Qt import QtCore
+
+from .utils import Worker
+from . import cache
+from .lazy import lazy_import
+
+gazu = lazy_import("gazu")
+
+log = logging.getLogger(__name__)
+
+
+def _fetch_avatars():
+    """Download the avatars of all persons into `qtazu.cache.images`"""
+    from .widgets.thumbnail import download_thumbnail
+
+    persons = cache.references.get_or_fetch("persons",
+                                            gazu.person.all_persons)
+    for person in persons:
+        if not person.get("has_avatar"):
+            continue
+        url = "pictures/thumbnails/persons/{0}.png".format(person["id"])
+        if url not in cache.images:
+            data = download_thumbnail(url)
+            if data is not None:
+                cache.images[url] = data
+
+
+# The functions to fetch each step of a plan with
+STEPS = {
+    "persons": lambda: cache.references.get_or_fetch(
+        "persons", gazu.person.all_persons
+    ),
+    "task_statuses": lambda: cache.references.get_or_fetch(
+        "task_statuses", gazu.task.all_task_statuses
+    ),
+    "task_types": lambda: cache.references.get_or_fetch(
+        "task_types", gazu.task.all_task_types
+    ),
+    "user_tasks": lambda: cache.references.get_or_fetch(
+        "user_tasks", gazu.user.all_tasks_to_do
+    ),
+    "avatars": _fetch_avatars,
+}
+
+# Steps that only start once another step is done
+DEPENDENCIES = {
+    "avatars": "persons",
+}
+
+DEFAULT_PLAN = ["persons", "task_statuses", "task_types", "user_tasks",
+                "avatars"]
+
+# Keep started warm ups alive until they are done
+_RUNNING = []
+
+
+class WarmUp(QtCore.QObject):
+    """Fetch the steps of a plan concurrently into the qtazu caches.
+
+    Each step runs in its own low priority Worker thread, except steps
+    that depend on another step, which start once that one is done.
+    The seconds each step took are available through `stats()`.
+
+    Args:
+        plan (list, optional): Names of the `STEPS` to run, defaults
+            to `DEFAULT_PLAN`.
+
+    """
+
+    step_finished = QtCore.Signal(str, float)
+    finished = QtCore.Signal(dict)
+
+    def __init__(self, plan=None, parent=None):
+        super(WarmUp, self).__init__(parent)
+
+        self.plan = list(plan or DEFAULT_PLAN)
+        for step in self.plan:
+            assert step in STEPS, "Unknown warm up step: %s" % step
+
+        self._workers = {}
+        self._stats = {}
+        self._start = None
+
+    def stats(self):
+        """Return the seconds each finished step took and the "total" """
+        return dict(self._stats)
+
+    def is_running(self):
+        return bool(self._workers)
+
+    def start(self):
+        self._start = time.time()
+        self._stats = {}
+        for step in self.plan:
+            if DEPENDENCIES.get(step) not in self.plan:
+                self._start_step(step)
+
+        if not self._workers:
+            self._stats["total"] = 0.0
+            self.finished.emit(self.stats())
+
+    def _start_step(self, step):
+        worker = Worker(STEPS[step], parent=self)
+        worker.step = step
+        worker.started_at = time.time()
+        worker.finished.connect(self._workerFinished)
+        self._workers[step] = worker
+        worker.start(QtCore.QThread.LowPriority)
+
+    def _workerFinished(self):
+        """Handle worker finished event."""
+
+        worker = self.sender()
+        step = worker.step
+        self._workers.pop(step, None)
+
+        duration = time.time() - worker.started_at
+        if worker.error:
+            log.warning("Warm up of %s failed: %s", step, worker.error[1])
+        else:
+            self._stats[step] = duration
+            log.debug("Warmed up %s in %.3f seconds", step, duration)
+        self.step_finished.emit(step, duration)
+
+        if step == "task_statuses" and not worker.error:
+            # Load the shared model with the statuses of this session
+            from .models.taskstatuses import get_shared_model
+            get_shared_model().set_statuses(worker.result)
+
+        # Start the steps waiting for this one
+        for dependent, dependency in DEPENDENCIES.items():
+            if dependency == step and dependent in self.plan:
+                self._start_step(dependent)
+
+        if not self._workers:
+            self._stats["total"] = time.time() - self._start
+            log.info("Warm up finished in %.3f seconds",
+                     self._stats["total"])
+            self.finished.emit(self.stats())
+
+
+def warm_up(plan=None):
+    """Start warming up the caches in the background.
+
+    Args:
+        plan (list, optional): Names of the `STEPS` to run, defaults
+            to `DEFAULT_PLAN`.
+
+    Returns:
+        WarmUp: The started warm up.
+
+    """
+    warmup = WarmUp(plan)
+    _RUNNING.append(warmup)
+    warmup.finished.connect(lambda stats: _RUNNING.remove(warmup))
+    warmup.start()
+    return warmup
@@ -0,0 +1,274 @@
+"""Detect and report stalls of the GUI thread caused by qtazu.
+
+Some code paths still block the Qt event loop, e.g. on a slow server. The
+opt-in `StallWatchdog` notices when the GUI thread did not process events
+for longer than a threshold, captures the Python stack of the GUI thread
+and tags the qtazu function it was blocked in:
+
+    from qtazu import watchdog
+
+    dog = watchdog.start(threshold=200)
+    ...
+    for function, stats in dog.summary().items():
+        print(function, stats["count"], stats["max"])
+
+Each stall is logged as a warning once it has ended.
+
+The heartbeat keeps beating while code waits in a loop that processes
+events, e.g. for a Worker to finish. Those busy-waits are only reported
+when they are marked with `busy_wait()`:
+
+    with watchdog.busy_wait():
+        while self._worker:
+            app.processEvents()
+
+"""
+import os
+import sys
+import time
+import logging
+import threading
+import traceback
+import contextlib
+import collections
+
+from Qt import QtCore
+
+log = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+# The watchdog shared in this session, see `start()`
+_WATCHDOG = None
+
+# The (start time, qtazu function) of the busy-wait per thread id
+_BUSY_WAITS = {}
+
+
+def get_qtazu_function(frame):
+    """Return the innermost qtazu function of *frame*'s stack, if any
+
+    Returns:
+        str: The function as "module.function", e.g.
+            "qtazu.widgets.login.on_login".
+
+    """
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(ROOT) and \
+                frame.f_globals.get("__name__") != __name__:
+            return "{0}.{1}".format(frame.f_globals.get("__name__"),
+                                    frame.f_code.co_name)
+        frame = frame.f_back
+    return None
+
+
+@contextlib.contextmanager
+def busy_wait():
+    """Mark the code in the with block as waiting while processing events
+
+    A busy-wait lasting longer than the threshold is reported as a stall of
+    the qtazu function it was started from. Nested busy-waits count as
+    the outermost one.
+
+    """
+    thread_id = threading.current_thread().ident
+    outermost = thread_id not in _BUSY_WAITS
+    if outermost:
+        _BUSY_WAITS[thread_id] = (time.time(),
+                                  get_qtazu_function(sys._getframe()))
+    try:
+        yield
+    finally:
+        if outermost:
+            _BUSY_WAITS.pop(thread_id, None)
+
+
+class StallWatchdog(QtCore.QObject):
+    """Report when the GUI thread is blocked for more than `threshold` ms.
+
+    A timer in the GUI thread beats every `interval` ms while a monitor
+    thread checks the beats. When the beat is late, or a `busy_wait()`
+    lasts too long, the monitor samples the GUI thread's stack every
+    `interval` ms until the stall has ended.
+
+    It must be started from the GUI thread.
+
+    Args:
+        threshold (int): Milliseconds after which the GUI thread is stalled.
+        interval (int): Milliseconds between beats and samples.
+        history (int): Number of stalls to keep.
+
+    """
+
+    stalled = QtCore.Signal(dict)
+
+    def __init__(self, threshold=200, interval=50, history=100, parent=None):
+        super(StallWatchdog, self).__init__(parent)
+
+        self.threshold = threshold
+        self.interval = interval
+
+        self._beat = time.time()
+        self._thread_id = None
+        self._stalls = collections.deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor = None
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self._on_beat)
+
+    def _on_beat(self):
+        self._beat = time.time()
+
+    def is_running(self):
+        return self._monitor is not None
+
+    def start(self):
+        if self._monitor is not None:
+            return
+
+        self._thread_id = threading.current_thread().ident
+        self._beat = time.time()
+        self._timer.start(self.interval)
+
+        self._stop.clear()
+        self._monitor = threading.Thread(target=self._run,
+                                         name="qtazu-watchdog")
+        self._monitor.daemon = True
+        self._monitor.start()
+
+    def stop(self):
+        if self._monitor is None:
+            return
+
+        self._timer.stop()
+        self._stop.set()
+        self._monitor.join()
+        self._monitor = None
+
+    def _sample(self):
+        """Return the current frame of the GUI thread"""
+        return sys._current_frames().get(self._thread_id)
+
+    def _run(self):
+        """Check the beats of the GUI thread, runs in the monitor thread"""
+        interval = self.interval / 1000.0
+        threshold = self.threshold / 1000.0
+
+        stall = None
+        while not self._stop.wait(interval):
+            now = time.time()
+            busy = _BUSY_WAITS.get(self._thread_id)
+            if busy is not None and now - busy[0] > threshold:
+                # Waiting while processing events, so the beat is on time
+                started, function = busy
+            elif now - self._beat > threshold:
+                started, function = self._beat, None
+                busy = None
+            else:
+                if stall is not None:
+                    self._finish(stall)
+                    stall = None
+                continue
+
+            frame = self._sample()
+            if frame is None:
+                continue
+            if function is None:
+                function = get_qtazu_function(frame)
+
+            if stall is None:
+                stall = {
+                    "started": started,
+                    "busy_wait": busy is not None,
+                    "stack": "".join(traceback.format_stack(frame)),
+                    "functions": collections.Counter()
+                }
+            if busy is not None:
+                stall["ended"] = now
+            stall["functions"][function] += 1
+            del frame
+
+        if stall is not None:
+            self._finish(stall)
+
+    def _finish(self, stall):
+        """Store, log and emit the ended *stall*"""
+        functions = stall.pop("functions")
+        function = functions.most_common(1)[0][0]
+
+        if not stall["busy_wait"]:
+            stall["ended"] = self._beat
+        stall["duration"] = (stall["ended"] - stall["started"]) * 1000.0
+        stall["function"] = function
+
+        with self._lock:
+            self._stalls.append(stall)
+
+        log.warning("GUI thread stalled for %d ms in %s\n%s",
+                    stall["duration"],
+                    function or "non-qtazu code",
+                    stall["stack"])
+        self.stalled.emit(stall)
+
+    def stalls(self, function=None):
+        """Return the recorded stalls, optionally only of *function*
+
+        Returns:
+            list: Dicts with the "started" and "ended" time, "duration" in
+                milliseconds, "function", "stack" and whether it was a
+                "busy_wait" of each stall.
+
+        """
+        with self._lock:
+            return [dict(stall) for stall in self._stalls
+                    if function is None or stall["function"] == function]
+
+    def summary(self):
+        """Return the count, total and max milliseconds per function"""
+        summary = {}
+        for stall in self.stalls():
+            stats = summary.setdefault(stall["function"], {
+                "count": 0,
+                "total": 0.0,
+                "max": 0.0
+            })
+            stats["count"] += 1
+            stats["total"] += stall["duration"]
+            stats["max"] = max(stats["max"], stall["duration"])
+        return summary
+
+    def clear(self):
+        with self._lock:
+            self._stalls.clear()
+
+
+def get_watchdog():
+    """Return the watchdog shared in this session, None if not started"""
+    return _WATCHDOG
+
+
+def start(threshold=200, interval=50):
+    """Start the shared watchdog from the GUI thread
+
+    Args:
+        threshold (int): Milliseconds after which the GUI thread is stalled.
+        interval (int): Milliseconds between beats and samples.
+
+    Returns:
+        StallWatchdog: The started watchdog.
+
+    """
+    global _WATCHDOG
+    if _WATCHDOG is None:
+        _WATCHDOG = StallWatchdog(threshold=threshold, interval=interval)
+    _WATCHDOG.start()
+    return _WATCHDOG
+
+
+def stop():
+    """Stop the shared watchdog"""
+    if _WATCHDOG is not None:
+        _WATCHDOG.stop()
@@ -3,17 +3,17 @@ import logging
 import tempfile
 import platform
 
-import gazu
 from Qt import QtWidgets, QtCore, QtGui
 
-from .screenmarquee import ScreenMarquee
 from .taskbreadcrumb import TaskBreadcrumb
+from ..utils import Worker, downscale_image, get_temp_dir
+from ..models.taskstatuses import TaskStatusModel, get_shared_model
+from ..watchdog import busy_wait
+from ..lazy import lazy_import
+
+gazu = lazy_import("gazu")
 
-# Use NSURL as a workaround to pyside/Qt4 bug QTBUG40449
-# behaviour for dragging and dropping on OSx
 platform_system = platform.system()
-if platform_system == 'Darwin':
-    from Foundation import NSURL
 
 PLACEHOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)),
                            "res", "icon", "camera.png")
@@ -56,7 +56,9 @@ class DragDropLabel(ClickableLabel):
             files = []
             for url in event.mimeData().urls():
                 if platform_system == 'Darwin':
-                    # Workaround for OSx dragging and dropping QTBUG40449
+                    # Use NSURL as a workaround to pyside/Qt4 bug
+                    # QTBUG40449 behaviour for dragging and dropping on OSx
+                    from Foundation import NSURL
                     ns_url = NSURL.URLWithString_(str(url.toString()))
                     fname = str(ns_url.filePathURL().path())
                 else:
@@ -67,6 +69,13 @@ class DragDropLabel(ClickableLabel):
             self.dropped.emit(files)
 
 
+def _remove_preview(path):
+    try:
+        os.remove(path)
+    except OSError as exc:
+        log.warning("Failed to remove preview %s: %s", path, exc)
+
+
 class CommentWidget(QtWidgets.QDialog):
     """A CG-Wire comment widget
 
@@ -79,16 +88,19 @@ class CommentWidget(QtWidgets.QDialog):
 
     """
 
-    StatusRole = QtCore.Qt.UserRole + 1
+    StatusRole = TaskStatusModel.StatusRole
 
     screenshot_started = QtCore.Signal()
     screenshot_ended = QtCore.Signal()
+    preview_downscaled = QtCore.Signal(int)
+    batch_submitted = QtCore.Signal(list)
 
     def __init__(self, task_id=None, parent=None):
         super(CommentWidget, self).__init__(parent)
 
         # Breadcrumbs
         breadcrumbs = TaskBreadcrumb()
+        breadcrumbs.task_changed.connect(self._update_task_status)
 
         # Thumbnail
         thumbnail_label = QtWidgets.QLabel("Take a screenshot:")
@@ -128,6 +140,12 @@ class CommentWidget(QtWidgets.QDialog):
             "QComboBox QAbstractItemView::item { padding: 3px; }"
         )
 
+        # All comment widgets share the statuses fetched once per session
+        status_model = get_shared_model()
+        status_model.loaded.connect(self._update_task_status)
+        status_model.fetch()
+        status.setModel(status_model)
+
         # Create buttons
         submit_button = QtWidgets.QPushButton("Submit")
         submit_button.clicked.connect(self.submit)
@@ -154,57 +172,123 @@ class CommentWidget(QtWidgets.QDialog):
 
         self._close_on_submit = True
         self._allow_screenshot = True
+        self._freeze_screenshot = False
+        self._recorder = None
         self._screenshot = None # Pixmap storage for screenshot
         self._attachment = None
+        self._preview_policy = {"max_size": None, "max_bytes": None}
+        self._preview = None  # Downscaled attachment to upload instead
+        self._downscale_worker = None
+        self._task_id = None
+        self._tasks = None  # Multiple tasks to submit to, see `set_tasks()`
+        self._batch_worker = None
+        self._max_workers = 8
+        self._outbox = None
+        self._attachment_pixmap = None  # Decoded attachment preview cache
+
+        # Only do the smooth rescale of the thumbnail once resizing stops
+        resize_timer = QtCore.QTimer(self)
+        resize_timer.setSingleShot(True)
+        resize_timer.setInterval(150)
+        resize_timer.timeout.connect(self._refresh_thumbnail)
+        self._resize_timer = resize_timer
 
         self.setWindowTitle("Submit comment to CG-Wire")
         self.resize(350, 400)
 
-        self.refresh_all_task_statuses()
-
         # Set the task
         if task_id is not None:
             self.set_task(task_id)
 
     def set_task(self, task_id):
+        """Set the task to comment on.
+
+        This returns directly and shows a placeholder while the task and
+        (if not loaded yet) the task statuses are fetched concurrently in
+        background threads by the breadcrumb and the status model. The
+        current status is looked up in the shared status model so it
+        requires no request of its own.
+
+        """
+
+        self._task_id = task_id
+        self._tasks = None
+        self.status.setEnabled(False)
 
         self.breadcrumbs.set_task(task_id)
+        self.status.model().fetch()
+
+    def set_tasks(self, tasks, max_workers=8):
+        """Set multiple tasks to submit the same comment and status to.
+
+        On `submit()` the comment is submitted to all tasks concurrently
+        in the background, after which `batch_submitted` is emitted with
+        the result per task as returned by `qtazu.batch.submit_comments`.
+
+        Args:
+            tasks (list): The task dicts or task IDs.
+            max_workers (int): Maximum amount of concurrent submissions.
+
+        """
+
+        self._tasks = list(tasks)
+        self._task_id = None
+        self._max_workers = max_workers
+
+        self.breadcrumbs.clear()
+        self.breadcrumbs.setText("{0} tasks".format(len(self._tasks)))
+
+        # There's no single current status to show for multiple tasks
+        self.status.setCurrentIndex(-1)
+        self.status.setEnabled(True)
+        self.status.model().fetch()
+
+    def _update_task_status(self, *args):
+        """Set the status combobox to the current state of the task"""
 
         task = self.breadcrumbs.get_task()
-        current_state = gazu.task.get_task_status(task)
+        model = self.status.model()
+        if self._tasks is not None:
+            self.status.setEnabled(True)
+            return
+        if not task or not model.is_loaded():
+            # Wait for the other request to finish
+            return
 
-        # Set the status combobox to the current state of this task
-        index = self.status.findText(current_state['name'])
+        index = model.find_status(task["task_status_id"])
         self.status.setCurrentIndex(index)
+        self.status.setEnabled(True)
+
+    def _wait_for_task(self):
+        """Block until the task has been fetched"""
+        with busy_wait():
+            while self.breadcrumbs.is_loading():
+                app = QtWidgets.QApplication.instance()
+                app.processEvents()
 
     def get_task(self):
+        self._wait_for_task()
         return self.breadcrumbs.get_task()
 
     def refresh_all_task_statuses(self):
-        """Refresh all available task statuses"""
+        """Refresh all available task statuses
 
-        self.status.clear()
+        This refreshes the model shared by all comment widgets.
 
-        for state in gazu.task.all_task_statuses():
-            self.status.addItem(state['name'])
-            index = self.status.count()-1
-            self.status.setItemData(index, state, self.StatusRole)
+        """
+        self.status.model().refresh()
 
-            # Use color from the status
-            color = QtGui.QColor(state['color'])
+    def set_outbox(self, outbox):
+        """Queue submitted comments in an outbox instead of sending them.
 
-            # The "Todo" status is not user-defined and always returns the
-            # bright online White Theme color which is near pure white.
-            # So for that status we force the dark theme's grey.
-            if state['name'] == "Todo":
-                color = QtGui.QColor("#5F626A")
+        With an outbox `submit()` only writes the comment to disk and
+        returns directly, the outbox sends it in the background.
 
-            self.status.setItemData(index, color, QtCore.Qt.BackgroundRole)
+        Args:
+            outbox (qtazu.outbox.Outbox or None): The outbox to use.
 
-            # Force white text
-            self.status.setItemData(index,
-                                    QtGui.QColor("white"),
-                                    QtCore.Qt.ForegroundRole)
+        """
+        self._outbox = outbox
 
     def set_close_on_submit(self, value):
         self._close_on_submit = value
@@ -224,6 +308,23 @@ class CommentWidget(QtWidgets.QDialog):
         for widget in self.buttons:
             widget.setVisible(value)
 
+    def set_preview_policy(self, max_size=None, max_bytes=None):
+        """Set the limits for image attachments uploaded as preview.
+
+        Images exceeding the limits are resampled in a background thread
+        as soon as they are attached so that `submit()` only has to upload
+        the smaller file. Movies and other files are uploaded as is.
+
+        Args:
+            max_size (int, optional): Maximum width or height in pixels.
+            max_bytes (int, optional): Maximum file size in bytes.
+
+        """
+        self._preview_policy = {"max_size": max_size, "max_bytes": max_bytes}
+
+        if self._attachment:
+            self._downscale_attachment()
+
     def set_attachment(self, path):
         """Set the attachment.
 
@@ -235,6 +336,7 @@ class CommentWidget(QtWidgets.QDialog):
         assert os.path.exists(path), \
             "Attachment path does not exist: %s" % path
         self._attachment = path
+        self._attachment_pixmap = None
 
         # Clear screenshot to be sure
         self._screenshot = None
@@ -242,24 +344,127 @@ class CommentWidget(QtWidgets.QDialog):
         # Update thumbnail
         self._refresh_thumbnail()
 
-    def _refresh_thumbnail(self):
+        self._downscale_attachment()
+
+    def _downscale_attachment(self):
+        """Start resampling the attachment according to the preview policy"""
+
+        self._clear_preview()
+        if not any(self._preview_policy.values()):
+            return
+
+        self._wait_for_downscale()
+        self._downscale_worker = Worker(downscale_image,
+                                        args=[self._attachment],
+                                        kwargs=self._preview_policy,
+                                        parent=self)
+        self._downscale_worker.finished.connect(self._on_downscale_finished)
+        self._downscale_worker.start()
+
+    def _wait_for_downscale(self):
+        """Block until a running downscale worker has finished"""
+        if self._downscale_worker:
+            # Wait for the worker's finished event to be handled
+            with busy_wait():
+                while self._downscale_worker:
+                    app = QtWidgets.QApplication.instance()
+                    app.processEvents()
+
+    def _on_downscale_finished(self):
+        """Handle downscale worker finished event."""
+
+        worker = self._downscale_worker
+        self._downscale_worker = None
+        if worker is None:
+            return
+
+        if worker.error:
+            log.error("Failed to downscale preview: %s", worker.error[1])
+            return
+
+        # Ignore the result when the attachment changed in the meantime
+        path, saved = worker.result
+        source = worker.args[0]
+        if source != self._attachment:
+            if saved:
+                _remove_preview(path)
+            return
+
+        if saved:
+            log.info("Downscaled preview saves %s bytes: %s", saved, path)
+            self._preview = path
+            self.preview_downscaled.emit(saved)
+
+    def _clear_attachment(self):
+        """Clear the attachment with its downscaled and decoded previews"""
+        self._clear_preview()
+        self._attachment = None
+        self._attachment_pixmap = None
+
+    def _clear_preview(self):
+        """Remove the downscaled preview, it is a temporary file"""
+        if self._preview and self._preview != self._attachment:
+            _remove_preview(self._preview)
+        self._preview = None
+
+    def _get_attachment_pixmap(self):
+        """Return the decoded attachment preview, cached per attachment
+
+        Images are decoded at a reduced size directly so huge textures do
+        not have to be fully decoded just to display a thumbnail. They are
+        never shown larger than the screen the widget is on.
+
+        """
+        path = self._attachment
+        if self._attachment_pixmap and self._attachment_pixmap[0] == path:
+            return self._attachment_pixmap[1]
+
+        assert os.path.exists(path), "File does not exist: %s" % path
+        reader = QtGui.QImageReader(path)
+        size = reader.size()
+        if size.isValid():
+            window = self.window().windowHandle()
+            screen = window.screen() if window else \
+                QtGui.QGuiApplication.primaryScreen()
+            bounds = screen.size()
+            if size.width() > bounds.width() or \
+                    size.height() > bounds.height():
+                size.scale(bounds, QtCore.Qt.KeepAspectRatio)
+                reader.setScaledSize(size)
+
+        pixmap = QtGui.QPixmap.fromImage(reader.read())
+        self._attachment_pixmap = (path, pixmap)
+        return pixmap
+
+    def _refresh_thumbnail(self, fast=False):
+        """Update the thumbnail to the screenshot or attachment preview
+
+        Args:
+            fast (bool): Use fast instead of smooth scaling, e.g. to keep
+                up with the events during a live resize.
+
+        """
 
         # Ensure cleared
         #self.thumbnail.setText("")
 
+        if fast:
+            mode = QtCore.Qt.FastTransformation
+        else:
+            mode = QtCore.Qt.SmoothTransformation
+
         def scale_to_fit(pixmap):
             """helper to scale pixmap to fit thumbnail"""
             return pixmap.scaled(self.thumbnail.size(),
                                  QtCore.Qt.KeepAspectRatio,
-                                 QtCore.Qt.SmoothTransformation)
+                                 mode)
 
         if self._allow_screenshot and self._screenshot:
             scaled = scale_to_fit(self._screenshot)
             self.thumbnail.setPixmap(scaled)
         elif self._attachment:
             path = self._attachment
-            assert os.path.exists(path), "File does not exist: %s" % path
-            pixmap = QtGui.QPixmap(path)
+            pixmap = self._get_attachment_pixmap()
 
             if pixmap.isNull():
                 # If the attachment is not an image that we can preview
@@ -290,6 +495,15 @@ class CommentWidget(QtWidgets.QDialog):
         else:
             self.thumbnail_label.setText("Thumbnail:")
 
+    def set_freeze_screenshot(self, value):
+        """Set whether screenshots freeze the screens when starting.
+
+        When enabled the screens are captured once when the screen marquee
+        opens and the screenshot is cropped from that frozen frame.
+
+        """
+        self._freeze_screenshot = bool(value)
+
     def on_thumbnail_clicked(self, event):
         if not self._allow_screenshot:
             return
@@ -299,9 +513,13 @@ class CommentWidget(QtWidgets.QDialog):
 
     def resizeEvent(self, event):
         # If we require a resize or update on the pixmap, update thumbnail
+        # quickly now and smoothly once resizing has stopped
         if not self.thumbnail.pixmap() or \
                 self.thumbnail.size() != self.thumbnail.pixmap().size():
-            self._refresh_thumbnail()
+            self._refresh_thumbnail(fast=True)
+            self._resize_timer.start()
+
+        super(CommentWidget, self).resizeEvent(event)
 
     def _screenshot_to_attachment(self):
         """Save current Screenshot pixmap as temp .png preview attachment"""
@@ -311,6 +529,7 @@ class CommentWidget(QtWidgets.QDialog):
         if has_screenshot:
             filepath = tempfile.NamedTemporaryFile(prefix="screenshot_",
                                                    suffix=".png",
+                                                   dir=get_temp_dir(),
                                                    delete=False).name
             self._screenshot.save(filepath)
             self.set_attachment(filepath)
@@ -332,14 +551,68 @@ class CommentWidget(QtWidgets.QDialog):
         self.screenshot_ended.emit()
 
         # Perform screenshot
-        pixmap = ScreenMarquee.capture_pixmap()
+        if self._freeze_screenshot:
+            # Ensure we're hidden before the screens are frozen
+            QtWidgets.QApplication.processEvents()
+
+        from .screenmarquee import ScreenMarquee
+        pixmap = ScreenMarquee.capture_pixmap(frozen=self._freeze_screenshot)
         if pixmap:
-            self._attachment = None
+            self._clear_attachment()
             self._screenshot = pixmap
             self._refresh_thumbnail()
 
         self.show()
         self.screenshot_ended.emit()
+
+    def record_screen(self, interval=100, frames=None, duration=3):
+        """Record a screen area and attach the recording when encoded.
+
+        The area is selected with the screen marquee, after which frames
+        are captured in the background at `interval` milliseconds for
+        the given amount of `frames` or `duration` in seconds. See
+        `qtazu.widgets.screenmarquee.FrameRecorder`.
+
+        The widget is hidden until the recording is encoded.
+
+        Returns:
+            FrameRecorder: The recorder, e.g. to `stop()` it early. None
+                when no area was selected.
+
+        """
+
+        if self._recorder and self._recorder.is_recording():
+            self._recorder.stop()
+
+        from .screenmarquee import ScreenMarquee, FrameRecorder
+
+        self.hide()
+        rect = ScreenMarquee.select_rect()
+        if rect.isEmpty():
+            self.show()
+            return None
+
+        recorder = FrameRecorder(rect,
+                                 interval=interval,
+                                 frames=frames,
+                                 duration=duration,
+                                 parent=self)
+        recorder.finished.connect(recorder.encode)
+        recorder.encoded.connect(self._on_recording_encoded)
+        recorder.start()
+        self._recorder = recorder
+        return recorder
+
+    def _on_recording_encoded(self, paths):
+        self.show()
+        if not paths:
+            log.warning("Recording has no frames to attach")
+            return
+
+        if len(paths) > 1:
+            log.warning("Recording encoded as image sequence, "
+                        "attaching only the first frame: %s", paths[0])
+        self.set_attachment(paths[0])
     # endregion
 
     def submit(self):
@@ -352,11 +625,38 @@ class CommentWidget(QtWidgets.QDialog):
                 self._screenshot_to_attachment()
 
         # Get current values
-        task = self.breadcrumbs.get_task()
         status = self.status.itemData(self.status.currentIndex(),
                                       self.StatusRole)
         comment_text = self.comment.toPlainText()
 
+        if self._outbox is not None:
+            if not status:
+                log.error("No task status selected to submit")
+                return
+
+            # Don't wait for the server, just queue the comment
+            self._wait_for_downscale()
+            tasks = self._tasks if self._tasks is not None else [
+                self._task_id
+            ]
+            for task in tasks:
+                self._outbox.add_comment(task,
+                                         status,
+                                         comment=comment_text,
+                                         attachment=self._preview or
+                                         self._attachment)
+            self._clear_attachment()
+
+            if self._close_on_submit:
+                self.close()
+            return
+
+        if self._tasks is not None:
+            self._submit_batch(status, comment_text)
+            return
+
+        task = self.get_task()
+
         # Submit comment
         comment = gazu.task.add_comment(task,
                                         status,
@@ -370,17 +670,71 @@ class CommentWidget(QtWidgets.QDialog):
             assert os.path.exists(filepath), \
                 "File does not exist: %s" % filepath
 
+            # Upload the downscaled preview when available
+            self._wait_for_downscale()
+            if self._preview:
+                filepath = self._preview
+
             preview = gazu.task.add_preview(task, comment, filepath)
             log.info("Submitted preview: %s", preview)
 
             # Clear the attachment
-            self._attachment = None
+            self._clear_attachment()
 
         if self._close_on_submit:
             # Close after submission for now to avoid confusion
             # todo: if not closing add message that submission succeeded
             self.close()
 
+    def _submit_batch(self, status, comment_text):
+        """Submit the comment to all tasks in a background thread"""
+
+        if self._batch_worker:
+            log.warning("Batch submission is already in progress")
+            return
+
+        if not status:
+            log.error("No task status selected to submit")
+            return
+
+        # Upload the downscaled preview when available
+        self._wait_for_downscale()
+        filepath = self._preview or self._attachment
+
+        from ..batch import submit_comments
+
+        self._batch_worker = Worker(submit_comments,
+                                    args=[self._tasks, status],
+                                    kwargs={"comment": comment_text,
+                                            "attachment": filepath,
+                                            "max_workers": self._max_workers},
+                                    parent=self)
+        self._batch_worker.finished.connect(self._on_batch_submitted)
+        self._batch_worker.start()
+
+        for widget in self.buttons:
+            widget.setEnabled(False)
+
+    def _on_batch_submitted(self):
+        """Handle batch worker finished event."""
+
+        worker = self._batch_worker
+        self._batch_worker = None
+
+        for widget in self.buttons:
+            widget.setEnabled(True)
+
+        if worker.error:
+            log.error("Failed to submit comments: %s", worker.error[1])
+            return
+
+        self._clear_attachment()
+        self.batch_submitted.emit(worker.result)
+
+        if self._close_on_submit and \
+                not any(result["error"] for result in worker.result):
+            self.close()
+
 
 if __name__ == '__main__':
 
@@ -2,11 +2,23 @@ import os
 import logging
 import re
 
-import gazu
 from Qt import QtWidgets, QtGui, QtCore
 
+from ..utils import Worker, is_valid_api_url
+from .. import cache
+from .. import tokens
+from ..session import get_session
+from ..warmup import warm_up
+from ..lazy import lazy_import
+
+gazu = lazy_import("gazu")
+requests = lazy_import("requests")
+
 log = logging.getLogger(__name__)
 
+# Whether host urls are a valid CG-Wire api url, by url
+HOST_CACHE = cache.Cache(ttl=60)
+
 KITSU_LOGO = os.path.join(
     os.path.dirname(os.path.dirname(__file__)), "res", "image", "logo_kitsu.png"
 )
@@ -69,12 +81,88 @@ class AnimatedLabel(QtWidgets.QLabel):
     )
 
 
+def _log_in(host, user, password, timeout=None):
+    """Return the tokens to log in to CG-Wire at *host* with.
+
+    This runs in a Worker thread and does not change the host, tokens or
+    timeout of gazu, so a cancelled login leaves the session untouched.
+    They are set once the login is accepted, see `Login._on_login_finished`.
+
+    Args:
+        timeout (float or tuple, optional): The requests timeout.
+
+    """
+    session = gazu.client.requests_session
+    if session.head(host, timeout=timeout).status_code != 200:
+        raise ConnectionError(
+            "Could not connect to the server. Is the host URL correct?"
+        )
+
+    path = "auth/login"
+    response = session.post(gazu.client.url_path_join(host, path),
+                            json={"email": user, "password": password},
+                            timeout=timeout)
+    gazu.client.check_status(response, path)
+
+    result = response.json()
+    if result.get("login") is False:
+        raise gazu.exception.AuthFailedException
+    return result
+
+
+def _probe_host(url, timeout):
+    """Return the valid api url for *url*, this runs in a Worker thread
+
+    The url itself and the url with "/api" appended are probed
+    concurrently, as the latter is easily forgotten.
+
+    """
+    candidates = [url]
+    if not url.rstrip("/").endswith("/api"):
+        candidates.append(url.rstrip("/") + "/api")
+
+    workers = []
+    for candidate in candidates:
+        if candidate in HOST_CACHE:
+            continue
+        worker = Worker(is_valid_api_url,
+                        args=[candidate],
+                        kwargs={"timeout": timeout})
+        worker.start()
+        workers.append((candidate, worker))
+
+    for candidate, worker in workers:
+        worker.wait()
+        HOST_CACHE[candidate] = bool(worker.result)
+
+    for candidate in candidates:
+        if HOST_CACHE.get(candidate):
+            return candidate
+
+
 class Login(QtWidgets.QDialog):
-    """Log-in dialog to CG-Wire"""
+    """Log-in dialog to CG-Wire
+
+    Logging in happens in a background thread so the interface stays
+    responsive, it can be cancelled by clicking the button again. The login
+    requests time out after `timeout` seconds if no connection could be
+    made and after `read_timeout` seconds without a response. The timeout
+    of gazu's session is left as is, see `qtazu.utils.set_request_timeout`.
+    While typing the host url it is validated in the background.
+
+    With `remember=True` a "Remember me" checkbox is shown, when checked the
+    tokens are stored on disk after logging in so the next session can be
+    restored with `qtazu.tokens.restore_session()`.
+
+    With `warm_up` the qtazu caches are warmed up in the background after
+    logging in, see `qtazu.warmup`. Pass a list of steps to use as plan.
+
+    """
 
     logged_in = QtCore.Signal(bool)
 
-    def __init__(self, parent=None, initialize_host=True):
+    def __init__(self, parent=None, initialize_host=True, timeout=5,
+                 remember=False, warm_up=False, read_timeout=30):
         super(Login, self).__init__(parent)
 
         self.setWindowTitle("Connect to Kitsu")
@@ -105,6 +193,10 @@ class Login(QtWidgets.QDialog):
         password_input = QtWidgets.QLineEdit()
         password_input.setEchoMode(QtWidgets.QLineEdit.Password)
 
+        # Remember
+        remember_input = QtWidgets.QCheckBox("Remember me")
+        remember_input.setVisible(remember)
+
         # Error
         error = AnimatedLabel()
         error.hide()
@@ -119,12 +211,31 @@ class Login(QtWidgets.QDialog):
         form.addRow(host_label, host_input)
         form.addRow(user_label, user_input)
         form.addRow(password_label, password_input)
+        form.addRow("", remember_input)
 
         self.inputs = dict()
         self.inputs["host"] = host_input
         self.inputs["user"] = user_input
         self.inputs["password"] = password_input
+        self.inputs["remember"] = remember_input
         self.error = error
+        self.login_button = login
+
+        self._timeout = timeout
+        self._read_timeout = read_timeout
+        self._warm_up = warm_up
+        self._login_worker = None
+        self._host_worker = None
+        self._host_locked = False  # Whether the host is set by environment
+        self._valid_host = None  # The valid api url probed for the host
+
+        # Validate the host once the user stops typing
+        host_timer = QtCore.QTimer(self)
+        host_timer.setSingleShot(True)
+        host_timer.setInterval(400)
+        host_timer.timeout.connect(self.validate_host)
+        host_input.textChanged.connect(host_timer.start)
+        self._host_timer = host_timer
 
         layout = QtWidgets.QVBoxLayout(self)
         layout.addWidget(logo_label)
@@ -166,26 +277,131 @@ class Login(QtWidgets.QDialog):
             # Force the host by environment variable
             host_input.setText(host)
             host_input.setEnabled(False)
+            self._host_locked = True
         else:
             host_input.setEnabled(True)
+            self._host_locked = False
+
+    def set_timeout(self, timeout, read_timeout=None):
+        """Set seconds to wait for a connection and for a response"""
+        self._timeout = timeout
+        if read_timeout is not None:
+            self._read_timeout = read_timeout
+
+    def validate_host(self):
+        """Validate the host url in the background and show the result"""
+
+        host = self.inputs["host"].text().strip()
+        self._valid_host = None
+        if not host:
+            self._set_host_state(None)
+            return
+
+        self._host_worker = Worker(_probe_host,
+                                   args=[host, self._timeout],
+                                   parent=self)
+        self._host_worker.host = host
+        self._host_worker.finished.connect(self._on_host_validated)
+        self._host_worker.start()
+
+    def _on_host_validated(self):
+        worker = self.sender()
+        if worker is not self._host_worker or \
+                worker.host != self.inputs["host"].text().strip():
+            # The host was changed while validating
+            return
+        self._host_worker = None
+
+        self._valid_host = worker.result
+        self._set_host_state(worker.result)
+
+    def _set_host_state(self, valid_host):
+        """Show whether the host is valid on the host input"""
+        host_input = self.inputs["host"]
+        host = host_input.text().strip()
+        if not host:
+            host_input.setStyleSheet("")
+            host_input.setToolTip("")
+        elif valid_host is None:
+            host_input.setStyleSheet(
+                "QLineEdit { border: 1px solid #CC4444; }"
+            )
+            host_input.setToolTip("This is not a valid Kitsu API url")
+        elif valid_host != host:
+            host_input.setStyleSheet("")
+            host_input.setToolTip("Using Kitsu API url: %s" % valid_host)
+        else:
+            host_input.setStyleSheet("")
+            host_input.setToolTip("")
+
+    def _set_busy(self, busy):
+        """Disable the inputs and turn the login button into cancel"""
+        for key, widget in self.inputs.items():
+            if key == "host" and self._host_locked:
+                continue
+            widget.setEnabled(not busy)
+        self.login_button.setText("Cancel" if busy else "Login")
+
+    def cancel_login(self):
+        """Cancel the login in progress
+
+        The request itself can't be interrupted, but its result is ignored
+        and gazu stays logged in as before.
+
+        """
+        if self._login_worker:
+            self._login_worker = None
+            self._set_busy(False)
 
     def on_login(self):
         """Perform login with current settings in the dialog."""
 
-        host = self.inputs["host"].text()
+        if self._login_worker:
+            # The button acts as cancel button while logging in
+            self.cancel_login()
+            return
+
+        host = self.inputs["host"].text().strip()
         user = self.inputs["user"].text()
         password = self.inputs["password"].text()
 
-        try:
-            gazu.set_host(host)
-            if not gazu.client.host_is_up():
-                raise ConnectionError(
-                    "Could not connect to the server. Is the host URL correct?"
-                )
-            result = gazu.log_in(user, password)
-        except Exception as exc:
+        if self._valid_host and self._host_worker is None:
+            # Use the api url we found for the host, e.g. with "/api"
+            host = self._valid_host
+
+        self._set_busy(True)
+        self._login_worker = Worker(_log_in,
+                                    args=[host, user, password],
+                                    kwargs={"timeout": (self._timeout,
+                                                        self._read_timeout)},
+                                    parent=self)
+        self._login_worker.finished.connect(self._on_login_finished)
+        self._login_worker.start()
+
+    def _on_login_finished(self):
+        """Handle login worker finished event."""
+
+        worker = self.sender()
+        if worker is not self._login_worker:
+            # Cancelled
+            return
+        self._login_worker = None
+        self._set_busy(False)
+
+        if worker.error:
+            exc = worker.error[1]
             message = str(exc)
-            if message.startswith("auth/login"):
+            if isinstance(exc, requests.exceptions.Timeout):
+                message = (
+                    "Connecting to the server timed out. "
+                    "Is the host URL correct?"
+                )
+            elif isinstance(exc, requests.exceptions.ConnectionError):
+                message = (
+                    "Could not connect to the server. "
+                    "Is the host URL correct?"
+                )
+            elif message.startswith("auth/login"):
                 message = (
                     "Could not connect to the server. Is the host URL correct?"
                 )
@@ -208,8 +424,24 @@ class Login(QtWidgets.QDialog):
             self.logged_in.emit(False)
             return
 
+        result = worker.result
         if result:
+            gazu.set_host(worker.args[0])
+            gazu.client.set_tokens(result)
+            cache.clear_session_data()
+
             name = "{user[first_name]} {user[last_name]}".format(**result)
             log.info("Logged in as %s.." % name)
+
+            if self.inputs["remember"].isChecked():
+                tokens.save_tokens()
+
+            get_session().set_state(True, result["user"])
+
+            if self._warm_up:
+                plan = self._warm_up if isinstance(self._warm_up, list) \
+                    else None
+                warm_up(plan)
+
             self.logged_in.emit(True)
         self.accept()
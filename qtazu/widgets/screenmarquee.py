@@ -1,14 +1,27 @@
 import tempfile
+import logging
+import subprocess
+import shutil
+import time
 import sys
 import os
 
 from Qt import QtCore, QtGui, QtWidgets
 
+from ..utils import Worker
+
+log = logging.getLogger(__name__)
+
 
 class ScreenMarquee(QtWidgets.QDialog):
     """Dialog to interactively define screen area.
 
     This allows to select a screen area through a marquee selection.
+
+    When frozen through `freeze()` before it is shown the marquee displays
+    a snapshot of the screens instead of the live screens and the capture
+    is cropped from that snapshot directly, see `capture_pixmap()`.
+
     """
 
     def __init__(self, parent=None):
@@ -17,7 +30,11 @@ class ScreenMarquee(QtWidgets.QDialog):
 
         self._opacity = 1
         self._click_pos = None
+        self._mouse_pos = None  # Local mouse position last painted
         self._capture_rect = QtCore.QRect()
+        self._frozen = None  # Snapshot of the screens while frozen
+        self._frozen_rect = QtCore.QRect()
+        self._captured = None  # Pixmap cropped from the frozen snapshot
 
         self.setWindowFlags(QtCore.Qt.FramelessWindowHint |
                             QtCore.Qt.WindowStaysOnTopHint |
@@ -36,36 +53,88 @@ class ScreenMarquee(QtWidgets.QDialog):
         """The resulting QRect from a previous capture operation."""
         return self._capture_rect
 
+    @property
+    def captured_pixmap(self):
+        """The pixmap captured from the frozen snapshot, if frozen."""
+        return self._captured
+
+    def freeze(self):
+        """Snapshot the screens to show and capture from instead.
+
+        This must be called before the marquee is shown, so the snapshot
+        does not contain the marquee itself.
+
+        """
+        self._frozen_rect = self._get_workspace_rect()
+        self._frozen = get_desktop_pixmap(self._frozen_rect)
+
+    def _frozen_source_rect(self, rect):
+        """Map global *rect* to the pixel area in the frozen snapshot"""
+        ratio = self._frozen.width() / float(self._frozen_rect.width())
+        rect = rect.translated(-self._frozen_rect.topLeft())
+        return QtCore.QRectF(rect.x() * ratio,
+                             rect.y() * ratio,
+                             rect.width() * ratio,
+                             rect.height() * ratio)
+
     def paintEvent(self, event):
-        """Paint event"""
+        """Paint event
+
+        Only the dirty region of the event gets painted, see
+        `mouseMoveEvent` for the regions updated on a mouse move.
+
+        """
 
         # Convert click and current mouse positions to local space.
-        mouse_pos = self.mapFromGlobal(QtGui.QCursor.pos())
+        mouse_pos = self._mouse_pos
+        if mouse_pos is None:
+            mouse_pos = self.mapFromGlobal(QtGui.QCursor.pos())
         click_pos = None
         if self._click_pos is not None:
             click_pos = self.mapFromGlobal(self._click_pos)
 
         painter = QtGui.QPainter(self)
+        painter.setClipRegion(event.region())
 
         # Draw background. Aside from aesthetics, this makes the full
         # tool region accept mouse events.
         painter.setBrush(QtGui.QColor(0, 0, 0, self._opacity))
         painter.setPen(QtCore.Qt.NoPen)
-        painter.drawRect(event.rect())
 
-        # Clear the capture area
-        if click_pos is not None:
-            capture_rect = QtCore.QRect(click_pos, mouse_pos)
-            painter.setCompositionMode(painter.CompositionMode_Clear)
-            painter.drawRect(capture_rect)
-            painter.setCompositionMode(painter.CompositionMode_SourceOver)
+        if self._frozen is not None:
+            # Draw the snapshot and darken all but the capture area
+            target = QtCore.QRect(event.rect())
+            source = self._frozen_source_rect(
+                target.translated(self.geometry().topLeft())
+            )
+            painter.drawPixmap(QtCore.QRectF(target), self._frozen, source)
+
+            if click_pos is not None:
+                capture_rect = QtCore.QRect(click_pos, mouse_pos)
+                painter.setClipRegion(event.region().subtracted(
+                    QtGui.QRegion(capture_rect.normalized())
+                ))
+            painter.drawRect(event.rect())
+            painter.setClipRegion(event.region())
+
+        else:
+            painter.drawRect(event.rect())
+
+            # Clear the capture area
+            if click_pos is not None:
+                capture_rect = QtCore.QRect(click_pos, mouse_pos)
+                painter.setCompositionMode(painter.CompositionMode_Clear)
+                painter.drawRect(capture_rect)
+                painter.setCompositionMode(
+                    painter.CompositionMode_SourceOver
+                )
 
         pen_color = QtGui.QColor(255, 255, 255, 64)
         pen = QtGui.QPen(pen_color, 1, QtCore.Qt.DotLine)
         painter.setPen(pen)
 
         # Draw cropping markers at click position
-        rect = event.rect()
+        rect = self.rect()
         if click_pos is not None:
             painter.drawLine(rect.left(), click_pos.y(),
                              rect.right(), click_pos.y())
@@ -84,6 +153,7 @@ class ScreenMarquee(QtWidgets.QDialog):
         if event.button() == QtCore.Qt.LeftButton:
             # Begin click drag operation
             self._click_pos = event.globalPos()
+            self.update(self._crosshair_region(event.pos()))
 
     def mouseReleaseEvent(self, event):
         """Mouse release event"""
@@ -92,32 +162,98 @@ class ScreenMarquee(QtWidgets.QDialog):
             self._capture_rect = QtCore.QRect(self._click_pos,
                                               event.globalPos()).normalized()
             self._click_pos = None
+
+            if self._frozen is not None and not self._capture_rect.isEmpty():
+                # Crop the capture straight from the snapshot
+                source = self._frozen_source_rect(self._capture_rect)
+                self._captured = self._frozen.copy(source.toRect())
+
         self.close()
 
+    def hideEvent(self, event):
+        """Release the frozen snapshot directly once done"""
+        self._frozen = None
+        super(ScreenMarquee, self).hideEvent(event)
+
     def mouseMoveEvent(self, event):
-        """Mouse move event"""
-        self.repaint()
+        """Mouse move event
+
+        Schedules an update of only the regions that changed: the old and
+        new crosshair lines and the difference between the old and new
+        capture area. Qt coalesces these updates into a single paint.
+
+        """
+        old_pos = self._mouse_pos
+        new_pos = event.pos()
+        self._mouse_pos = new_pos
+
+        region = self._crosshair_region(new_pos)
+        if old_pos is None:
+            self.update()
+            return
+        region = region.united(self._crosshair_region(old_pos))
+
+        if self._click_pos is not None:
+            click_pos = self.mapFromGlobal(self._click_pos)
+            old_rect = QtCore.QRect(click_pos, old_pos).normalized()
+            new_rect = QtCore.QRect(click_pos, new_pos).normalized()
+            changed = QtGui.QRegion(old_rect.adjusted(-1, -1, 1, 1)).xored(
+                QtGui.QRegion(new_rect.adjusted(-1, -1, 1, 1))
+            )
+            region = region.united(changed)
+
+        self.update(region)
+
+    def _crosshair_region(self, pos):
+        """Return the region covered by the crosshair lines at *pos*"""
+        rect = self.rect()
+        region = QtGui.QRegion(rect.left(), pos.y() - 1, rect.width(), 3)
+        return region.united(
+            QtGui.QRegion(pos.x() - 1, rect.top(), 3, rect.height())
+        )
 
     @classmethod
-    def capture_pixmap(cls):
+    def capture_pixmap(cls, frozen=False):
         """Modally capture screen with marquee into pixmap.
 
+        Args:
+            frozen (bool): Snapshot the screens when the marquee opens and
+                capture from that frozen frame instead of grabbing the
+                screens after the marquee has closed. This captures the
+                exact frame that was shown, e.g. of animated viewports.
+
         Returns:
             QtGui.QPixmap: Captured pixmap image
         """
 
         tool = cls()
+        if frozen:
+            tool.freeze()
         tool.exec_()
+
+        if frozen:
+            return tool.captured_pixmap or QtGui.QPixmap()
         return get_desktop_pixmap(tool.capture_rect)
 
     @classmethod
-    def capture_file(cls, filepath=None):
+    def select_rect(cls):
+        """Modally select a screen area with the marquee.
+
+        Returns:
+            QtCore.QRect: The selected area in global coordinates
+        """
+        tool = cls()
+        tool.exec_()
+        return tool.capture_rect
+
+    @classmethod
+    def capture_file(cls, filepath=None, frozen=False):
 
         if filepath is None:
             filepath = tempfile.NamedTemporaryFile(prefix="screenshot_",
                                                    suffix=".png",
                                                    delete=False).name
-        pixmap = cls.capture_pixmap()
+        pixmap = cls.capture_pixmap(frozen=frozen)
         pixmap.save(filepath)
         return filepath
 
@@ -140,7 +276,7 @@ class ScreenMarquee(QtWidgets.QDialog):
         Animation callback for opacity
         """
         self._opacity = value
-        self.repaint()
+        self.update()
 
     def _get_opacity(self):
         """
@@ -150,30 +286,301 @@ class ScreenMarquee(QtWidgets.QDialog):
 
     _opacity_anim_prop = QtCore.Property(int, _get_opacity, _set_opacity)
 
-    def _fit_screen_geometry(self):
-        # Compute the union of all screen geometries, and resize to fit.
+    def _get_workspace_rect(self):
+        # Compute the union of all screen geometries
         desktop = QtWidgets.QApplication.desktop()
         workspace_rect = QtCore.QRect()
         for i in range(desktop.screenCount()):
             workspace_rect = workspace_rect.united(desktop.screenGeometry(i))
-        self.setGeometry(workspace_rect)
+        return workspace_rect
+
+    def _fit_screen_geometry(self):
+        # Resize to fit all screens
+        self.setGeometry(self._get_workspace_rect())
 
 
 def get_desktop_pixmap(rect):
     """Performs a screen capture on the specified rectangle.
 
+    Only the screens that intersect with the rectangle are grabbed and only
+    the intersecting area. When the screens have different device pixel
+    ratios the parts are stitched together at the highest device pixel
+    ratio so no detail is lost.
+
     Args:
-        rect (QtCore.QRect): The rectangle to capture.
+        rect (QtCore.QRect): The rectangle to capture in global
+            (device independent) coordinates.
 
     Returns:
-        QtGui.QPixmap: Captured pixmap image
+        QtGui.QPixmap: Captured pixmap image at native resolution
 
     """
-    desktop = QtWidgets.QApplication.desktop()
-    pixmap = QtGui.QPixmap.grabWindow(desktop.winId(),
-                                      rect.x(),
-                                      rect.y(),
-                                      rect.width(),
-                                      rect.height())
+    if not hasattr(QtGui, "QGuiApplication"):
+        # Qt4 has no QScreen, grab from the full virtual desktop instead
+        desktop = QtWidgets.QApplication.desktop()
+        return QtGui.QPixmap.grabWindow(desktop.winId(),
+                                        rect.x(),
+                                        rect.y(),
+                                        rect.width(),
+                                        rect.height())
+
+    screens = [screen for screen in QtGui.QGuiApplication.screens()
+               if screen.geometry().intersects(rect)]
+    if not screens:
+        return QtGui.QPixmap()
+
+    def grab(screen):
+        """Grab the part of rect on screen, in coordinates of the screen"""
+        geometry = screen.geometry()
+        area = geometry.intersected(rect)
+        pixmap = screen.grabWindow(0,
+                                   area.x() - geometry.x(),
+                                   area.y() - geometry.y(),
+                                   area.width(),
+                                   area.height())
+        return area, pixmap
+
+    ratio = max(screen.devicePixelRatio() for screen in screens)
+    if len(screens) == 1:
+        area, pixmap = grab(screens[0])
+        pixmap.setDevicePixelRatio(1.0)
+        return pixmap
+
+    # Stitch the grabs from multiple screens together
+    pixmap = QtGui.QPixmap(rect.size() * ratio)
+    pixmap.fill(QtCore.Qt.transparent)
+    painter = QtGui.QPainter(pixmap)
+    painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+    for screen in screens:
+        area, screen_pixmap = grab(screen)
+        target = QtCore.QRect((area.topLeft() - rect.topLeft()) * ratio,
+                              area.size() * ratio)
+        painter.drawPixmap(target, screen_pixmap, screen_pixmap.rect())
+    painter.end()
 
     return pixmap
+
+
+class FrameRecorder(QtCore.QObject):
+    """Capture a screen area at a fixed interval into memory.
+
+    Recording stops after `frames` frames, after `duration` seconds, when
+    the frames would take more than `max_bytes` of memory or on `stop()`,
+    whichever comes first. The frames are grabbed on the GUI thread by a
+    timer so the user interface stays responsive while recording.
+
+    Once recorded use `encode()` to write the frames to a movie, animated
+    gif or image sequence in a background thread.
+
+    Example:
+        def on_encoded(paths):
+            if paths:
+                widget.set_attachment(paths[0])
+
+        rect = ScreenMarquee.select_rect()
+        recorder = FrameRecorder(rect, interval=100, duration=3)
+        recorder.finished.connect(recorder.encode)
+        recorder.encoded.connect(on_encoded)
+        recorder.start()
+
+    """
+
+    frame_captured = QtCore.Signal(int)
+    finished = QtCore.Signal()
+    encoded = QtCore.Signal(list)  # The file paths, empty when none
+
+    def __init__(self, rect, interval=100, frames=None, duration=None,
+                 max_bytes=512 * 1024 * 1024, parent=None):
+        super(FrameRecorder, self).__init__(parent)
+
+        assert frames or duration, "Must specify frames or duration"
+
+        self.rect = QtCore.QRect(rect)
+        self.interval = interval
+        self.max_frames = frames
+        self.duration = duration
+        self.max_bytes = max_bytes
+
+        self.frames = []
+        self._bytes = 0
+        self._start = None
+        self._worker = None
+
+        timer = QtCore.QTimer(self)
+        timer.setTimerType(QtCore.Qt.PreciseTimer)
+        timer.setInterval(interval)
+        timer.timeout.connect(self._capture_frame)
+        self._timer = timer
+
+    def is_recording(self):
+        return self._timer.isActive()
+
+    def start(self):
+        """Start recording, this clears previously recorded frames"""
+        self.frames = []
+        self._bytes = 0
+        self._start = time.time()
+        self._capture_frame()
+        self._timer.start()
+
+    def stop(self):
+        """Stop recording"""
+        if not self._timer.isActive():
+            return
+        self._timer.stop()
+        log.debug("Recorded %d frames (%d bytes)",
+                  len(self.frames), self._bytes)
+        self.finished.emit()
+
+    def _capture_frame(self):
+
+        if self.duration and time.time() - self._start >= self.duration:
+            self.stop()
+            return
+
+        image = get_desktop_pixmap(self.rect).toImage()
+        if self._bytes + image.byteCount() > self.max_bytes:
+            log.warning("Stopped recording, frames exceed %d bytes",
+                        self.max_bytes)
+            self.stop()
+            return
+
+        self.frames.append(image)
+        self._bytes += image.byteCount()
+        self.frame_captured.emit(len(self.frames))
+
+        if self.max_frames and len(self.frames) >= self.max_frames:
+            self.stop()
+
+    def encode(self, path=None, fmt=None):
+        """Write the frames in a background thread, emits `encoded`
+
+        `encoded` is emitted with an empty list when there are no frames or
+        encoding failed.
+
+        Args:
+            path (str, optional): Output path. For an image sequence this
+                is the directory to write the frames to. Defaults to a
+                temporary file (or directory).
+            fmt (str, optional): One of "mp4" (requires ffmpeg), "gif"
+                (requires Pillow) or "png" for an image sequence. Defaults
+                to the first of these that is available.
+
+        """
+        if self._worker:
+            log.warning("Already encoding frames")
+            return
+
+        # Hand the frames over to the worker so the memory is released
+        # as soon as encoding is done
+        frames, self.frames = self.frames, []
+
+        self._worker = Worker(encode_frames,
+                              args=[frames, self.interval],
+                              kwargs={"path": path, "fmt": fmt},
+                              parent=self)
+        self._worker.finished.connect(self._workerFinished)
+        self._worker.start()
+
+    def _workerFinished(self):
+        """Handle worker finished event."""
+
+        worker = self._worker
+        self._worker = None
+
+        if worker.error:
+            log.error("Failed to encode frames: %s", worker.error[1])
+            self.encoded.emit([])
+            return
+
+        self.encoded.emit(worker.result)
+
+
+def _find_ffmpeg():
+    try:
+        return shutil.which("ffmpeg")
+    except AttributeError:
+        # Python 2
+        from distutils.spawn import find_executable
+        return find_executable("ffmpeg")
+
+
+def encode_frames(frames, interval, path=None, fmt=None):
+    """Write the frames (QImage) to a movie, animated gif or image sequence.
+
+    This only uses `QImage` and is thus safe to run in a `Worker` thread.
+
+    Args:
+        frames (list): The QImage frames.
+        interval (int): Milliseconds between the frames.
+        path (str, optional): Output path. For an image sequence this is
+            the directory to write the frames to. Defaults to a temporary
+            file (or directory).
+        fmt (str, optional): One of "mp4" (requires ffmpeg), "gif"
+            (requires Pillow) or "png" for an image sequence. Defaults
+            to the first of these that is available.
+
+    Returns:
+        list: The written file paths, empty when there are no frames.
+
+    """
+
+    if not frames:
+        return []
+
+    if fmt is None:
+        if _find_ffmpeg():
+            fmt = "mp4"
+        else:
+            try:
+                import PIL  # noqa
+                fmt = "gif"
+            except ImportError:
+                fmt = "png"
+
+    if fmt == "png":
+        folder = path or tempfile.mkdtemp(prefix="recording_")
+    else:
+        folder = tempfile.mkdtemp(prefix="recording_")
+
+    # Write the image sequence
+    paths = []
+    for index, image in enumerate(frames):
+        frame_path = os.path.join(folder, "frame_%04d.png" % (index + 1))
+        image.save(frame_path)
+        paths.append(frame_path)
+
+    if fmt == "png":
+        return paths
+
+    if path is None:
+        path = tempfile.NamedTemporaryFile(prefix="recording_",
+                                           suffix="." + fmt,
+                                           delete=False).name
+
+    try:
+        if fmt == "mp4":
+            # H.264 requires even dimensions
+            subprocess.check_call([
+                _find_ffmpeg(), "-y", "-loglevel", "error",
+                "-framerate", str(1000.0 / interval),
+                "-i", os.path.join(folder, "frame_%04d.png"),
+                "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                "-pix_fmt", "yuv420p",
+                path
+            ])
+
+        elif fmt == "gif":
+            from PIL import Image
+            images = [Image.open(frame_path) for frame_path in paths]
+            images[0].save(path,
+                           save_all=True,
+                           append_images=images[1:],
+                           duration=interval,
+                           loop=0)
+        else:
+            raise ValueError("Unsupported format: %s" % fmt)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    return [path]
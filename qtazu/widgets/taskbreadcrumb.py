@@ -1,12 +1,41 @@
+import logging
+
 from Qt import QtWidgets, QtGui, QtCore
 
-import gazu
+from ..utils import Worker, get_cgwire_data, get_web_url
+from .thumbnail import IMAGE_CACHE, download_thumbnail
+from ..lazy import lazy_import
+from .. import singleflight
+
+gazu = lazy_import("gazu")
+
+log = logging.getLogger(__name__)
+
+# Keys of a full task as returned by `gazu.task.get_task` used by the label
+REQUIRED_KEYS = ("entity_type", "entity", "task_type")
+
+# Cache of rendered label html per task id, see `TaskBreadcrumb.set_task`
+LABEL_CACHE = dict()
 
 
 class TaskBreadcrumb(QtWidgets.QLabel):
-    """Simple Breadcrumb label for a Task"""
+    """Simple Breadcrumb label for a Task
+
+    Tasks that need to be fetched from the server are fetched in a Worker
+    thread. Meanwhile the label of the task is shown when it was shown
+    before, otherwise a placeholder. The `task_changed` signal is only
+    emitted once the task data is available.
+
+    The entity type, entity and task links open the related page in Kitsu
+    when clicked, unless `set_open_links(False)` is used. Either way the
+    `entity_clicked` signal is emitted with the linked entity. Hovering a
+    link prefetches the linked entity and its thumbnail in the background
+    so the click is handled without waiting for the server.
+
+    """
 
     task_changed = QtCore.Signal(dict)
+    entity_clicked = QtCore.Signal(dict)
 
     def __init__(self, parent=None, task=None):
         super(TaskBreadcrumb, self).__init__(parent)
@@ -19,20 +48,89 @@ class TaskBreadcrumb(QtWidgets.QLabel):
         font.setBold(True)
         self.setFont(font)
 
-        # todo: Implement useful functionality for when any of the breadcrumb
-        #       links are clicked
-        #self.linkActivated.connect(self._on_link_clicked)
+        self.linkHovered.connect(self._on_link_hovered)
+        self.linkActivated.connect(self._on_link_clicked)
 
         self._task = None
+        self._worker = None
+        self._link_workers = []
+        self._prefetched = set()
+        self._open_links = True
 
         if task is not None:
             self.set_task(task)
 
     def set_task(self, task):
-        task = gazu.task.get_task(task)
+        """Set the task to display.
+
+        Args:
+            task (str or dict): The task id or task. When the task already
+                contains the full entity and task type data it is used as
+                is, otherwise it is fetched from the server in the
+                background first.
+
+        """
+        if isinstance(task, dict) and \
+                all(key in task for key in REQUIRED_KEYS):
+            self._worker = None
+            self._update_task(task)
+            return
+
+        task_id = task["id"] if isinstance(task, dict) else task
+        if task_id in LABEL_CACHE:
+            # Show the label from before while it is being fetched
+            self._task = None
+            self.setText(LABEL_CACHE[task_id][1])
+        else:
+            self.set_loading()
+
+        self._worker = Worker(singleflight.do,
+                              args=[("Task", task_id),
+                                    gazu.task.get_task,
+                                    task_id],
+                              parent=self)
+        self._worker.finished.connect(self._workerFinished)
+        self._worker.start()
+
+    def _workerFinished(self):
+        """Handle worker finished event."""
+
+        worker = self.sender()
+        if worker is not self._worker:
+            # Ignore tasks from previous `set_task()` calls
+            return
+        self._worker = None
+
+        if worker.error:
+            log.error("Failed to fetch task: %s", worker.error[1])
+            self.setText('<span style="color: #777;">'
+                         'Failed to fetch task</span>')
+            return
+
+        self._update_task(worker.result)
+
+    def _update_task(self, task):
+        """Show the label for the full *task* and emit `task_changed`"""
         self._task = task
 
-        # Define understandable label for Task
+        # Reuse the rendered label when the task's labels did not change
+        key = (task["entity_type"]["name"],
+               task["task_type"]["color"],
+               task["entity"]["name"],
+               task["task_type"]["name"])
+        cached = LABEL_CACHE.get(task["id"])
+        if cached and cached[0] == key:
+            label = cached[1]
+        else:
+            label = self._render_label(task)
+            LABEL_CACHE[task["id"]] = (key, label)
+
+        self.setText(label)
+        self.task_changed.emit(task)
+
+    def _render_label(self, task):
+        """Return the understandable label html for *task*"""
+
         link = '<a href="{url}" style="color: {color}; text-decoration:none;">'
         link += '{txt}</a>'
 
@@ -46,17 +144,130 @@ class TaskBreadcrumb(QtWidgets.QLabel):
             color=task["task_type"]["color"],
             txt=task["entity"]["name"]
         )
-        task = link.format(
+        task_type = link.format(
             url="#task",
             color="#BBB",
             txt=task["task_type"]["name"]
         )
 
-        label = " / ".join([entity_type, entity, task])
+        return " / ".join([entity_type, entity, task_type])
 
-        self.setText(label)
-        self.task_changed.emit(task)
+    def set_open_links(self, value):
+        """Set whether clicked links open the page in Kitsu"""
+        self._open_links = bool(value)
+
+    @staticmethod
+    def _get_link_entity(task, link):
+        """Return the entity (with "type" and "id") the *link* refers to"""
+        if link == "#task":
+            return {"type": "Task", "id": task["id"]}
+        elif link == "#entity":
+            return {"type": task["task_type"]["for_entity"],
+                    "id": task["entity"]["id"]}
+        elif link == "#entity_type":
+            return task["entity_type"]
+
+    @classmethod
+    def _get_link_url(cls, task, link):
+        """Return the Kitsu web url for the *link*"""
+        if link == "#entity_type":
+            # List of all assets or shots in the production
+            parent = {
+                "Asset": "assets",
+                "Shot": "shots"
+            }.get(task["task_type"]["for_entity"], "assets")
+            return "{0}/productions/{1}/{2}".format(get_web_url(),
+                                                    task["project_id"],
+                                                    parent)
+        return get_web_url(cls._get_link_entity(task, link))
+
+    @classmethod
+    def _prefetch_link(cls, task, link):
+        """Fetch the linked entity and its thumbnail into the caches"""
+
+        if link == "#entity_type":
+            # Nothing to fetch for the list of assets or shots
+            return
+
+        # Fetch the entity (and its web url) into `qtazu.cache`
+        entity = get_cgwire_data(cls._get_link_entity(task, link),
+                                 cached=True)
+        get_web_url(entity)
+
+        # A task shows the thumbnail of its entity
+        if link == "#task":
+            entity = task["entity"]
+        preview_file_id = entity.get("preview_file_id")
+        if preview_file_id:
+            url = "pictures/thumbnails/preview-files/{0}.png".format(
+                preview_file_id
+            )
+            if url not in IMAGE_CACHE:
+                data = download_thumbnail(url)
+                if data is not None:
+                    IMAGE_CACHE[url] = data
+
+    def _start_link_worker(self, function, link, finished=None):
+        """Run *function* for *link* of the current task in a Worker"""
+        worker = Worker(function, args=[self._task, link], parent=self)
+        worker.task = self._task
+        worker.finished.connect(self._on_link_worker_finished)
+        if finished is not None:
+            worker.finished.connect(finished)
+        self._link_workers.append(worker)
+        worker.start()
+
+    def _on_link_worker_finished(self):
+        worker = self.sender()
+        if worker in self._link_workers:
+            self._link_workers.remove(worker)
+        if worker.error:
+            log.warning("Failed to fetch link: %s", worker.error[1])
+
+    def _on_link_hovered(self, link):
+        if not link or not self._task:
+            return
+
+        key = (self._task["id"], link)
+        if key in self._prefetched:
+            return
+        self._prefetched.add(key)
+        self._start_link_worker(self._prefetch_link, link)
+
+    def _on_link_clicked(self, link):
+        if not self._task:
+            return
+
+        self.entity_clicked.emit(self._get_link_entity(self._task, link))
+
+        if self._open_links:
+            # The url is usually prefetched on hover already, but resolve
+            # it in the background anyway as it might require a request.
+            self._start_link_worker(self._get_link_url,
+                                    link,
+                                    finished=self._on_link_url)
+
+    def _on_link_url(self):
+        worker = self.sender()
+        if worker.error or worker.task is not self._task:
+            return
+        QtGui.QDesktopServices.openUrl(QtCore.QUrl(worker.result))
+
+    def set_loading(self):
+        """Show a placeholder while the task is being fetched"""
+        self._task = None
+        self.setText('<span style="color: #777;">Loading task..</span>')
+
+    def is_loading(self):
+        """Return whether the task is being fetched"""
+        return self._worker is not None
+
+    def clear(self):
+        """Clear the task and label"""
+        self._task = None
+        self._worker = None
+        super(TaskBreadcrumb, self).clear()
 
     def get_task(self):
         """Return current task"""
-        return self._task
\ No newline at end of file
+        return self._task
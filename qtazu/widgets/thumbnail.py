@@ -1,22 +1,130 @@
 import os
+import re
 import sys
-import gazu
+import logging
 from Qt import QtWidgets, QtCore, QtGui
 
 from ..utils import Worker
+from .. import cache
+from .. import singleflight
+from ..watchdog import busy_wait
+from ..lazy import lazy_import
+
+gazu = lazy_import("gazu")
+
+log = logging.getLogger(__name__)
 
 
 # Cache of thumbnail images.
-IMAGE_CACHE = dict()
+IMAGE_CACHE = cache.images
 PLACEHOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)),
                            "res", "icon", "no_thumbnail.png")
 
+# The pictures Zou stores of each preview file from small to large, with
+# the (width, height) they fit in. A height of None scales with the width.
+# The square thumbnails are cropped so they are only used for square sizes.
+VARIANTS = [
+    ("thumbnails-square", (100, 100)),
+    ("thumbnails", (150, 100)),
+    ("previews", (1200, None)),
+    ("originals", None),
+]
+
+_PREVIEW_FILE_URL = re.compile(
+    r"^pictures/(?P<variant>[a-z-]+)/preview-files/(?P<id>[^/.]+)\.png$"
+)
+
+
+def get_device_pixel_ratio(widget):
+    """Return the device pixel ratio of *widget*, 1.0 on Qt4"""
+    for attr in ("devicePixelRatioF", "devicePixelRatio"):
+        if hasattr(widget, attr):
+            return float(getattr(widget, attr)())
+    return 1.0
+
+
+def get_variant_url(url, width, height=None, ratio=1.0):
+    """Return the smallest picture variant of *url* covering the size.
+
+    Only preview file pictures have variants, e.g. person avatars and
+    project thumbnails only exist in one size and are returned as is.
+
+    Args:
+        url (str): The relative picture url, e.g.
+            'pictures/thumbnails/preview-files/{id}.png'
+        width (int): The width to display the picture at.
+        height (int, optional): The height to display the picture at,
+            None to only cover the width.
+        ratio (float): The device pixel ratio of the display.
+
+    Returns:
+        str: The relative url of the variant.
+
+    """
+    match = _PREVIEW_FILE_URL.match(url)
+    if not match:
+        return url
+
+    width *= ratio
+    height = height * ratio if height else None
+    square = height is not None and abs(width - height) <= 1
+
+    for variant, size in VARIANTS:
+        if size is None:
+            break
+        if variant == "thumbnails-square" and not square:
+            continue
+        if size[0] >= width and (height is None or size[1] is None or
+                                 size[1] >= height):
+            break
+
+    return "pictures/{0}/preview-files/{1}.png".format(variant,
+                                                        match.group("id"))
+
+
+def get_variant_index(url):
+    """Return the index of the variant of *url* in `VARIANTS`, -1 if none"""
+    match = _PREVIEW_FILE_URL.match(url)
+    if match:
+        for index, (variant, _) in enumerate(VARIANTS):
+            if variant == match.group("variant"):
+                return index
+    return -1
+
+
+def get_fallback_urls(url, reference=None):
+    """Return the urls to load when the variant *url* is missing.
+
+    These are the smaller variants of *url*, largest first, followed by the
+    *reference* it was derived from. The cropped square thumbnails are no
+    fallback for the other variants.
+
+    """
+    urls = []
+    match = _PREVIEW_FILE_URL.match(url)
+    if match:
+        index = get_variant_index(url)
+        for variant, _ in reversed(VARIANTS[:index]):
+            if variant == "thumbnails-square":
+                continue
+            urls.append("pictures/{0}/preview-files/{1}.png".format(
+                variant, match.group("id")))
+
+    if reference and reference != url and reference not in urls:
+        urls.append(reference)
+    return urls
+
 
 class ThumbnailBase(QtWidgets.QLabel):
     """Widget to load thumbnails from CG-Wire server through gazu.
 
     This asynchronously loads Thumbnails in Worker Threads.
 
+    Preview file thumbnails are loaded in the smallest picture variant that
+    covers the width of the widget times its device pixel ratio, a larger
+    variant is only loaded once the widget grows. See `get_variant_url`.
+    When a larger variant is missing the loaded one is kept.
+
     """
 
     def __init__(self, parent=None):
@@ -30,21 +138,47 @@ class ThumbnailBase(QtWidgets.QLabel):
 
         self._worker = None
         self.__loadingReference = None
+        self._reference = None
+        self._variant = -1  # Index of the loaded variant in `VARIANTS`
+        self._missingVariants = set()
 
     def load(self, reference):
         """Load thumbnail from *reference* and display it."""
+        self._reference = reference
+        self._variant = -1
+        self._loadVariant()
 
-        if reference in IMAGE_CACHE:
-            self._updatePixmapData(IMAGE_CACHE[reference])
+    def _getVariantUrl(self):
+        """Return the url of the variant covering the current width"""
+        return get_variant_url(self._reference,
+                               self.width(),
+                               ratio=get_device_pixel_ratio(self))
+
+    def _loadVariant(self):
+        """Load the variant of the reference for the current width"""
+
+        url = self._getVariantUrl()
+        if url in IMAGE_CACHE:
+            self._variant = get_variant_index(url)
+            self._updatePixmapData(IMAGE_CACHE[url])
             return
 
         if self._worker and self._worker.isRunning():
-            while self._worker:
-                app = QtWidgets.QApplication.instance()
-                app.processEvents()
+            with busy_wait():
+                while self._worker:
+                    app = QtWidgets.QApplication.instance()
+                    app.processEvents()
+
+        if self._variant >= 0:
+            # Keep showing the loaded variant when the larger one fails
+            fallbacks = []
+        else:
+            fallbacks = get_fallback_urls(url, self._reference)
 
-        self._worker = Worker(self._download, [reference], parent=self)
-        self.__loadingReference = reference
+        self._worker = Worker(self._download,
+                              [url, fallbacks],
+                              parent=self)
+        self.__loadingReference = url
         self._worker.start()
         self._worker.finished.connect(self._workerFinished)
 
@@ -53,20 +187,40 @@ class ThumbnailBase(QtWidgets.QLabel):
 
         if self._worker:
 
-            pixmap = self._worker.result
-            if not pixmap:
+            url, pixmap = self._worker.result or (self.__loadingReference,
+                                                  None)
+            if url != self.__loadingReference or not pixmap:
+                # Do not try to load the missing variant again on resize
+                self._missingVariants.add(self.__loadingReference)
+
+            if pixmap:
+                IMAGE_CACHE[url] = pixmap
+                self._variant = get_variant_index(url)
+                self._updatePixmapData(pixmap)
+
+            elif self._variant < 0:
                 # If not image downloaded read the thumbnail
                 # placeholder instead
                 qfile = QtCore.QFile(self.placeholderThumbnail)
                 qfile.open(qfile.ReadOnly)
                 pixmap = qfile.readAll()
 
-            IMAGE_CACHE[self.__loadingReference] = pixmap
-            self._updatePixmapData(pixmap)
+                IMAGE_CACHE[url] = pixmap
+                self._updatePixmapData(pixmap)
 
         self._worker = None
         self.__loadingReference = None
 
+    def resizeEvent(self, event):
+        super(ThumbnailBase, self).resizeEvent(event)
+
+        # Load a larger variant when the widget grew beyond the loaded one
+        if self._reference and not self._worker and self._variant >= 0:
+            url = self._getVariantUrl()
+            if url not in self._missingVariants and \
+                    get_variant_index(url) > self._variant:
+                self._loadVariant()
+
     def _updatePixmapData(self, data):
         """Update thumbnail with *data*."""
         pixmap = QtGui.QPixmap()
@@ -75,30 +229,65 @@ class ThumbnailBase(QtWidgets.QLabel):
 
     def _scaleAndSetPixmap(self, pixmap):
         """Scale and set *pixmap*."""
+        ratio = get_device_pixel_ratio(self)
         scaledPixmap = pixmap.scaledToWidth(
-            self.width(),
+            int(self.width() * ratio),
             mode=QtCore.Qt.SmoothTransformation
         )
+        if hasattr(scaledPixmap, "setDevicePixelRatio"):
+            scaledPixmap.setDevicePixelRatio(ratio)
         self.setPixmap(scaledPixmap)
 
-    def _download(self, url):
-        """Return thumbnail file from *url*.
+    def _download(self, url, fallbacks=()):
+        """Return the url and thumbnail file from *url* or the *fallbacks*.
 
-        Args:
-            url (str): The relative url in the form of
-                'pictures/thumbnails/{type}/{id}.png'
+        Not all preview files have all variants, e.g. movies have no
+        original picture, so the first of the *fallbacks* that is cached
+        or downloads is returned when *url* fails.
 
         """
-        full_url = gazu.client.get_full_url(url)
-        requests_session = gazu.client.requests_session
-
-        with requests_session.get(
-            full_url,
-            headers=gazu.client.make_auth_header(),
-            stream=True
-        ) as response:
-            bytes = QtCore.QByteArray()
-            for chunk in response.iter_content(8192):
-                bytes.append(chunk)
-
-            return bytes
+        for candidate in [url] + list(fallbacks):
+            data = IMAGE_CACHE.get(candidate)
+            if data is None:
+                data = download_thumbnail(candidate)
+            if data is not None:
+                return candidate, data
+        return url, None
+
+
+def download_thumbnail(url):
+    """Return thumbnail file from *url*.
+
+    Concurrent downloads of the same url share a single request, see
+    `qtazu.singleflight`.
+
+    Args:
+        url (str): The relative url in the form of
+            'pictures/thumbnails/{type}/{id}.png'
+
+    Returns:
+        QtCore.QByteArray: The image data, None if the request failed.
+
+    """
+    return singleflight.do(("GET", url), _download_thumbnail, url)
+
+
+def _download_thumbnail(url):
+    full_url = gazu.client.get_full_url(url)
+    requests_session = gazu.client.requests_session
+
+    with requests_session.get(
+        full_url,
+        headers=gazu.client.make_auth_header(),
+        stream=True
+    ) as response:
+        if response.status_code != 200:
+            # Request failed
+            log.error("Failed request: %s" % full_url)
+            return None
+
+        bytes = QtCore.QByteArray()
+        for chunk in response.iter_content(8192):
+            bytes.append(chunk)
+
+        return bytes
@@ -0,0 +1,32 @@
+import os
+import time
+
+import pytest
+
+# Run the widgets without a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+@pytest.fixture(scope="session")
+def app():
+    from Qt import QtWidgets
+
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication([])
+    return app
+
+
+@pytest.fixture
+def wait_until(app):
+    """Return a function processing Qt events until a condition is met"""
+
+    def _wait_until(condition, timeout=5.0):
+        end = time.time() + timeout
+        while not condition():
+            if time.time() > end:
+                raise AssertionError("Timed out waiting for %s" % condition)
+            app.processEvents()
+            time.sleep(0.01)
+
+    return _wait_until
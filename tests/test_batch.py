@@ -0,0 +1,102 @@
+import time
+import threading
+
+import pytest
+
+gazu = pytest.importorskip("gazu")
+
+from qtazu import batch  # noqa: E402
+from qtazu.models.taskstatuses import get_shared_model  # noqa: E402
+
+STATUS = {"id": "wip", "name": "WIP", "color": "#3273dc"}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Stand-in add_comment that fails for task "bad" """
+    lock = threading.Lock()
+    state = {"running": 0, "max": 0, "calls": []}
+
+    def add_comment(task, task_status, comment=""):
+        with lock:
+            state["running"] += 1
+            state["max"] = max(state["max"], state["running"])
+            state["calls"].append(task)
+        try:
+            time.sleep(0.02)
+            if task == "bad":
+                raise IOError("Task is gone")
+            return {"id": "comment-" + task, "text": comment}
+        finally:
+            with lock:
+                state["running"] -= 1
+
+    monkeypatch.setattr(gazu.task, "add_comment", add_comment)
+    return state
+
+
+def test_results_are_in_task_order(server):
+    tasks = ["t%d" % index for index in range(6)]
+    tasks.insert(2, "bad")
+
+    results = batch.submit_comments(tasks, STATUS, comment="Looks good",
+                                    max_workers=3)
+
+    assert [result["task"] for result in results] == tasks
+    assert [result["comment"]["id"] for result in results
+            if not result["error"]] == ["comment-" + task for task in tasks
+                                        if task != "bad"]
+    failed = results[2]
+    assert failed["comment"] is None
+    assert isinstance(failed["error"], IOError)
+    assert sorted(server["calls"]) == sorted(tasks)
+
+
+def test_concurrency_is_bounded(server):
+    batch.submit_comments(["t%d" % index for index in range(8)], STATUS,
+                          max_workers=2)
+
+    assert 1 <= server["max"] <= 2
+
+
+def test_callback_errors_do_not_lose_results(server):
+    def callback(result):
+        raise RuntimeError("Broken callback")
+
+    results = batch.submit_comments(["t1", "t2"], STATUS, max_workers=1,
+                                    callback=callback)
+
+    assert [result["comment"]["id"] for result in results] == \
+        ["comment-t1", "comment-t2"]
+
+
+@pytest.mark.parametrize("max_workers", [0, -1])
+def test_invalid_max_workers(server, max_workers):
+    with pytest.raises(ValueError):
+        batch.submit_comments(["t1"], STATUS, max_workers=max_workers)
+    assert server["calls"] == []
+
+
+def test_comment_widget_submits_to_all_tasks(server, app, wait_until):
+    from qtazu.widgets.comment import CommentWidget
+
+    get_shared_model().set_statuses([STATUS])
+
+    widget = CommentWidget()
+    widget.set_close_on_submit(False)
+    widget.set_tasks(["t1", "bad", "t2"], max_workers=2)
+    widget.status.setCurrentIndex(0)
+    widget.comment.setPlainText("Approved")
+
+    submitted = []
+    widget.batch_submitted.connect(submitted.append)
+    widget.submit()
+    assert not widget.buttons[0].isEnabled()
+
+    wait_until(lambda: submitted)
+    results = submitted[0]
+    assert [result["task"] for result in results] == ["t1", "bad", "t2"]
+    assert [bool(result["error"]) for result in results] == \
+        [False, True, False]
+    assert results[0]["comment"]["text"] == "Approved"
+    assert widget.buttons[0].isEnabled()
@@ -0,0 +1,186 @@
+import logging
+
+import pytest
+
+gazu = pytest.importorskip("gazu")
+
+from qtazu import cache, events  # noqa: E402
+
+
+class StandInEventClient(object):
+    """Stand-in for the socket.io client of the Zou event stream
+
+    It serves the scripted *events* to the registered listeners once
+    `wait()` is called, like `gazu.events.run_client()` does.
+
+    """
+
+    def __init__(self, scripted):
+        self.scripted = scripted
+        self.handlers = {}
+        self.disconnected = False
+        self.main_namespace = self
+
+    def on(self, name, handler):
+        self.handlers[name] = handler
+
+    def wait(self):
+        for name, data in self.scripted:
+            if name in self.handlers:
+                self.handlers[name](data)
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    for store in (cache.entities, cache.images, cache.references):
+        store.clear()
+    yield
+    for store in (cache.entities, cache.images, cache.references):
+        store.clear()
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    """Serve `gazu.client.fetch_one` from a dict, records the requests"""
+    records = {}
+    requests = []
+
+    def fetch_one(path, entity_id):
+        requests.append((path, entity_id))
+        return dict(records[(path, entity_id)])
+
+    monkeypatch.setattr(gazu.client, "fetch_one", fetch_one)
+    fetch_one.records = records
+    fetch_one.requests = requests
+    return fetch_one
+
+
+def test_unknown_event_is_ignored():
+    assert events.handle_event("playlist:update", {}) is False
+
+
+def test_handler_errors_are_logged(caplog):
+    with caplog.at_level(logging.WARNING, logger="qtazu.events"):
+        assert events.handle_event("person:update", {}) is True
+    assert "Failed to handle event person:update" in caplog.text
+
+
+def test_person_update_patches_references(monkeypatch, app):
+    cache.references["persons"] = [{"id": "a", "first_name": "Ann"},
+                                   {"id": "b", "first_name": "Bob"}]
+    cache.images["pictures/thumbnails/persons/a.png"] = b"avatar"
+    monkeypatch.setattr(gazu.person, "get_person",
+                        lambda person_id: {"id": person_id,
+                                           "first_name": "Anna"})
+
+    received = []
+    cache.notifier.references_changed.connect(
+        lambda *args: received.append(args)
+    )
+    events.handle_event("person:update", {"person_id": "a"})
+
+    assert [p["first_name"] for p in cache.references["persons"]] == \
+        ["Anna", "Bob"]
+    assert "pictures/thumbnails/persons/a.png" not in cache.images
+    assert received[-1][0] == "persons"
+
+
+def test_task_status_is_fetched_by_id(fetched):
+    cache.references["task_statuses"] = [{"id": "wip", "name": "WIP"}]
+    fetched.records[("task-status", "wip")] = {"id": "wip",
+                                               "name": "Work"}
+
+    events.handle_event("task-status:update", {"task_status_id": "wip"})
+
+    assert fetched.requests == [("task-status", "wip")]
+    assert cache.references["task_statuses"][0]["name"] == "Work"
+
+
+def test_unwatched_task_is_only_invalidated(fetched):
+    cache.entities[("Task", "t1")] = {"id": "t1"}
+
+    events.handle_event("task:update", {"task_id": "t1"})
+
+    assert fetched.requests == []
+    assert ("Task", "t1") not in cache.entities
+
+
+def test_task_rows_are_patched(fetched, monkeypatch, app, wait_until):
+    from qtazu.models import entities
+
+    tasks = [{"id": "t1", "name": "anim", "task_status_id": "todo"},
+             {"id": "t2", "name": "comp", "task_status_id": "todo"}]
+    monkeypatch.setattr(entities, "fetch_page",
+                        lambda *args: ([dict(t) for t in tasks], False))
+
+    model = entities.TaskModel()
+    model.fetchMore()
+    wait_until(lambda: model.rowCount() == 2)
+
+    # A new comment changed the status of its task
+    fetched.records[("tasks", "t2")] = {"id": "t2",
+                                        "name": "comp",
+                                        "task_status_id": "done"}
+    events.handle_event("comment:new", {"comment_id": "c",
+                                        "task_id": "t2"})
+    app.processEvents()
+
+    entity = model.data(model.index(1), model.EntityRole)
+    assert entity["task_status_id"] == "done"
+
+    events.handle_event("task:delete", {"task_id": "t1"})
+    app.processEvents()
+
+    assert model.rowCount() == 1
+    assert model.data(model.index(0)) == "comp"
+
+
+def test_listener_serves_stand_in_events(monkeypatch, app, wait_until):
+    scripted = [("task-status:delete", {"task_status_id": "wip"}),
+                ("playlist:update", {"playlist_id": "p"})]
+    client = StandInEventClient(scripted)
+
+    # Fails like gazu 0.7.1 when called with arguments
+    def init():
+        return client
+
+    hosts = []
+    monkeypatch.setattr(gazu.events, "init", init)
+    monkeypatch.setattr(gazu, "set_event_host", hosts.append)
+
+    cache.references["task_statuses"] = [{"id": "wip"}, {"id": "done"}]
+
+    listener = events.EventListener(host="http://localhost:5001")
+    received = []
+    stopped = []
+    listener.event_received.connect(lambda *args: received.append(args))
+    listener.stopped.connect(stopped.append)
+    listener.start()
+    wait_until(lambda: stopped)
+
+    assert hosts == ["http://localhost:5001"]
+    assert stopped == [""]
+    assert received == [scripted[0]]
+    assert cache.references["task_statuses"] == [{"id": "done"}]
+
+
+def test_listener_logs_startup_failure(monkeypatch, app, wait_until,
+                                       caplog):
+    def init():
+        raise IOError("Connection refused")
+
+    monkeypatch.setattr(gazu.events, "init", init)
+
+    listener = events.EventListener()
+    stopped = []
+    listener.stopped.connect(stopped.append)
+    with caplog.at_level(logging.ERROR, logger="qtazu.events"):
+        listener.start()
+        wait_until(lambda: stopped)
+
+    assert stopped == ["Connection refused"]
+    assert "Unable to connect to the event stream" in caplog.text
+    assert not listener.is_running()
@@ -0,0 +1,133 @@
+import time
+import threading
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from qtazu import adapters, limiter  # noqa: E402
+
+
+class OverloadedServer(requests.adapters.BaseAdapter):
+    """Stand-in server that answers 503 beyond `capacity` requests at once"""
+
+    def __init__(self, capacity, latency=0.02):
+        super(OverloadedServer, self).__init__()
+        self.capacity = capacity
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.statuses = []
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            overloaded = self.in_flight > self.capacity
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+        response = requests.Response()
+        response.status_code = 503 if overloaded else 200
+        response.request = request
+        response.url = request.url
+        response._content = b""
+        response._content_consumed = True
+        with self._lock:
+            self.statuses.append(response.status_code)
+        return response
+
+    def close(self):
+        pass
+
+
+class BrokenServer(requests.adapters.BaseAdapter):
+    """Stand-in server whose responses fail to parse"""
+
+    def send(self, request, **kwargs):
+        raise requests.exceptions.InvalidHeader("Invalid header")
+
+    def close(self):
+        pass
+
+
+def run_in_threads(function, count):
+    """Run *function* in *count* background threads, return the errors"""
+    errors = []
+
+    def _run():
+        try:
+            function()
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=_run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+        assert not thread.is_alive()
+    return errors
+
+
+def make_session(adapter, shared):
+    session = requests.Session()
+    session.mount("http://", adapters.LimitedHTTPAdapter(limiter=shared,
+                                                         retries=5,
+                                                         adapter=adapter))
+    return session
+
+
+def test_overloaded_server_decreases_limit():
+    shared = limiter.AdaptiveLimiter(per_host=8, rate=1000.0,
+                                     backoff=0.01, max_backoff=0.05)
+    server = OverloadedServer(capacity=2)
+    session = make_session(server, shared)
+
+    errors = run_in_threads(
+        lambda: session.get("http://zou/api/pictures/thumbnails/a.png"), 24
+    )
+
+    assert not errors
+    assert server.max_in_flight <= 8
+    assert 503 in server.statuses
+    assert shared.limit("zou") < 8
+
+    stats = shared.stats()["zou"]
+    assert stats["in_flight"] == 0
+    assert stats["overloaded"] > 0
+
+
+def test_fast_server_keeps_limit():
+    shared = limiter.AdaptiveLimiter(per_host=4, rate=1000.0)
+    server = OverloadedServer(capacity=4, latency=0.01)
+    session = make_session(server, shared)
+
+    errors = run_in_threads(
+        lambda: session.get("http://zou/api/data/projects"), 16
+    )
+
+    assert not errors
+    assert server.max_in_flight <= 4
+    assert set(server.statuses) == set([200])
+    assert shared.limit("zou") == 4
+
+
+def test_slot_is_released_on_unexpected_errors():
+    shared = limiter.AdaptiveLimiter(max_concurrency=1, per_host=1,
+                                     rate=1000.0)
+    session = make_session(BrokenServer(), shared)
+
+    # Without releasing the slot the second request would wait forever
+    errors = run_in_threads(
+        lambda: session.get("http://zou/api/data/projects"), 2
+    )
+
+    assert len(errors) == 2
+    assert all(isinstance(error, requests.exceptions.InvalidHeader)
+               for error in errors)
+    assert shared.stats()["zou"]["in_flight"] == 0
@@ -0,0 +1,121 @@
+import json
+import threading
+
+import pytest
+
+gazu = pytest.importorskip("gazu")
+requests = pytest.importorskip("requests")
+
+from qtazu.widgets import login  # noqa: E402
+
+TOKENS = {
+    "access_token": "access",
+    "refresh_token": "refresh",
+    "user": {"id": "user", "first_name": "Ann", "last_name": "Smith"}
+}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Stand-in login and host probe that never reach the network"""
+    release = threading.Event()
+
+    def _log_in(host, user, password, timeout=None):
+        _log_in.timeouts.append(timeout)
+        release.wait(5)
+        return dict(TOKENS)
+
+    def _probe_host(url, timeout):
+        return url
+
+    monkeypatch.setattr(login, "_log_in", _log_in)
+    monkeypatch.setattr(login, "_probe_host", _probe_host)
+    monkeypatch.setattr(gazu.client, "tokens", {"access_token": "before"})
+    monkeypatch.setattr(gazu.client, "HOST", "http://before/api")
+    _log_in.release = release
+    _log_in.timeouts = []
+    return _log_in
+
+
+@pytest.fixture
+def dialog(app):
+    dialog = login.Login(initialize_host=False)
+    dialog.inputs["host"].setText("http://zou/api")
+    dialog.inputs["user"].setText("ann@example.com")
+    dialog.inputs["password"].setText("secret")
+    return dialog
+
+
+def test_cancelled_login_is_ignored(server, dialog, app, wait_until):
+    results = []
+    dialog.logged_in.connect(results.append)
+
+    dialog.on_login()
+    worker = dialog._login_worker
+    dialog.on_login()  # Cancel
+
+    server.release.set()
+    wait_until(worker.isFinished)
+    app.processEvents()
+
+    assert results == []
+    assert gazu.client.tokens == {"access_token": "before"}
+    assert gazu.client.get_host() == "http://before/api"
+
+
+def test_login_sets_host_and_tokens(server, dialog, wait_until):
+    results = []
+    dialog.logged_in.connect(results.append)
+
+    server.release.set()
+    dialog.on_login()
+    wait_until(lambda: results)
+
+    assert results == [True]
+    assert gazu.client.tokens["access_token"] == "access"
+    assert gazu.client.get_host() == "http://zou/api"
+
+
+def test_login_leaves_the_session_timeout_untouched(server, dialog,
+                                                    wait_until):
+    session = gazu.client.requests_session
+    adapters = dict(session.adapters)
+    dialog.set_timeout(2, read_timeout=10)
+
+    results = []
+    dialog.logged_in.connect(results.append)
+    server.release.set()
+    dialog.on_login()
+    wait_until(lambda: results)
+
+    assert server.timeouts == [(2, 10)]
+    assert dict(session.adapters) == adapters
+
+
+def test_log_in_passes_the_timeout_to_its_requests(monkeypatch):
+    session = gazu.client.requests_session
+    timeouts = []
+
+    def respond(status, data=None):
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(data or {}).encode("utf-8")
+        return response
+
+    def head(url, timeout=None):
+        timeouts.append(timeout)
+        return respond(200)
+
+    def post(url, json=None, timeout=None):
+        timeouts.append(timeout)
+        assert json == {"email": "ann@example.com", "password": "secret"}
+        return respond(200, TOKENS)
+
+    monkeypatch.setattr(session, "head", head)
+    monkeypatch.setattr(session, "post", post)
+
+    result = login._log_in("http://zou/api", "ann@example.com", "secret",
+                           timeout=(5, 30))
+
+    assert result["access_token"] == "access"
+    assert timeouts == [(5, 30), (5, 30)]
@@ -0,0 +1,114 @@
+import pytest
+
+gazu = pytest.importorskip("gazu")
+
+from Qt import QtCore  # noqa: E402
+
+from qtazu import cache  # noqa: E402
+from qtazu.models import entities  # noqa: E402
+from qtazu.models.persons import PersonModel  # noqa: E402
+
+PERSONS = [
+    {"id": "a", "first_name": "Ann", "last_name": "Smith",
+     "has_avatar": True, "updated_at": "1"},
+    {"id": "b", "first_name": "Bob", "last_name": "Jones",
+     "has_avatar": False, "updated_at": "1"},
+]
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    cache.references.clear()
+    cache.images.clear()
+    yield
+    cache.references.clear()
+    cache.images.clear()
+
+
+def names(model):
+    return [model.data(model.index(row)) for row in range(model.rowCount())]
+
+
+def test_failed_page_is_fetched_again(monkeypatch, app, wait_until):
+    calls = []
+
+    def fetch_page(path, page, limit, filters=None):
+        calls.append(page)
+        if len(calls) == 1:
+            raise IOError("Server unavailable")
+        return [{"id": "t%d" % page, "name": "task"}], page < 2
+
+    monkeypatch.setattr(entities, "fetch_page", fetch_page)
+
+    model = entities.TaskModel()
+    model.fetchMore()
+    wait_until(lambda: model.rowCount() == 1)
+
+    assert calls == [1, 1]
+    assert model.canFetchMore()
+
+    model.fetchMore()
+    wait_until(lambda: model.rowCount() == 2)
+    assert calls == [1, 1, 2]
+    assert not model.canFetchMore()
+
+
+def test_person_model_uses_cached_persons(monkeypatch, app):
+    cache.references["persons"] = PERSONS
+
+    def all_persons():
+        raise AssertionError("Persons should come from the cache")
+
+    monkeypatch.setattr(gazu.person, "all_persons", all_persons)
+
+    model = PersonModel()
+
+    assert names(model) == ["Ann Smith", "Bob Jones"]
+    assert not model.canFetchMore()
+    assert model.get_thumbnail_url(PERSONS[0]) == \
+        "pictures/thumbnails/persons/a.png"
+    assert model.get_thumbnail_url(PERSONS[1]) is None
+
+
+def test_person_model_applies_reference_changes(app):
+    cache.references["persons"] = PERSONS
+    model = PersonModel()
+
+    url = "pictures/thumbnails/persons/a.png"
+    cache.images[url] = b"old avatar"
+
+    changed = [dict(PERSONS[0], last_name="Brown", updated_at="2"),
+               {"id": "c", "first_name": "Cid", "last_name": "Moss",
+                "has_avatar": False}]
+    cache.update_references("persons", changed, ["b"])
+    app.processEvents()
+
+    assert names(model) == ["Ann Brown", "Cid Moss"]
+    assert url not in cache.images
+
+
+def test_asset_icons_use_the_square_variant(monkeypatch, app, wait_until):
+    requested = []
+
+    def download_thumbnail(url):
+        requested.append(url)
+        if "thumbnails-square" in url:
+            return None  # Missing, e.g. on older Zou servers
+        return b"thumbnail"
+
+    monkeypatch.setattr(entities, "download_thumbnail", download_thumbnail)
+    monkeypatch.setattr(entities.EntityModel, "_make_icon",
+                        lambda self, data: data)
+
+    model = entities.AssetModel(icon_size=30)
+    model.set_entities([{"id": "asset", "name": "hero",
+                         "preview_file_id": "p"}])
+
+    square = "pictures/thumbnails-square/preview-files/p.png"
+    assert model.get_icon_url(model._entities[0]) == square
+
+    model.data(model.index(0), QtCore.Qt.DecorationRole)
+    wait_until(lambda: model._icons.get(square) == b"thumbnail")
+
+    assert requested == [square,
+                         "pictures/thumbnails/preview-files/p.png"]
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+gazu = pytest.importorskip("gazu")
+
+from qtazu.outbox import Outbox  # noqa: E402
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Record the comments and previews sent to gazu"""
+    sent = {"comments": [], "previews": []}
+
+    def add_comment(task, task_status, comment=""):
+        sent["comments"].append((task["id"], task_status["id"], comment))
+        return {"id": "comment-%d" % len(sent["comments"])}
+
+    def add_preview(task, comment, path):
+        with open(path, "rb") as f:
+            sent["previews"].append((comment["id"], f.read()))
+        return {"id": "preview"}
+
+    monkeypatch.setattr(gazu.client, "get_host", lambda: "http://zou/api")
+    monkeypatch.setattr(gazu.task, "add_comment", add_comment)
+    monkeypatch.setattr(gazu.task, "add_preview", add_preview)
+    return sent
+
+
+@pytest.fixture
+def outbox(tmpdir):
+    return Outbox(root=str(tmpdir.join("outbox")))
+
+
+def test_attachment_survives_removal_of_original(outbox, server, tmpdir):
+    screenshot = tmpdir.join("screenshot.png")
+    screenshot.write_binary(b"png")
+
+    item = outbox.add_comment("task", "wip", "Looks great!",
+                              str(screenshot))
+    screenshot.remove()
+
+    assert item["attachment"].startswith(outbox.root)
+    assert os.path.exists(item["attachment"])
+
+    outbox.flush()
+
+    assert server["comments"] == [("task", "wip", "Looks great!")]
+    assert server["previews"] == [("comment-1", b"png")]
+    assert outbox.pending() == []
+    assert not os.path.exists(item["attachment"])
+
+
+def test_missing_status_is_refused(outbox, server):
+    with pytest.raises(ValueError):
+        outbox.add_comment("task", None, "No status")
+    assert outbox.pending() == []
+
+
+def test_missing_attachment_is_refused(outbox, server, tmpdir):
+    with pytest.raises((IOError, OSError)):
+        outbox.add_comment("task", "wip", "",
+                           str(tmpdir.join("missing.png")))
+    assert outbox.pending() == []
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+pytest.importorskip("Qt")
+
+from Qt import QtGui  # noqa: E402
+
+from qtazu import utils  # noqa: E402
+
+
+def test_downscaled_preview_is_written_to_temp_dir(app, tmpdir):
+    path = str(tmpdir.join("large.png"))
+    image = QtGui.QImage(400, 200, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor(0, 128, 255))
+    image.save(path)
+
+    preview, saved = utils.downscale_image(path, max_size=100)
+
+    assert saved > 0
+    assert os.path.dirname(preview) == utils.get_temp_dir()
+    assert QtGui.QImage(preview).width() == 100
+    os.remove(preview)
+
+
+def test_image_within_limits_is_not_copied(app, tmpdir):
+    path = str(tmpdir.join("small.png"))
+    image = QtGui.QImage(50, 50, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor(0, 128, 255))
+    image.save(path)
+
+    assert utils.downscale_image(path, max_size=100) == (path, 0)
+
+
+def test_decoded_attachment_is_released_on_submit(app, tmpdir):
+    from qtazu.models.taskstatuses import get_shared_model
+    from qtazu.widgets.comment import CommentWidget
+
+    class Outbox(object):
+        def __init__(self):
+            self.comments = []
+
+        def add_comment(self, task, task_status, comment="",
+                        attachment=None):
+            self.comments.append((task, attachment))
+
+    path = str(tmpdir.join("attachment.png"))
+    image = QtGui.QImage(80, 60, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor(0, 128, 255))
+    image.save(path)
+
+    get_shared_model().set_statuses([{"id": "wip", "name": "WIP",
+                                      "color": "#3273dc"}])
+    outbox = Outbox()
+    widget = CommentWidget()
+    widget.set_close_on_submit(False)
+    widget.set_outbox(outbox)
+    widget.set_tasks(["task"])
+    widget.status.setCurrentIndex(0)
+
+    widget.set_attachment(path)
+    assert widget._attachment_pixmap[0] == path
+
+    widget.submit()
+
+    assert outbox.comments == [("task", path)]
+    assert widget._attachment is None
+    assert widget._attachment_pixmap is None
@@ -0,0 +1,146 @@
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from qtazu import adapters, limiter, recording  # noqa: E402
+from qtazu.utils import set_request_timeout  # noqa: E402
+
+
+class StandInServer(adapters.TimeoutHTTPAdapter):
+    """Answers the requests in place of a Zou server"""
+
+    def __init__(self, *args, **kwargs):
+        super(StandInServer, self).__init__(*args, **kwargs)
+        self.received = []
+
+    def send(self, request, **kwargs):
+        timeout = kwargs.get("timeout") or self.timeout
+        self.received.append((request, timeout))
+
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers["Content-Type"] = "application/json"
+        response._content = ('{"url": "%s", "calls": %d}' % (
+            request.path_url, len(self.received))).encode("utf-8")
+        response.url = request.url
+        response.request = request
+        return response
+
+
+@pytest.fixture
+def server():
+    return StandInServer()
+
+
+@pytest.fixture
+def session(server):
+    session = requests.Session()
+    for prefix in adapters.PREFIXES:
+        session.mount(prefix, server)
+    yield session
+    recording.stop(session)
+
+
+@pytest.fixture
+def archive_path(tmpdir):
+    return str(tmpdir.join("session.jsonl.gz"))
+
+
+def upload(session):
+    with open(__file__, "rb") as f:
+        return session.post("http://zou/api/pictures/preview-files/p",
+                            files={"file": ("preview.png", f)})
+
+
+def test_multipart_key_ignores_boundary(session):
+    requests_ = []
+    for _ in range(2):
+        request = requests.Request("POST", "http://zou/api/upload",
+                                   files={"file": ("a.png", b"data")})
+        requests_.append(request.prepare())
+
+    first, second = requests_
+    assert first.body != second.body
+
+    keys = [recording.get_key(r.method, r.url, r.body,
+                              r.headers["Content-Type"]) for r in requests_]
+    assert keys[0] == keys[1]
+
+    # Other bodies still make a difference
+    other = requests.Request("POST", "http://zou/api/upload",
+                             files={"file": ("a.png", b"other")}).prepare()
+    assert recording.get_key(other.method, other.url, other.body,
+                             other.headers["Content-Type"]) != keys[0]
+
+
+def test_replay_serves_recorded_responses(session, server, archive_path):
+    recording.record(archive_path, session=session)
+    recorded = [session.get("http://zou/api/data/projects").json(),
+                upload(session).json()]
+    recording.stop(session)
+
+    recording.replay(archive_path, session=session, latency=0.0)
+    replayed = [session.get("http://other/api/data/projects").json(),
+                upload(session).json()]
+
+    assert replayed == recorded
+    assert len(server.received) == 2
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        session.get("http://zou/api/data/persons")
+    assert len(server.received) == 2
+
+
+def test_set_request_timeout_keeps_replay(session, server, archive_path):
+    recording.record(archive_path, session=session)
+    session.get("http://zou/api/data/projects")
+    recording.stop(session)
+
+    recording.replay(archive_path, session=session, latency=0.0)
+    set_request_timeout(connect=1, read=2, session=session)
+
+    adapter = session.get_adapter("http://")
+    assert isinstance(adapter, adapters.ReplayHTTPAdapter)
+    session.get("http://zou/api/data/projects")
+    assert len(server.received) == 1
+
+    recording.stop(session)
+    assert session.get_adapter("http://") is server
+
+
+def test_record_keeps_limiter_and_timeout(session, server, archive_path):
+    installed = limiter.install(session=session,
+                                limiter=limiter.AdaptiveLimiter())
+    set_request_timeout(connect=1, read=2, session=session)
+    recording.record(archive_path, session=session)
+
+    adapter = session.get_adapter("https://")
+    assert isinstance(adapter, adapters.LimitedHTTPAdapter)
+    assert adapter.limiter is installed
+    assert isinstance(adapter.adapter, adapters.RecordingHTTPAdapter)
+    assert adapter.adapter.adapter is server
+
+    session.get("https://zou/api/data/projects")
+    assert server.received[-1][1] == (1, 2)
+
+    recording.stop(session)
+    assert session.get_adapter("https://").adapter is server
+
+
+def test_set_request_timeout_wraps_plain_adapter():
+    session = requests.Session()
+    limiter.install(session=session, limiter=limiter.AdaptiveLimiter())
+
+    set_request_timeout(connect=3, read=4, session=session)
+    limited = session.get_adapter("https://")
+    assert isinstance(limited, adapters.LimitedHTTPAdapter)
+    assert isinstance(limited.adapter, adapters.TimeoutHTTPAdapter)
+    assert limited.adapter.timeout == (3, 4)
+
+    # Setting it again updates the timeout in place
+    timeout_adapter = limited.adapter
+    set_request_timeout(connect=5, read=6, session=session)
+    assert session.get_adapter("https://") is limited
+    assert limited.adapter is timeout_adapter
+    assert timeout_adapter.timeout == (5, 6)
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+pytest.importorskip("Qt")
+
+from Qt import QtCore, QtGui  # noqa: E402
+
+from qtazu.widgets import screenmarquee  # noqa: E402
+
+
+def test_encode_no_frames():
+    assert screenmarquee.encode_frames([], 100, fmt="png") == []
+    assert screenmarquee.encode_frames([], 100) == []
+
+
+def test_encode_image_sequence(tmpdir):
+    image = QtGui.QImage(4, 4, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor(0, 0, 255))
+
+    paths = screenmarquee.encode_frames([image, image], 100,
+                                        path=str(tmpdir), fmt="png")
+
+    assert [os.path.basename(path) for path in paths] == \
+        ["frame_0001.png", "frame_0002.png"]
+    assert all(os.path.exists(path) for path in paths)
+
+
+def test_recorder_without_frames_emits_empty(app, wait_until):
+    recorder = screenmarquee.FrameRecorder(QtCore.QRect(0, 0, 4, 4),
+                                           frames=1)
+    encoded = []
+    recorder.encoded.connect(encoded.append)
+    recorder.encode(fmt="png")
+    wait_until(lambda: encoded)
+
+    assert encoded == [[]]
@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+pytest.importorskip("gazu")
+
+from qtazu import session  # noqa: E402
+
+
+@pytest.fixture
+def check(monkeypatch):
+    """Stand-in session check that answers once released"""
+    release = threading.Event()
+    result = {"value": (True, {"id": "user"})}
+
+    def _check_session():
+        release.wait(5)
+        return result["value"]
+
+    monkeypatch.setattr(session, "_check_session", _check_session)
+    _check_session.release = release
+    _check_session.result = result
+    return _check_session
+
+
+def test_state_is_unknown_until_checked(check, app, wait_until):
+    state = session.SessionState()
+
+    assert state.is_logged_in() is None
+    assert state.is_connected() is None
+
+    check.release.set()
+    wait_until(lambda: state.is_known())
+
+    assert state.is_logged_in() is True
+    assert state.is_connected() is True
+
+
+def test_check_in_flight_does_not_undo_log_out(check, app, wait_until):
+    state = session.SessionState()
+    state.set_state(True, {"id": "user"})
+    state.invalidate()
+
+    changes = []
+    state.logged_in_changed.connect(changes.append)
+
+    # Starts a check, then logs out while it is in flight
+    assert state.is_logged_in() is True
+    worker = state._worker
+    state.set_state(None, None)
+
+    check.release.set()
+    wait_until(lambda: worker.isFinished() and state._worker is None)
+
+    assert state.is_logged_in() is False
+    assert state.get_user() is None
+    assert changes == [False]
@@ -0,0 +1,109 @@
+import pytest
+
+pytest.importorskip("Qt")
+
+from Qt import QtCore, QtGui  # noqa: E402
+
+from qtazu import cache  # noqa: E402
+from qtazu.widgets import thumbnail  # noqa: E402
+
+URL = "pictures/{0}/preview-files/abc.png"
+
+
+def png():
+    image = QtGui.QImage(8, 8, QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor(255, 0, 0))
+    data = QtCore.QByteArray()
+    buffer_ = QtCore.QBuffer(data)
+    buffer_.open(QtCore.QIODevice.WriteOnly)
+    image.save(buffer_, "PNG")
+    return data
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Serve the thumbnails of the preview file variants in `available`"""
+    requested = []
+    available = set()
+
+    def download_thumbnail(url):
+        requested.append(url)
+        return png() if url in available else None
+
+    monkeypatch.setattr(thumbnail, "download_thumbnail", download_thumbnail)
+    download_thumbnail.requested = requested
+    download_thumbnail.available = available
+
+    cache.images.clear()
+    yield download_thumbnail
+    cache.images.clear()
+
+
+def test_variant_url():
+    reference = URL.format("thumbnails")
+    assert thumbnail.get_variant_url(reference, 50, 50) == \
+        URL.format("thumbnails-square")
+    assert thumbnail.get_variant_url(reference, 150) == \
+        URL.format("thumbnails")
+    assert thumbnail.get_variant_url(reference, 150, ratio=2.0) == \
+        URL.format("previews")
+    assert thumbnail.get_variant_url(reference, 2000) == \
+        URL.format("originals")
+
+    avatar = "pictures/thumbnails/persons/abc.png"
+    assert thumbnail.get_variant_url(avatar, 2000) == avatar
+
+
+def test_fallback_urls():
+    reference = URL.format("thumbnails")
+    assert thumbnail.get_fallback_urls(URL.format("originals"),
+                                       reference) == \
+        [URL.format("previews"), reference]
+    assert thumbnail.get_fallback_urls(URL.format("thumbnails-square"),
+                                       reference) == [reference]
+    assert thumbnail.get_fallback_urls(reference, reference) == []
+
+
+def test_missing_variant_falls_back_to_smaller(server, app, wait_until):
+    server.available.update([URL.format("thumbnails")])
+
+    widget = thumbnail.ThumbnailBase()
+    widget.resize(1000, 600)
+    widget.load(URL.format("thumbnails"))
+    wait_until(lambda: widget._worker is None)
+
+    assert server.requested == [URL.format("previews"),
+                                URL.format("thumbnails")]
+    assert widget._variant == 1
+    assert not widget.pixmap().isNull()
+
+
+def test_missing_larger_variant_keeps_loaded(server, app, wait_until):
+    server.available.update([URL.format("previews")])
+    cache.images[URL.format("thumbnails")] = png()
+
+    widget = thumbnail.ThumbnailBase()
+    widget.resize(140, 100)
+    widget.show()
+    widget.load(URL.format("thumbnails"))
+    assert widget._variant == 1
+    assert server.requested == []
+
+    # Grows to a loadable variant
+    widget.resize(600, 400)
+    wait_until(lambda: server.requested and widget._worker is None)
+    assert widget._variant == 2
+
+    # Grows beyond the largest variant, which is missing
+    widget.resize(1500, 1000)
+    wait_until(lambda: len(server.requested) == 2 and widget._worker is None)
+    assert server.requested == [URL.format("previews"),
+                                URL.format("originals")]
+    assert widget._variant == 2
+    assert not widget.pixmap().isNull()
+
+    # It is not requested again
+    widget.resize(1600, 1000)
+    app.processEvents()
+    assert widget._worker is None
+    assert len(server.requested) == 2
@@ -0,0 +1,162 @@
+import os
+import json
+import stat
+import time
+import base64
+
+import pytest
+
+gazu = pytest.importorskip("gazu")
+
+from qtazu import cache, tokens  # noqa: E402
+
+HOST = "http://zou/api"
+
+
+def make_token(expiry):
+    """Return an unsigned JSON Web Token expiring at *expiry*"""
+
+    def encode(data):
+        data = base64.urlsafe_b64encode(json.dumps(data).encode("utf-8"))
+        return data.decode("ascii").rstrip("=")
+
+    return "{0}.{1}.signature".format(encode({"alg": "HS256"}),
+                                      encode({"exp": expiry, "sub": "ann"}))
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join("qtazu", "tokens.json"))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Keep the host and tokens of gazu unchanged by the tests"""
+    monkeypatch.setattr(gazu.client, "HOST", "http://before/api")
+    monkeypatch.setattr(gazu.client, "tokens", {"access_token": "before"})
+
+
+def test_get_token_expiry():
+    expiry = int(time.time()) + 3600
+
+    assert tokens.get_token_expiry(make_token(expiry)) == expiry
+    assert tokens.get_token_expiry("not a token") is None
+    assert tokens.get_token_expiry("a.!!!.c") is None
+    assert tokens.get_token_expiry(None) is None
+
+
+def test_is_expired():
+    now = time.time()
+
+    assert not tokens.is_expired(make_token(now + 3600))
+    assert tokens.is_expired(make_token(now + 30), margin=60)
+    assert tokens.is_expired(make_token(now - 1))
+    assert tokens.is_expired("")
+    assert not tokens.is_expired("opaque token")
+
+
+@pytest.mark.skipif(os.name == "nt", reason="No POSIX file permissions")
+def test_tokens_are_only_readable_by_the_user(path):
+    tokens.save_tokens(HOST, {"access_token": "a", "refresh_token": "r"},
+                       path=path)
+    tokens.save_tokens("http://other/api", {"access_token": "b"}, path=path)
+
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert not os.path.exists(path + ".tmp")
+    assert tokens.load_tokens(HOST, path=path) == {
+        "access_token": "a",
+        "refresh_token": "r"
+    }
+
+    tokens.clear_tokens(HOST, path=path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert tokens.load_tokens(HOST, path=path) is None
+    assert tokens.load_tokens("http://other/api", path=path) is not None
+
+
+def test_restore_session(client, path):
+    stored = {
+        "access_token": make_token(time.time() + 3600),
+        "refresh_token": make_token(time.time() + 7200)
+    }
+    tokens.save_tokens(HOST, stored, path=path)
+    cache.references["user_tasks"] = [{"id": "task"}]
+
+    assert tokens.restore_session(HOST, path=path)
+    assert gazu.client.get_host() == HOST
+    assert gazu.client.tokens == stored
+    assert "user_tasks" not in cache.references
+
+
+def test_restore_session_refreshes_expired_access_token(monkeypatch, client,
+                                                        path):
+    refreshed = make_token(time.time() + 3600)
+    stored = {
+        "access_token": make_token(time.time() - 1),
+        "refresh_token": make_token(time.time() + 7200)
+    }
+    tokens.save_tokens(HOST, stored, path=path)
+
+    def refresh_access_token():
+        assert gazu.client.tokens == stored
+        result = dict(stored, access_token=refreshed)
+        gazu.client.set_tokens(result)
+        return result
+
+    monkeypatch.setattr(tokens, "refresh_access_token", refresh_access_token)
+
+    assert tokens.restore_session(HOST, path=path)
+    assert gazu.client.tokens["access_token"] == refreshed
+    assert tokens.load_tokens(HOST, path=path)["access_token"] == refreshed
+
+
+def test_failed_restore_keeps_the_previous_session(monkeypatch, client,
+                                                   path):
+    tokens.save_tokens(HOST, {
+        "access_token": make_token(time.time() - 1),
+        "refresh_token": make_token(time.time() + 7200)
+    }, path=path)
+
+    def refresh_access_token():
+        raise IOError("Server unavailable")
+
+    monkeypatch.setattr(tokens, "refresh_access_token", refresh_access_token)
+
+    assert not tokens.restore_session(HOST, path=path)
+    assert gazu.client.get_host() == "http://before/api"
+    assert gazu.client.tokens == {"access_token": "before"}
+
+
+def test_expired_refresh_token_is_not_restored(client, path):
+    tokens.save_tokens(HOST, {
+        "access_token": make_token(time.time() - 1),
+        "refresh_token": make_token(time.time() - 1)
+    }, path=path)
+
+    assert not tokens.restore_session(HOST, path=path)
+    assert not tokens.restore_session("http://unknown/api", path=path)
+    assert gazu.client.get_host() == "http://before/api"
+
+
+def test_refresh_far_in_the_future_is_rescheduled(monkeypatch, app, client):
+    expiry = time.time() + 60 * 24 * 60 * 60
+    monkeypatch.setattr(gazu.client, "tokens",
+                        {"access_token": make_token(expiry)})
+
+    refresher = tokens.TokenRefresher()
+    refreshed = []
+    monkeypatch.setattr(refresher, "refresh", lambda: refreshed.append(1))
+
+    refresher.start()
+    assert refresher._timer.isActive()
+    assert refresher._timer.interval() == tokens.MAX_DELAY * 1000
+
+    refresher._on_timeout()
+    assert refreshed == []
+    assert refresher._timer.isActive()
+
+    monkeypatch.setattr(gazu.client, "tokens",
+                        {"access_token": make_token(time.time() + 60)})
+    refresher._on_timeout()
+    assert refreshed == [1]
+    refresher.stop()
@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+gazu = pytest.importorskip("gazu")
+
+from qtazu import cache, warmup  # noqa: E402
+from qtazu.models import taskstatuses  # noqa: E402
+
+STATUSES = [{"id": "wip", "name": "WIP", "color": "#3273dc"}]
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    cache.references.clear()
+    yield
+    cache.references.clear()
+
+
+@pytest.fixture
+def steps(monkeypatch):
+    """Stand-in steps recording the order they ran in"""
+    ran = []
+    lock = threading.Lock()
+
+    def make_step(name, error=None):
+        def _step():
+            with lock:
+                ran.append(name)
+            if error:
+                raise error
+            return name
+        return _step
+
+    monkeypatch.setitem(warmup.STEPS, "persons", make_step("persons"))
+    monkeypatch.setitem(warmup.STEPS, "avatars", make_step("avatars"))
+    monkeypatch.setitem(warmup.STEPS, "task_types",
+                        make_step("task_types", IOError("Unavailable")))
+    return ran
+
+
+def run(plan, wait_until):
+    results = []
+    warm = warmup.warm_up(plan)
+    warm.finished.connect(results.append)
+    wait_until(lambda: results)
+    return warm, results[0]
+
+
+def test_runs_only_the_plan_and_dependencies_after(steps, wait_until):
+    warm, stats = run(["avatars", "persons"], wait_until)
+
+    assert steps == ["persons", "avatars"]
+    assert sorted(stats) == ["avatars", "persons", "total"]
+    assert stats == warm.stats()
+    assert not warm.is_running()
+    assert warm not in warmup._RUNNING
+
+
+def test_failed_steps_are_left_out_of_the_stats(steps, wait_until):
+    warm, stats = run(["persons", "task_types"], wait_until)
+
+    assert sorted(steps) == ["persons", "task_types"]
+    assert sorted(stats) == ["persons", "total"]
+    assert stats["total"] >= stats["persons"]
+
+
+def test_invalidated_statuses_are_fetched_again(monkeypatch, app,
+                                                wait_until):
+    calls = []
+
+    def all_task_statuses():
+        calls.append(1)
+        return [dict(STATUSES[0], name="WIP %d" % len(calls))]
+
+    monkeypatch.setattr(gazu.task, "all_task_statuses", all_task_statuses)
+
+    model = taskstatuses.TaskStatusModel()
+    model.fetch()
+    wait_until(model.is_loaded)
+    assert model.data(model.index(0), 0) == "WIP 1"
+
+    model.invalidate()
+    assert "task_statuses" not in cache.references
+
+    model.fetch()
+    wait_until(model.is_loaded)
+    assert model.data(model.index(0), 0) == "WIP 2"
+    assert len(calls) == 2
+
+
+def test_clear_session_data_drops_the_warm_references():
+    cache.references["user_tasks"] = [{"id": "task"}]
+    cache.entities[("Task", "task")] = {"id": "task"}
+
+    cache.clear_session_data()
+
+    assert "user_tasks" not in cache.references
+    assert ("Task", "task") not in cache.entities
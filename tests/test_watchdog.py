@@ -0,0 +1,64 @@
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("Qt")
+
+from qtazu import singleflight, watchdog  # noqa: E402
+
+
+def process_events(app, seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        app.processEvents()
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def dog(app):
+    dog = watchdog.StallWatchdog(threshold=100, interval=20)
+    dog.start()
+    process_events(app, 0.1)
+    yield dog
+    dog.stop()
+
+
+def test_qtazu_function():
+    frame = singleflight.do("frame", sys._getframe)
+    assert watchdog.get_qtazu_function(frame) == "qtazu.singleflight.do"
+    assert watchdog.get_qtazu_function(sys._getframe()) is None
+
+
+def test_blocked_gui_thread_is_reported(dog, app):
+    time.sleep(0.3)
+    process_events(app, 0.1)
+
+    stalls = dog.stalls()
+    assert len(stalls) == 1
+    assert stalls[0]["duration"] >= 200
+    assert stalls[0]["busy_wait"] is False
+
+
+def test_busy_wait_is_reported(dog, app):
+
+    def wait():
+        with watchdog.busy_wait():
+            process_events(app, 0.3)
+
+    singleflight.do("busy", wait)
+    process_events(app, 0.1)
+
+    stalls = dog.stalls()
+    assert len(stalls) == 1
+    assert stalls[0]["busy_wait"] is True
+    assert stalls[0]["function"] == "qtazu.singleflight.do"
+    assert stalls[0]["duration"] >= 150
+
+
+def test_short_busy_wait_is_ignored(dog, app):
+    with watchdog.busy_wait():
+        process_events(app, 0.05)
+    process_events(app, 0.1)
+
+    assert dog.stalls() == []